@@ -58,6 +58,15 @@ class SliceletMainFrame(qt.QDialog):
 # GelDosimetryAnalysisSlicelet
 #
 class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
+  # Time to wait for further alignment changes (e.g. while holding a spinbox arrow) before updating the chart
+  alignmentPreviewDelayMs = 30
+  # Curves with more points than this (about twice the chart width in pixels) are decimated for display
+  chartMaximumNumberOfPoints = 1600
+  # Time (s) after which a running registration is cancelled
+  registrationTimeoutSec = 600
+  # Largest averaging radius (mm) shown in the radius sensitivity chart
+  radiusSensitivityMaximumRadiusMm = 20
+
   def __init__(self, parent, developerMode=False, widgetClass=None):
     VTKObservationMixin.__init__(self)
     # Set up main frame
@@ -119,6 +128,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.maskSegmentationNode = None
     self.maskSegmentID = None
     self.gammaVolumeNode = None
+    self.step2_1_registrationFuture = None # Automatic registration running in the background
+    self.step4_1_gammaFuture = None # Native gamma computation running in the background
+    self.gammaProgressDialog = None
+    self.step2_fiducialObserverTags = [] # [fiducials node, observer tag] pairs for updating the landmark registrations live
+    self.step4_1_passRateObserverTags = [] # [dose volume node, observer tag] pairs for updating the gamma pass rate live
 
     # Get markups logic
     self.markupsLogic = slicer.modules.markups.logic()
@@ -198,15 +212,20 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step2_1_1_cbctFiducialSelectionCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep2_1_1_CbctFiducialCollectionSelected)
     self.step2_1_2_planCtFiducialSelectionCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep2_1_2_PlanCtFiducialCollectionSelected)
     self.step2_1_3_registerPlanCtToCbctButton.disconnect('clicked()', self.onPlanCtToCbctLandmarkRegistration)
+    for fiducialsNode, observerTag in self.step2_fiducialObserverTags:
+      fiducialsNode.RemoveObserver(observerTag)
+    self.step2_fiducialObserverTags = []
     self.step2_2_measuredDoseToCbctRegistrationCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep2_2_MeasuredDoseToCbctRegistrationSelected)
     self.step2_2_1_cbctFiducialSelectionCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep2_2_1_CbctFiducialCollectionSelected)
     self.step2_2_2_measuredFiducialSelectionCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep2_2_2_MeasuredFiducialCollectionSelected)
     self.step2_2_3_registerMeasuredToCbctButton.disconnect('clicked()', self.onMeasuredToCbctRegistration)
     self.step3_1_pddLoadDataButton.disconnect('clicked()', self.onLoadPddDataRead)
+    self.step3_1_showRadiusSensitivityButton.disconnect('clicked()', self.onShowRadiusSensitivity)
     self.step3_1_alignCalibrationCurvesButton.disconnect('clicked()', self.onAlignCalibrationCurves)
     self.step3_1_xTranslationSpinBox.disconnect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
     self.step3_1_yScaleSpinBox.disconnect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
     self.step3_1_yTranslationSpinBox.disconnect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
+    self.step3_1_alignmentPreviewTimer.disconnect('timeout()', self.updateAlignmentPreview)
     self.step3_1_computeDoseFromPddButton.disconnect('clicked()', self.onComputeDoseFromPdd)
     self.step3_1_calibrationRoutineCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStep3_1_CalibrationRoutineSelected)
     self.step3_1_showOpticalAttenuationVsDoseCurveButton.disconnect('clicked()', self.onShowOpticalAttenuationVsDoseCurve)
@@ -219,6 +238,14 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step4_maskSegmentationSelector.disconnect('currentSegmentChanged(QString)', self.onStep4_MaskSegmentSelectionChanged)
     self.step4_1_referenceDoseUseMaximumDoseRadioButton.disconnect('toggled(bool)', self.onUseMaximumDoseRadioButtonToggled)
     self.step4_1_computeGammaButton.disconnect('clicked()', self.onGammaDoseComparison)
+    self.step4_1_gammaEngineComboBox.disconnect('currentIndexChanged(int)', self.onGammaEngineChanged)
+    self.step4_1_computeGammaSweepButton.disconnect('clicked()', self.onGammaSweep)
+    self.step4_1_computePassRateButton.disconnect('clicked()', self.onGammaPassRate)
+    self.step4_1_livePassRateCheckBox.disconnect('toggled(bool)', self.onLivePassRateToggled)
+    self.step4_1_passRateUpdateTimer.disconnect('timeout()', self.onGammaPassRate)
+    self.removePassRateObservers()
+    if self.step4_1_gammaFuture is not None and not self.step4_1_gammaFuture.done():
+      self.step4_1_gammaFuture.cancel()
     self.step4_1_showGammaReportButton.disconnect('clicked()', self.onShowGammaReport)
     self.stepT1_lineProfileCollapsibleButton.disconnect('contentsCollapsed(bool)', self.onStepT1_LineProfileSelected)
     self.stepT1_lineProfileLegendVisibilityCheckbox.disconnect('toggled(bool)', self.onLegendVisibilityToggled)
@@ -515,6 +542,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step2_1_3_planCtToCbctFiducialRegistrationErrorLabel = qt.QLabel('[Not yet performed]')
     self.step2_1_3_planCtToCbctRegistrationCollapsibleButtonLayout.addRow('Fiducial registration error: ', self.step2_1_3_planCtToCbctFiducialRegistrationErrorLabel)
 
+    # Live update checkbox
+    self.step2_1_3_liveUpdateCheckBox = qt.QCheckBox()
+    self.step2_1_3_liveUpdateCheckBox.toolTip = "Update the registration and its error whenever the fiducials are placed or moved"
+    self.step2_1_3_planCtToCbctRegistrationCollapsibleButtonLayout.addRow('Update while placing fiducials: ', self.step2_1_3_liveUpdateCheckBox)
+
     # Add empty row
     self.step2_1_3_planCtToCbctRegistrationCollapsibleButtonLayout.addRow(' ', None)
 
@@ -615,6 +647,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step2_2_3_measuredToCbctFiducialRegistrationErrorLabel = qt.QLabel('[Not yet performed]')
     self.step2_2_3_measuredToCbctRegistrationCollapsibleButtonLayout.addRow('Fiducial registration error: ', self.step2_2_3_measuredToCbctFiducialRegistrationErrorLabel)
 
+    # Live update checkbox
+    self.step2_2_3_liveUpdateCheckBox = qt.QCheckBox()
+    self.step2_2_3_liveUpdateCheckBox.toolTip = "Update the registration and its error whenever the fiducials are placed or moved"
+    self.step2_2_3_measuredToCbctRegistrationCollapsibleButtonLayout.addRow('Update while placing fiducials: ', self.step2_2_3_liveUpdateCheckBox)
+
     # Add empty row
     self.step2_2_3_measuredToCbctRegistrationCollapsibleButtonLayout.addRow(' ', None)
 
@@ -647,6 +684,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step2_1_1_cbctFiducialSelectionCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep2_1_1_CbctFiducialCollectionSelected)
     self.step2_1_2_planCtFiducialSelectionCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep2_1_2_PlanCtFiducialCollectionSelected)
     self.step2_1_3_registerPlanCtToCbctButton.connect('clicked()', self.onPlanCtToCbctLandmarkRegistration)
+    for fiducialsNode, fiducialsModifiedCallback in [
+        (self.cbctMarkupsFiducialNode_WithPlan, self.onPlanCtToCbctFiducialsModified), (self.planCtMarkupsFiducialNode, self.onPlanCtToCbctFiducialsModified),
+        (self.cbctMarkupsFiducialNode_WithMeasured, self.onMeasuredToCbctFiducialsModified), (self.measuredMarkupsFiducialNode, self.onMeasuredToCbctFiducialsModified) ]:
+      for event in [slicer.vtkMRMLMarkupsNode.PointAddedEvent, slicer.vtkMRMLMarkupsNode.PointModifiedEvent, slicer.vtkMRMLMarkupsNode.PointRemovedEvent]:
+        self.step2_fiducialObserverTags.append([fiducialsNode, fiducialsNode.AddObserver(event, fiducialsModifiedCallback)])
     self.step2_2_measuredDoseToCbctRegistrationCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep2_2_MeasuredDoseToCbctRegistrationSelected)
     self.step2_2_1_cbctFiducialSelectionCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep2_2_1_CbctFiducialCollectionSelected)
     self.step2_2_2_measuredFiducialSelectionCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep2_2_2_MeasuredFiducialCollectionSelected)
@@ -695,6 +737,26 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step3_1_radiusMmFromCentrePixelLineEdit.toolTip = "Radius of the cylinder that is extracted around central axis to get optical attenuation values per depth"
     self.step3_1_calibrationRoutineLayout.addRow('Averaging radius (mm): ', self.step3_1_radiusMmFromCentrePixelLineEdit)
 
+    # Region of the calibration volume to parse
+    self.step3_1_calibrationRoiSelector = slicer.qMRMLNodeComboBox()
+    self.step3_1_calibrationRoiSelector.nodeTypes = ["vtkMRMLMarkupsROINode", "vtkMRMLAnnotationROINode"]
+    self.step3_1_calibrationRoiSelector.noneEnabled = True
+    self.step3_1_calibrationRoiSelector.addEnabled = False
+    self.step3_1_calibrationRoiSelector.removeEnabled = False
+    self.step3_1_calibrationRoiSelector.setMRMLScene( slicer.mrmlScene )
+    self.step3_1_calibrationRoiSelector.setToolTip( "Only parse the part of the calibration volume inside the ROI (e.g. the vial without its empty ends). The averaging cylinder is centered in the ROI" )
+    self.step3_1_calibrationRoutineLayout.addRow('Calibration ROI: ', self.step3_1_calibrationRoiSelector)
+
+    # Vial axis tracking
+    self.step3_1_trackCentralCylinderAxisCheckBox = qt.QCheckBox()
+    self.step3_1_trackCentralCylinderAxisCheckBox.toolTip = "Center the averaging cylinder on the centroid of the vial on each slice instead of the center of the volume (for tilted or off-center vials)"
+    self.step3_1_calibrationRoutineLayout.addRow('Track vial axis: ', self.step3_1_trackCentralCylinderAxisCheckBox)
+
+    # Radius sensitivity
+    self.step3_1_showRadiusSensitivityButton = qt.QPushButton("Show averaging radius sensitivity")
+    self.step3_1_showRadiusSensitivityButton.toolTip = "Parse calibration volume for all averaging radii at once and plot noise and deviation of the calibration data against the radius"
+    self.step3_1_calibrationRoutineLayout.addRow(self.step3_1_showRadiusSensitivityButton)
+
     # Align Pdd data and CALIBRATION data based on region of interest selected
     self.step3_1_alignCalibrationCurvesButton = qt.QPushButton("Plot reference and gel PDD data")
     self.step3_1_alignCalibrationCurvesButton.toolTip = "Align PDD data optical attenuation values with experimental optical attenuation values (coming from calibration gel volume)"
@@ -734,6 +796,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step3_1_adjustAlignmentControlsLayout.addWidget(self.step3_1_yTranslationSpinBox)
     self.step3_1_calibrationRoutineLayout.addRow(self.step3_1_adjustAlignmentControlsLayout)
 
+    # Timer coalescing rapid alignment changes into one chart update
+    self.step3_1_alignmentPreviewTimer = qt.QTimer()
+    self.step3_1_alignmentPreviewTimer.setSingleShot(True)
+    self.step3_1_alignmentPreviewTimer.setInterval(self.alignmentPreviewDelayMs)
+
     # Add empty row
     self.step3_1_calibrationRoutineLayout.addRow(' ', None)
 
@@ -856,10 +923,12 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
 
     # Connections
     self.step3_1_pddLoadDataButton.connect('clicked()', self.onLoadPddDataRead)
+    self.step3_1_showRadiusSensitivityButton.connect('clicked()', self.onShowRadiusSensitivity)
     self.step3_1_alignCalibrationCurvesButton.connect('clicked()', self.onAlignCalibrationCurves)
     self.step3_1_xTranslationSpinBox.connect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
     self.step3_1_yScaleSpinBox.connect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
     self.step3_1_yTranslationSpinBox.connect('valueChanged(double)', self.onAdjustAlignmentValueChanged)
+    self.step3_1_alignmentPreviewTimer.connect('timeout()', self.updateAlignmentPreview)
     self.step3_1_computeDoseFromPddButton.connect('clicked()', self.onComputeDoseFromPdd)
     self.step3_1_calibrationRoutineCollapsibleButton.connect('contentsCollapsed(bool)', self.onStep3_1_CalibrationRoutineSelected)
     self.step3_1_showOpticalAttenuationVsDoseCurveButton.connect('clicked()', self.onShowOpticalAttenuationVsDoseCurve)
@@ -979,6 +1048,18 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step4_1_maximumGammaSpinBox.setValue(2.0)
     self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow('Upper bound for gamma calculation: ', self.step4_1_maximumGammaSpinBox)
 
+    # Gamma engine. The native engine is the default, as it runs in the background and can be canceled,
+    # while the SlicerRT engine blocks the application until it finishes
+    self.step4_1_gammaEngineComboBox = qt.QComboBox()
+    self.step4_1_gammaEngineComboBox.addItem('Native (multithreaded)', 'native')
+    if hasattr(slicer.modules, 'dosecomparison'):
+      self.step4_1_gammaEngineComboBox.addItem('SlicerRT Dose comparison (cannot be canceled)', 'slicerrt')
+    self.step4_1_gammaEngineComboBox.setToolTip('The native engine runs in the background and can be canceled, but it does not support geometric gamma calculation. '
+      'The SlicerRT engine blocks the application until the computation finishes, and it cannot be canceled')
+    self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow('Gamma engine: ', self.step4_1_gammaEngineComboBox)
+    # Geometric gamma calculation is only supported by the SlicerRT engine, see onGammaEngineChanged
+    self.step4_1_useGeometricGammaCalculation.setEnabled(False)
+
     # Gamma volume selector
     self.step4_1_gammaVolumeSelectorLayout = qt.QHBoxLayout(self.step4_1_gammaDoseComparisonCollapsibleButton)
     self.step4_1_gammaVolumeSelector = slicer.qMRMLNodeComboBox()
@@ -999,6 +1080,30 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step4_1_computeGammaButton = qt.QPushButton('Calculate gamma volume')
     self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow(self.step4_1_computeGammaButton)
 
+    # Criteria sweep
+    self.step4_1_gammaSweepLayout = qt.QHBoxLayout()
+    self.step4_1_gammaSweepCriteriaLineEdit = qt.QLineEdit('3/3, 2/2, 3/2, 1/1')
+    self.step4_1_gammaSweepCriteriaLineEdit.setToolTip('Comma separated list of dose difference (%) / distance-to-agreement (mm) criteria')
+    self.step4_1_computeGammaSweepButton = qt.QPushButton('Calculate pass rates')
+    self.step4_1_computeGammaSweepButton.setToolTip('Calculate the gamma pass rate for each criterion in one pass using the native gamma engine. Reference dose, analysis threshold and upper bound are taken from above')
+    self.step4_1_gammaSweepLayout.addWidget(self.step4_1_gammaSweepCriteriaLineEdit)
+    self.step4_1_gammaSweepLayout.addWidget(self.step4_1_computeGammaSweepButton)
+    self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow('Criteria sweep (%/mm): ', self.step4_1_gammaSweepLayout)
+
+    # Pass rate only (no gamma volume), optionally updated whenever the registration changes
+    self.step4_1_passRateLayout = qt.QHBoxLayout()
+    self.step4_1_computePassRateButton = qt.QPushButton('Calculate pass rate only')
+    self.step4_1_computePassRateButton.setToolTip('Calculate the gamma pass rate and histogram using the native gamma engine without creating a gamma volume')
+    self.step4_1_livePassRateCheckBox = qt.QCheckBox('Update when the registration changes')
+    self.step4_1_livePassRateCheckBox.setToolTip('Recalculate the pass rate whenever the transform of the plan dose or the calibrated volume is modified')
+    self.step4_1_passRateLayout.addWidget(self.step4_1_computePassRateButton)
+    self.step4_1_passRateLayout.addWidget(self.step4_1_livePassRateCheckBox)
+    self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow(self.step4_1_passRateLayout)
+    # Transform modified events are compressed so that the pass rate is not recalculated for every slider step
+    self.step4_1_passRateUpdateTimer = qt.QTimer()
+    self.step4_1_passRateUpdateTimer.setSingleShot(True)
+    self.step4_1_passRateUpdateTimer.setInterval(200)
+
     self.step4_1_gammaStatusLabel = qt.QLabel()
     self.step4_1_gammaDoseComparisonCollapsibleButtonLayout.addRow(self.step4_1_gammaStatusLabel)
 
@@ -1031,6 +1136,11 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.step4_maskSegmentationSelector.connect('currentSegmentChanged(QString)', self.onStep4_MaskSegmentSelectionChanged)
     self.step4_1_referenceDoseUseMaximumDoseRadioButton.connect('toggled(bool)', self.onUseMaximumDoseRadioButtonToggled)
     self.step4_1_computeGammaButton.connect('clicked()', self.onGammaDoseComparison)
+    self.step4_1_gammaEngineComboBox.connect('currentIndexChanged(int)', self.onGammaEngineChanged)
+    self.step4_1_computeGammaSweepButton.connect('clicked()', self.onGammaSweep)
+    self.step4_1_computePassRateButton.connect('clicked()', self.onGammaPassRate)
+    self.step4_1_livePassRateCheckBox.connect('toggled(bool)', self.onLivePassRateToggled)
+    self.step4_1_passRateUpdateTimer.connect('timeout()', self.onGammaPassRate)
     self.step4_1_showGammaReportButton.connect('clicked()', self.onShowGammaReport)
 
   #------------------------------------------------------------------------------
@@ -1366,11 +1476,29 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
 
   #------------------------------------------------------------------------------
   def onPlanCtToCbctAutomaticRegistration(self):
-    # Start registration
+    # Pressing the button while the registration is running cancels it
+    if self.step2_1_registrationFuture is not None and not self.step2_1_registrationFuture.done():
+      self.step2_1_registrationFuture.cancel()
+      return self.step2_1_registrationFuture
+
+    # Start registration. The results are applied when it finishes, the GUI remains responsive in the meantime
+    self.step2_1_registerPlanCtToCbctButton.text = "Cancel registration"
+    self.step2_1_registrationFuture = self.logic.registerPlanCtToCbctAutomaticAsync(self.planCtVolumeNode.GetID(), self.cbctVolumeNode.GetID(),
+      self.onPlanCtToCbctAutomaticRegistrationFinished, self.registrationTimeoutSec)
+    return self.step2_1_registrationFuture
+
+  #------------------------------------------------------------------------------
+  def onPlanCtToCbctAutomaticRegistrationFinished(self, future):
+    self.step2_1_registerPlanCtToCbctButton.text = "Perform registration"
+    if future.status != 'completed':
+      if future.status != 'cancelled':
+        slicer.util.errorDisplay('Registration of planning CT to CBCT failed ({0})'.format(future.status))
+      return None
+
     cbctVolumeID = self.cbctVolumeNode.GetID()
     planCtVolumeID = self.planCtVolumeNode.GetID()
     planDoseVolumeID = self.planDoseVolumeNode.GetID()
-    cbctToPlanTransformNode = self.logic.registerPlanCtToCbctAutomatic(planCtVolumeID, cbctVolumeID)
+    cbctToPlanTransformNode = future.result()
 
     # Apply transform to plan CT and plan dose
     self.planCtVolumeNode.SetAndObserveTransformNodeID(cbctToPlanTransformNode.GetID())
@@ -1406,10 +1534,10 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
 
   #------------------------------------------------------------------------------
   def onPlanCtToCbctLandmarkRegistration(self):
-    cbctToPlanTransformNode, errorRms = self.logic.registerPlanCtToCbctLandmark(self.planCtMarkupsFiducialNode.GetID(), self.cbctMarkupsFiducialNode_WithPlan.GetID())
-
-    # Show registration error on GUI
-    self.step2_1_3_planCtToCbctFiducialRegistrationErrorLabel.setText(str(errorRms) + ' mm')
+    cbctToPlanTransformNode = self.updatePlanCtToCbctLandmarkRegistration()
+    if cbctToPlanTransformNode is None:
+      slicer.util.errorDisplay('Fiducial registration needs the same number (at least 3) of planning CT and CBCT fiducials!')
+      return None
 
     # Apply transform to plan CT and plan dose
     self.planCtVolumeNode.SetAndObserveTransformNodeID(cbctToPlanTransformNode.GetID())
@@ -1432,11 +1560,47 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     return cbctToPlanTransformNode
 
   #------------------------------------------------------------------------------
-  def onMeasuredToCbctRegistration(self):
-    errorRms = self.logic.registerMeasuredToCbct(self.measuredMarkupsFiducialNode.GetID(), self.cbctMarkupsFiducialNode_WithMeasured.GetID())
+  def updatePlanCtToCbctLandmarkRegistration(self):
+    # Compute registration from the current fiducials and show its error. Returns the transform node, or None on failure
+    registrationResult = self.logic.registerLandmarks(self.planCtMarkupsFiducialNode.GetID(), self.cbctMarkupsFiducialNode_WithPlan.GetID(), self.logic.cbctToPlanTransformName)
+    if registrationResult is None:
+      return None
+    cbctToPlanTransformNode, errorRms, residuals = registrationResult
+    self.step2_1_3_planCtToCbctFiducialRegistrationErrorLabel.setText(self.formatFiducialRegistrationError(errorRms, residuals))
+    return cbctToPlanTransformNode
+
+  #------------------------------------------------------------------------------
+  def onPlanCtToCbctFiducialsModified(self, caller=None, event=None):
+    if self.step2_1_3_liveUpdateCheckBox.checked and self.planCtMarkupsFiducialNode.GetNumberOfFiducials() >= 3 \
+        and self.planCtMarkupsFiducialNode.GetNumberOfFiducials() == self.cbctMarkupsFiducialNode_WithPlan.GetNumberOfFiducials():
+      self.updatePlanCtToCbctLandmarkRegistration()
 
-    # Show registration error on GUI
-    self.step2_2_3_measuredToCbctFiducialRegistrationErrorLabel.setText(str(errorRms) + ' mm')
+  #------------------------------------------------------------------------------
+  def updateMeasuredToCbctLandmarkRegistration(self):
+    # Compute registration from the current fiducials and show its error. Returns the transform node, or None on failure
+    registrationResult = self.logic.registerLandmarks(self.measuredMarkupsFiducialNode.GetID(), self.cbctMarkupsFiducialNode_WithMeasured.GetID(), self.logic.cbctToMeasuredTransformName)
+    if registrationResult is None:
+      return None
+    cbctToMeasuredTransformNode, errorRms, residuals = registrationResult
+    self.step2_2_3_measuredToCbctFiducialRegistrationErrorLabel.setText(self.formatFiducialRegistrationError(errorRms, residuals))
+    return cbctToMeasuredTransformNode
+
+  #------------------------------------------------------------------------------
+  def onMeasuredToCbctFiducialsModified(self, caller=None, event=None):
+    if self.step2_2_3_liveUpdateCheckBox.checked and self.measuredMarkupsFiducialNode.GetNumberOfFiducials() >= 3 \
+        and self.measuredMarkupsFiducialNode.GetNumberOfFiducials() == self.cbctMarkupsFiducialNode_WithMeasured.GetNumberOfFiducials():
+      self.updateMeasuredToCbctLandmarkRegistration()
+
+  #------------------------------------------------------------------------------
+  def formatFiducialRegistrationError(self, errorRms, residuals):
+    # RMS error and the residual of each fiducial pair (the largest one shows which fiducial may be misplaced)
+    return '{0:.2f} mm (per fiducial: {1})'.format(errorRms, ', '.join(['{0:.2f}'.format(residual) for residual in residuals]))
+
+  #------------------------------------------------------------------------------
+  def onMeasuredToCbctRegistration(self):
+    if self.updateMeasuredToCbctLandmarkRegistration() is None:
+      slicer.util.errorDisplay('Fiducial registration needs the same number (at least 3) of gel volume and CBCT fiducials!')
+      return None
 
     # Apply transform to MEASURED volume
     cbctToMeasuredTransformNode = slicer.util.getNode(self.logic.cbctToMeasuredTransformName)
@@ -1486,11 +1650,59 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
       slicer.util.errorDisplay('Invalid averaging radius!')
       return False
 
+    self.logic.trackCentralCylinderAxis = self.step3_1_trackCentralCylinderAxisCheckBox.checked
+    self.logic.calibrationVolumeParsingRoiNodeID = self.step3_1_calibrationRoiSelector.currentNodeID
+
+    # Use the tables of the radius sensitivity analysis if available so that the volume does not need to be parsed again
+    if self.logic.selectCentralCylinderRadius(self.calibrationVolumeNode.GetID(), radiusOfCentreCircleFloat):
+      return True
+
     success = self.logic.getMeanOpticalAttenuationOfCentralCylinder(self.calibrationVolumeNode.GetID(), radiusOfCentreCircleFloat)
     if success == False:
       slicer.util.errorDisplay('Calibration volume parsing failed!')
     return success
 
+  #------------------------------------------------------------------------------
+  def onShowRadiusSensitivity(self):
+    if self.calibrationVolumeNode is None:
+      slicer.util.errorDisplay('Calibration volume not selected!')
+      return False
+
+    # Parse calibration volume for all radii, then the averaging radius can be changed without parsing it again
+    self.logic.calibrationVolumeParsingRoiNodeID = self.step3_1_calibrationRoiSelector.currentNodeID
+    if not self.logic.computeMeanOpticalAttenuationOfCentralCylinderForRadii(self.calibrationVolumeNode.GetID(), self.radiusSensitivityMaximumRadiusMm):
+      slicer.util.errorDisplay('Calibration volume parsing failed!')
+      return False
+    radiusSensitivityArray = self.logic.getCentralCylinderRadiusSensitivity()
+
+    self.radiusSensitivityChartView = vtk.vtkContextView()
+    self.radiusSensitivityChartView.GetRenderer().SetBackground(1,1,1)
+    self.radiusSensitivityChart = vtk.vtkChartXY()
+    self.radiusSensitivityChartView.GetScene().AddItem(self.radiusSensitivityChart)
+
+    self.radiusSensitivityDataTable = self.createTableFromArray(["Averaging radius (mm)",
+      "Mean std.dev. of optical attenuation (cm^-1)", "RMS difference from largest radius (cm^-1)"], radiusSensitivityArray)
+    self.radiusSensitivityStdDevLine = self.radiusSensitivityChart.AddPlot(vtk.vtkChart.LINE)
+    self.radiusSensitivityStdDevLine.SetInputData(self.radiusSensitivityDataTable, 0, 1)
+    self.radiusSensitivityStdDevLine.SetColor(255, 0, 0, 255)
+    self.radiusSensitivityStdDevLine.SetWidth(2.0)
+    self.radiusSensitivityDifferenceLine = self.radiusSensitivityChart.AddPlot(vtk.vtkChart.LINE)
+    self.radiusSensitivityDifferenceLine.SetInputData(self.radiusSensitivityDataTable, 0, 2)
+    self.radiusSensitivityDifferenceLine.SetColor(0, 0, 255, 255)
+    self.radiusSensitivityDifferenceLine.SetWidth(2.0)
+
+    # Show chart
+    self.radiusSensitivityChart.GetAxis(1).SetTitle('Averaging radius (mm)')
+    self.radiusSensitivityChart.GetAxis(0).SetTitle('Optical attenuation (cm^-1)')
+    self.radiusSensitivityChart.SetShowLegend(True)
+    self.radiusSensitivityChart.SetTitle('Averaging radius sensitivity')
+    self.radiusSensitivityChartView.GetInteractor().Initialize()
+    self.radiusSensitivityChartRenderWindow = self.radiusSensitivityChartView.GetRenderWindow()
+    self.radiusSensitivityChartRenderWindow.SetSize(800,550)
+    self.radiusSensitivityChartRenderWindow.SetWindowName('Averaging radius sensitivity chart')
+    self.radiusSensitivityChartRenderWindow.Start()
+    return True
+
   #------------------------------------------------------------------------------
   def createCalibrationCurvesWindow(self):
     # Set up window to be used for displaying data
@@ -1502,21 +1714,8 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
   #------------------------------------------------------------------------------
   def showCalibrationCurves(self):
     # Create CALIBRATION mean optical attenuation plot
-    self.calibrationCurveDataTable = vtk.vtkTable()
-    calibrationNumberOfRows = self.logic.calibrationDataArray.shape[0]
-
-    calibrationDepthArray = vtk.vtkDoubleArray()
-    calibrationDepthArray.SetName("Depth (cm)")
-    self.calibrationCurveDataTable.AddColumn(calibrationDepthArray)
-    calibrationMeanOpticalAttenuationArray = vtk.vtkDoubleArray()
-    calibrationMeanOpticalAttenuationArray.SetName("Calibration data (mean optical attenuation, cm^-1)")
-    self.calibrationCurveDataTable.AddColumn(calibrationMeanOpticalAttenuationArray)
-
-    self.calibrationCurveDataTable.SetNumberOfRows(calibrationNumberOfRows)
-    for rowIndex in range(calibrationNumberOfRows):
-      self.calibrationCurveDataTable.SetValue(rowIndex, 0, self.logic.calibrationDataArray[rowIndex, 0])
-      self.calibrationCurveDataTable.SetValue(rowIndex, 1, self.logic.calibrationDataArray[rowIndex, 1])
-      # self.calibrationCurveDataTable.SetValue(rowIndex, 2, self.logic.calibrationDataArray[rowIndex, 2])
+    self.calibrationCurveDataTable = self.createTableFromArray(["Depth (cm)", "Calibration data (mean optical attenuation, cm^-1)"],
+      self.logic.calibrationDataArray[:,0:2], self.chartMaximumNumberOfPoints)
 
     if hasattr(self, 'calibrationMeanOpticalAttenuationLine'):
       self.calibrationCurveChart.RemovePlotInstance(self.calibrationMeanOpticalAttenuationLine)
@@ -1526,19 +1725,8 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.calibrationMeanOpticalAttenuationLine.SetWidth(2.0)
 
     # Create Pdd plot
-    self.pddDataTable = vtk.vtkTable()
-    pddNumberOfRows = self.logic.pddDataArray.shape[0]
-    pddDepthArray = vtk.vtkDoubleArray()
-    pddDepthArray.SetName("Depth (cm)")
-    self.pddDataTable.AddColumn(pddDepthArray)
-    pddValueArray = vtk.vtkDoubleArray()
-    pddValueArray.SetName("PDD (percent depth dose)")
-    self.pddDataTable.AddColumn(pddValueArray)
-
-    self.pddDataTable.SetNumberOfRows(pddNumberOfRows)
-    for pddDepthCounter in range(pddNumberOfRows):
-      self.pddDataTable.SetValue(pddDepthCounter, 0, self.logic.pddDataArray[pddDepthCounter, 0])
-      self.pddDataTable.SetValue(pddDepthCounter, 1, self.logic.pddDataArray[pddDepthCounter, 1])
+    self.pddDataTable = self.createTableFromArray(["Depth (cm)", "PDD (percent depth dose)"],
+      self.logic.pddDataArray, self.chartMaximumNumberOfPoints)
 
     if hasattr(self, 'pddLine'):
       self.calibrationCurveChart.RemovePlotInstance(self.pddLine)
@@ -1548,19 +1736,8 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.pddLine.SetWidth(2.0)
 
     # Add aligned curve to the graph
-    self.calibrationDataAlignedTable = vtk.vtkTable()
-    calibrationDataAlignedNumberOfRows = self.logic.calibrationDataAlignedToDisplayArray.shape[0]
-    calibrationDataAlignedDepthArray = vtk.vtkDoubleArray()
-    calibrationDataAlignedDepthArray.SetName("Depth (cm)")
-    self.calibrationDataAlignedTable.AddColumn(calibrationDataAlignedDepthArray)
-    calibrationDataAlignedValueArray = vtk.vtkDoubleArray()
-    calibrationDataAlignedValueArray.SetName("Aligned calibration data")
-    self.calibrationDataAlignedTable.AddColumn(calibrationDataAlignedValueArray)
-
-    self.calibrationDataAlignedTable.SetNumberOfRows(calibrationDataAlignedNumberOfRows)
-    for calibrationDataAlignedDepthCounter in range(calibrationDataAlignedNumberOfRows):
-      self.calibrationDataAlignedTable.SetValue(calibrationDataAlignedDepthCounter, 0, self.logic.calibrationDataAlignedToDisplayArray[calibrationDataAlignedDepthCounter, 0])
-      self.calibrationDataAlignedTable.SetValue(calibrationDataAlignedDepthCounter, 1, self.logic.calibrationDataAlignedToDisplayArray[calibrationDataAlignedDepthCounter, 1])
+    self.calibrationDataAlignedTable = self.createTableFromArray(["Depth (cm)", "Aligned calibration data"],
+      self.logic.calibrationDataAlignedToDisplayArray, self.chartMaximumNumberOfPoints)
 
     if hasattr(self, 'calibrationDataAlignedLine'):
       self.calibrationCurveChart.RemovePlotInstance(self.calibrationDataAlignedLine)
@@ -1614,8 +1791,72 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
 
   #------------------------------------------------------------------------------
   def onAdjustAlignmentValueChanged(self, value):
-    self.logic.createAlignedCalibrationArray(self.step3_1_xTranslationSpinBox.value, self.step3_1_yScaleSpinBox.value, self.step3_1_yTranslationSpinBox.value)
-    self.showCalibrationCurves()
+    # Restart timer so that only the last of the rapid changes updates the chart
+    self.step3_1_alignmentPreviewTimer.start()
+
+  #------------------------------------------------------------------------------
+  def updateAlignmentPreview(self):
+    self.step3_1_alignmentPreviewTimer.stop()
+    if self.logic.calibrationDataCleanedArray is None:
+      return
+    self.logic.updateAlignedCalibrationArray(self.step3_1_xTranslationSpinBox.value, self.step3_1_yScaleSpinBox.value, self.step3_1_yTranslationSpinBox.value)
+    if not hasattr(self, 'calibrationDataAlignedTable'):
+      # Chart has not been shown yet
+      return
+
+    # Update aligned curve in the existing table and re-render chart
+    self.updateTableFromArray(self.calibrationDataAlignedTable, self.logic.calibrationDataAlignedToDisplayArray, self.chartMaximumNumberOfPoints)
+    self.calibrationCurveChartView.Render()
+
+  #------------------------------------------------------------------------------
+  @staticmethod
+  def createTableFromArray(columnNames, array, maximumNumberOfPoints=None):
+    # Create chart table with the given column names containing the columns of the array, see updateTableFromArray
+    table = vtk.vtkTable()
+    for columnName in columnNames:
+      column = vtk.vtkDoubleArray()
+      column.SetName(columnName)
+      table.AddColumn(column)
+    GelDosimetryAnalysisSlicelet.updateTableFromArray(table, array, maximumNumberOfPoints)
+    return table
+
+  #------------------------------------------------------------------------------
+  @staticmethod
+  def updateTableFromArray(table, array, maximumNumberOfPoints=None):
+    # Replace the columns of the table with the columns of the array (keeping the column names, so that
+    # the plots using the table are updated). The VTK arrays use the memory of the numpy column arrays,
+    # so the values are not copied one by one.
+    # If maximumNumberOfPoints is given and the curve (first column: X, second column: Y) has more points,
+    # then the curve is decimated by keeping the minimum and maximum Y values in each X interval
+    from vtk.util import numpy_support
+    columns = [array[:,columnIndex] for columnIndex in range(array.shape[1])]
+    if maximumNumberOfPoints is not None and array.shape[0] > maximumNumberOfPoints:
+      keptRowIndices = GelDosimetryAnalysisSlicelet.getMinMaxDecimationIndices(array[:,1], maximumNumberOfPoints)
+      columns = [column[keptRowIndices] for column in columns]
+
+    columnNames = [table.GetColumnName(columnIndex) for columnIndex in range(table.GetNumberOfColumns())]
+    table.GetRowData().Initialize()
+    for columnIndex, column in enumerate(columns):
+      vtkColumn = numpy_support.numpy_to_vtk(numpy.ascontiguousarray(column, dtype=numpy.float64), deep=False)
+      vtkColumn.SetName(columnNames[columnIndex])
+      table.AddColumn(vtkColumn)
+    table.Modified()
+
+  #------------------------------------------------------------------------------
+  @staticmethod
+  def getMinMaxDecimationIndices(values, maximumNumberOfPoints):
+    # Split the values into intervals of consecutive indices and keep the index of the minimum and maximum
+    # in each interval (and the first and last index), so that the shape of the curve is preserved.
+    # Returns sorted array of indices (not more than maximumNumberOfPoints, if it is at least 4)
+    numberOfIntervals = max(1, (maximumNumberOfPoints - 2) // 2)
+    intervalBoundaries = numpy.linspace(0, values.shape[0], numberOfIntervals+1).astype(int)
+    intervalIndices = numpy.repeat(numpy.arange(numberOfIntervals), numpy.diff(intervalBoundaries))
+    # Sort by interval then by value, so that the first and last element of each interval are the minimum and maximum
+    sortedIndices = numpy.lexsort((values, intervalIndices))
+    intervalStarts = intervalBoundaries[:-1][numpy.diff(intervalBoundaries) > 0]
+    intervalEnds = intervalBoundaries[1:][numpy.diff(intervalBoundaries) > 0]
+    keptIndices = numpy.concatenate(([0, values.shape[0]-1], sortedIndices[intervalStarts], sortedIndices[intervalEnds-1]))
+    return numpy.unique(keptIndices)
 
   #------------------------------------------------------------------------------
   def onComputeDoseFromPdd(self):
@@ -1654,21 +1895,8 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     self.oaVsDoseChart = vtk.vtkChartXY()
     self.oaVsDoseChartView.GetScene().AddItem(self.oaVsDoseChart)
 
-    # Create optical attenuation vs dose plot
-    self.oaVsDoseDataTable = vtk.vtkTable()
-    oaVsDoseNumberOfRows = self.logic.opticalAttenuationVsDoseFunction.shape[0]
-
-    opticalAttenuationArray = vtk.vtkDoubleArray()
-    opticalAttenuationArray.SetName("Optical attenuation (cm^-1)")
-    self.oaVsDoseDataTable.AddColumn(opticalAttenuationArray)
-    doseArray = vtk.vtkDoubleArray()
-    doseArray.SetName("Dose (GY)")
-    self.oaVsDoseDataTable.AddColumn(doseArray)
-
-    self.oaVsDoseDataTable.SetNumberOfRows(oaVsDoseNumberOfRows)
-    for rowIndex in range(oaVsDoseNumberOfRows):
-      self.oaVsDoseDataTable.SetValue(rowIndex, 0, self.logic.opticalAttenuationVsDoseFunction[rowIndex, 0])
-      self.oaVsDoseDataTable.SetValue(rowIndex, 1, self.logic.opticalAttenuationVsDoseFunction[rowIndex, 1])
+    # Create optical attenuation vs dose plot (not decimated, as the points can be selected for removal)
+    self.oaVsDoseDataTable = self.createTableFromArray(["Optical attenuation (cm^-1)", "Dose (GY)"], self.logic.opticalAttenuationVsDoseFunction)
 
     self.oaVsDoseLinePoint = self.oaVsDoseChart.AddPlot(vtk.vtkChart.POINTS)
     self.oaVsDoseLinePoint.SetInputData(self.oaVsDoseDataTable, 0, 1)
@@ -1695,16 +1923,10 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     if outlierSelection is None:
       outlierSelection = self.oaVsDoseLinePoint.GetSelection()
     if outlierSelection is not None and outlierSelection.GetNumberOfTuples() > 0:
-      # Get outlier indices in descending order
-      outlierIndices = []
-      for outlierSelectionIndex in range(outlierSelection.GetNumberOfTuples()):
-        outlierIndex = outlierSelection.GetValue(outlierSelectionIndex)
-        outlierIndices.append(outlierIndex)
-      outlierIndices.sort()
-      outlierIndices.reverse()
-      for outlierIndex in outlierIndices:
-        self.oaVsDoseDataTable.RemoveRow(outlierIndex)
-        self.logic.opticalAttenuationVsDoseFunction = numpy.delete(self.logic.opticalAttenuationVsDoseFunction, outlierIndex, 0)
+      from vtk.util import numpy_support
+      outlierIndices = numpy_support.vtk_to_numpy(outlierSelection)
+      self.logic.opticalAttenuationVsDoseFunction = numpy.delete(self.logic.opticalAttenuationVsDoseFunction, outlierIndices, 0)
+      self.updateTableFromArray(self.oaVsDoseDataTable, self.logic.opticalAttenuationVsDoseFunction)
 
       # De-select former points
       emptySelectionArray = vtk.vtkIdTypeArray()
@@ -1741,24 +1963,12 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     maxPolynomial = maxOA + (maxOA-minOA)*0.2
 
     # Create table to display polynomial
-    self.polynomialTable = vtk.vtkTable()
-    polynomialXArray = vtk.vtkDoubleArray()
-    polynomialXArray.SetName("X")
-    self.polynomialTable.AddColumn(polynomialXArray)
-    polynomialYArray = vtk.vtkDoubleArray()
-    polynomialYArray.SetName("Y")
-    self.polynomialTable.AddColumn(polynomialYArray)
-    # The displayed polynomial is 4 times as dense as the OA VS dose curve
-    polynomialNumberOfRows = oaVsDoseNumberOfRows * 4
-    self.polynomialTable.SetNumberOfRows(polynomialNumberOfRows)
-    for rowIndex in range(polynomialNumberOfRows):
-      x = minPolynomial + (maxPolynomial-minPolynomial)*rowIndex/polynomialNumberOfRows
-      self.polynomialTable.SetValue(rowIndex, 0, x)
-      y = 0
-      # Highest order first in the coefficients list
-      for orderIndex in range(maxOrder+1):
-        y += p[orderIndex] * x ** (maxOrder-orderIndex)
-      self.polynomialTable.SetValue(rowIndex, 1, y)
+    # The displayed polynomial is 4 times as dense as the OA VS dose curve (but not denser than the chart can show)
+    polynomialNumberOfRows = min(oaVsDoseNumberOfRows * 4, self.chartMaximumNumberOfPoints)
+    polynomialX = minPolynomial + (maxPolynomial-minPolynomial) * numpy.arange(polynomialNumberOfRows) / polynomialNumberOfRows
+    # Highest order first in the coefficients list
+    polynomialY = numpy.polyval(p, polynomialX)
+    self.polynomialTable = self.createTableFromArray(["X", "Y"], numpy.column_stack((polynomialX, polynomialY)))
 
     if hasattr(self, 'polynomialLine') and self.polynomialLine is not None:
       self.oaVsDoseChart.RemovePlotInstance(self.polynomialLine)
@@ -1898,62 +2108,121 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
   def onUseMaximumDoseRadioButtonToggled(self, toggled):
     self.step4_1_referenceDoseCustomValueCGySpinBox.setEnabled(not toggled)
 
+  #------------------------------------------------------------------------------
+  def onGammaEngineChanged(self, index):
+    # Geometric gamma calculation is only supported by SlicerRT
+    self.step4_1_useGeometricGammaCalculation.setEnabled(self.step4_1_gammaEngineComboBox.itemData(index) == 'slicerrt')
+
+  #------------------------------------------------------------------------------
+  def getGammaParameters(self):
+    # Gamma parameters set in the user interface, see GelDosimetryAnalysisLogic.computeGammaDoseComparison
+    parameters = {}
+    parameters['engine'] = self.step4_1_gammaEngineComboBox.itemData(self.step4_1_gammaEngineComboBox.currentIndex)
+    parameters['dtaDistanceToleranceMm'] = self.step4_1_dtaDistanceToleranceMmSpinBox.value
+    parameters['doseDifferenceTolerancePercent'] = self.step4_1_doseDifferenceTolerancePercentSpinBox.value
+    if not self.step4_1_referenceDoseUseMaximumDoseRadioButton.isChecked():
+      parameters['referenceDoseGy'] = self.step4_1_referenceDoseCustomValueCGySpinBox.value / 100.0
+    parameters['analysisThresholdPercent'] = self.step4_1_analysisThresholdPercentSpinBox.value
+    parameters['useGeometricGammaCalculation'] = (parameters['engine'] == 'slicerrt' and self.step4_1_useGeometricGammaCalculation.isChecked())
+    parameters['maximumGamma'] = self.step4_1_maximumGammaSpinBox.value
+    return parameters
+
   #------------------------------------------------------------------------------
   def onGammaDoseComparison(self):
+    # Returns True if the SlicerRT gamma computation has finished, or the GammaComputationFuture of the native gamma
+    # computation, which runs in the background and applies the results when it completes
     try:
-      slicer.modules.dosecomparison
-
       if self.step4_1_gammaVolumeSelector.currentNode() is None:
         qt.QMessageBox.warning(None, 'Warning', 'Gamma volume not selected. If there is no suitable output gamma volume, create one.')
         return False
       else:
         self.gammaVolumeNode = self.step4_1_gammaVolumeSelector.currentNode()
 
-      # Set up gamma computation parameters
-      self.gammaParameterSetNode = slicer.vtkMRMLDoseComparisonNode()
-      slicer.mrmlScene.AddNode(self.gammaParameterSetNode)
-      self.gammaParameterSetNode.SetAndObserveReferenceDoseVolumeNode(self.planDoseVolumeNode)
-      self.gammaParameterSetNode.SetAndObserveCompareDoseVolumeNode(self.calibratedMeasuredVolumeNode)
-      self.gammaParameterSetNode.SetAndObserveMaskSegmentationNode(self.maskSegmentationNode)
-      if self.maskSegmentID is not None and self.maskSegmentID != '':
-        self.gammaParameterSetNode.SetMaskSegmentID(self.maskSegmentID)
-      else:
-        self.gammaParameterSetNode.SetMaskSegmentID(None)
-      self.gammaParameterSetNode.SetAndObserveGammaVolumeNode(self.gammaVolumeNode)
-      self.gammaParameterSetNode.SetDtaDistanceToleranceMm(self.step4_1_dtaDistanceToleranceMmSpinBox.value)
-      self.gammaParameterSetNode.SetDoseDifferenceTolerancePercent(self.step4_1_doseDifferenceTolerancePercentSpinBox.value)
-      self.gammaParameterSetNode.SetUseMaximumDose(self.step4_1_referenceDoseUseMaximumDoseRadioButton.isChecked())
-      self.gammaParameterSetNode.SetUseGeometricGammaCalculation(self.step4_1_useGeometricGammaCalculation.isChecked())
-      self.gammaParameterSetNode.SetReferenceDoseGy(self.step4_1_referenceDoseCustomValueCGySpinBox.value / 100.0)
-      self.gammaParameterSetNode.SetAnalysisThresholdPercent(self.step4_1_analysisThresholdPercentSpinBox.value)
-      self.gammaParameterSetNode.SetDoseThresholdOnReferenceOnly(True)
-      self.gammaParameterSetNode.SetMaximumGamma(self.step4_1_maximumGammaSpinBox.value)
-
-      # Create progress bar
+      parameters = self.getGammaParameters()
+      maskSegmentID = self.maskSegmentID if self.maskSegmentID else None
+      if parameters['engine'] == 'native':
+        return self.startGammaDoseComparisonNative(parameters, maskSegmentID)
+
+      # Create progress bar. The SlicerRT computation runs in the main thread and cannot be canceled
       doseComparisonLogic = slicer.modules.dosecomparison.logic()
       self.addObserver(doseComparisonLogic, 62200, self.onGammaProgressUpdated) # Note: Event number defined in SlicerRtCommon.ProgressUpdated, but python wrapping does not work anymore for SlicerRtCommon
       self.gammaProgressDialog = qt.QProgressDialog(self.parent)
       self.gammaProgressDialog.setModal(True)
       self.gammaProgressDialog.setMinimumDuration(150)
-      self.gammaProgressDialog.labelText = "Computing gamma dose difference..."
+      self.gammaProgressDialog.setCancelButton(None)
+      self.gammaProgressDialog.labelText = "Computing gamma dose difference using SlicerRT (cannot be canceled)..."
       self.gammaProgressDialog.show()
       slicer.app.processEvents()
 
       # Perform gamma comparison
-      qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
-      errorMessage = doseComparisonLogic.ComputeGammaDoseDifference(self.gammaParameterSetNode)
+      try:
+        self.gammaParameterSetNode = self.logic.computeGammaDoseComparison(self.planDoseVolumeNode, self.calibratedMeasuredVolumeNode,
+          self.gammaVolumeNode, self.maskSegmentationNode, maskSegmentID, parameters)
+      finally:
+        self.gammaProgressDialog.hide()
+        self.gammaProgressDialog = None
+        self.removeObserver(doseComparisonLogic, 62200, self.onGammaProgressUpdated)
+
+      return self.showGammaDoseComparisonResults()
+
+    except Exception as e:
+      import traceback
+      traceback.print_exc()
+      logging.error('Failed to perform gamma dose comparison!')
+
+  #------------------------------------------------------------------------------
+  def startGammaDoseComparisonNative(self, parameters, maskSegmentID):
+    # Start the native gamma computation in a background thread. The progress dialog stays responsive, and its
+    # Cancel button stops the computation without modifying the gamma volume
+    if self.step4_1_gammaFuture is not None and not self.step4_1_gammaFuture.done():
+      return self.step4_1_gammaFuture
+
+    self.gammaProgressDialog = qt.QProgressDialog(self.parent)
+    self.gammaProgressDialog.setModal(True)
+    self.gammaProgressDialog.setMinimumDuration(150)
+    self.gammaProgressDialog.labelText = "Computing gamma dose difference..."
+    self.gammaProgressDialog.show()
+    self.step4_1_gammaStatusLabel.setText('Computing gamma dose difference...')
+
+    gammaFuture = self.logic.computeGammaDoseComparisonNativeAsync(self.planDoseVolumeNode, self.calibratedMeasuredVolumeNode,
+      self.gammaVolumeNode, self.maskSegmentationNode, maskSegmentID, parameters,
+      completedCallback=self.onGammaDoseComparisonNativeCompleted, progressCallback=self.onGammaComputationProgress)
+    # The computation may have failed to start, then the dialog has already been closed by the completed callback
+    if self.gammaProgressDialog is not None:
+      self.gammaProgressDialog.connect('canceled()', gammaFuture.cancel)
+    self.step4_1_gammaFuture = gammaFuture
+    return gammaFuture
 
+  #------------------------------------------------------------------------------
+  def onGammaComputationProgress(self, progress):
+    if self.gammaProgressDialog:
+      self.gammaProgressDialog.value = progress * 100.0
+
+  #------------------------------------------------------------------------------
+  def onGammaDoseComparisonNativeCompleted(self, gammaFuture):
+    if self.gammaProgressDialog:
       self.gammaProgressDialog.hide()
       self.gammaProgressDialog = None
-      self.removeObserver(doseComparisonLogic, 62200, self.onGammaProgressUpdated)
-      qt.QApplication.restoreOverrideCursor()
 
+    if gammaFuture.status == 'completed':
+      self.gammaParameterSetNode = gammaFuture.result()
+      self.showGammaDoseComparisonResults()
+    elif gammaFuture.status == 'cancelled':
+      self.step4_1_gammaStatusLabel.setText('Gamma dose comparison cancelled')
+    else:
+      self.step4_1_gammaStatusLabel.setText(gammaFuture.errorText)
+      self.step4_1_showGammaReportButton.enabled = False
+
+  #------------------------------------------------------------------------------
+  def showGammaDoseComparisonResults(self):
+    # Show the results of the last gamma dose comparison (gammaParameterSetNode) and the gamma volume
+    try:
       if self.gammaParameterSetNode.GetResultsValid():
         self.step4_1_gammaStatusLabel.setText('Gamma dose comparison succeeded\nPass fraction: {0:.2f}%'.format(self.gammaParameterSetNode.GetPassFractionPercent()))
         self.step4_1_showGammaReportButton.enabled = True
         self.gammaReport = self.gammaParameterSetNode.GetReportString()
       else:
-        self.step4_1_gammaStatusLabel.setText(errorMessage)
+        self.step4_1_gammaStatusLabel.setText(self.logic.gammaErrorMessage)
         self.step4_1_showGammaReportButton.enabled = False
 
       # Show gamma volume
@@ -1998,7 +2267,86 @@ class GelDosimetryAnalysisSlicelet(VTKObservationMixin):
     except Exception as e:
       import traceback
       traceback.print_exc()
-      logging.error('Failed to perform gamma dose comparison!')
+      logging.error('Failed to show gamma dose comparison results!')
+
+  #------------------------------------------------------------------------------
+  def parseGammaSweepCriteria(self, criteriaText):
+    # Parse comma separated 'dose difference % / DTA mm' pairs into (DTA mm, dose difference %) tuples
+    criteria = []
+    for criterionText in criteriaText.split(','):
+      if criterionText.strip() == '':
+        continue
+      doseDifferenceText, dtaText = criterionText.replace('%','').replace('mm','').split('/')
+      criteria.append((float(dtaText), float(doseDifferenceText)))
+    return criteria
+
+  #------------------------------------------------------------------------------
+  def onGammaSweep(self):
+    try:
+      criteria = self.parseGammaSweepCriteria(self.step4_1_gammaSweepCriteriaLineEdit.text)
+    except ValueError:
+      qt.QMessageBox.warning(None, 'Warning', "Invalid gamma criteria. Specify them as comma separated 'dose difference / distance-to-agreement' pairs, such as 3/3, 2/2")
+      return None
+    if len(criteria) == 0:
+      return None
+
+    parameters = self.getGammaParameters()
+    maskSegmentID = self.maskSegmentID if self.maskSegmentID else None
+    sweepResults = self.logic.computeGammaDoseComparisonSweep(self.planDoseVolumeNode, self.calibratedMeasuredVolumeNode, criteria,
+      self.maskSegmentationNode, maskSegmentID, parameters)
+    if sweepResults is None:
+      self.step4_1_gammaStatusLabel.setText(self.logic.gammaErrorMessage)
+      return None
+
+    passRatesText = '\n'.join(['  {0:g}%/{1:g}mm: {2:.2f}%'.format(result['doseDifferenceTolerancePercent'], result['dtaDistanceToleranceMm'], result['passFractionPercent'])
+      for result in sweepResults])
+    self.step4_1_gammaStatusLabel.setText('Gamma pass rates:\n' + passRatesText)
+    self.gammaReport = 'Gamma pass rates (native engine)\n' + passRatesText
+    self.step4_1_showGammaReportButton.enabled = True
+    return sweepResults
+
+  #------------------------------------------------------------------------------
+  def onGammaPassRate(self):
+    if self.planDoseVolumeNode is None or self.calibratedMeasuredVolumeNode is None:
+      self.step4_1_gammaStatusLabel.setText('Plan dose and calibrated volumes are needed for the pass rate')
+      return None
+    maskSegmentID = self.maskSegmentID if self.maskSegmentID else None
+    passRateResults = self.logic.computeGammaPassFraction(self.planDoseVolumeNode, self.calibratedMeasuredVolumeNode,
+      self.maskSegmentationNode, maskSegmentID, self.getGammaParameters())
+    if passRateResults is None:
+      self.step4_1_gammaStatusLabel.setText(self.logic.gammaErrorMessage)
+      return None
+
+    histogramText = ', '.join(['({0:.1f}, {1:.1f}]: {2}'.format(lower, upper, count) for lower, upper, count in zip(
+      passRateResults['histogramBinEdges'][1:-1], passRateResults['histogramBinEdges'][2:], passRateResults['histogramCounts'][1:]) if count > 0])
+    self.step4_1_gammaStatusLabel.setText('Gamma pass fraction: {0:.2f}% of {1} voxels'.format(
+      passRateResults['passFractionPercent'], passRateResults['numberOfAnalyzedVoxels']))
+    self.gammaReport = 'Gamma pass fraction (native engine, no gamma volume): {0:.2f}%\nNumber of analyzed voxels: {1}\nFailed voxels by gamma: {2}'.format(
+      passRateResults['passFractionPercent'], passRateResults['numberOfAnalyzedVoxels'], histogramText if histogramText else 'none')
+    self.step4_1_showGammaReportButton.enabled = True
+    return passRateResults
+
+  #------------------------------------------------------------------------------
+  def onLivePassRateToggled(self, checked):
+    self.removePassRateObservers()
+    if not checked:
+      return
+    for doseVolumeNode in [self.planDoseVolumeNode, self.calibratedMeasuredVolumeNode]:
+      if doseVolumeNode is not None:
+        observerTag = doseVolumeNode.AddObserver(slicer.vtkMRMLTransformableNode.TransformModifiedEvent, self.onGammaInputTransformModified)
+        self.step4_1_passRateObserverTags.append([doseVolumeNode, observerTag])
+    self.onGammaPassRate()
+
+  #------------------------------------------------------------------------------
+  def onGammaInputTransformModified(self, caller=None, event=None):
+    self.step4_1_passRateUpdateTimer.start()
+
+  #------------------------------------------------------------------------------
+  def removePassRateObservers(self):
+    for doseVolumeNode, observerTag in self.step4_1_passRateObserverTags:
+      doseVolumeNode.RemoveObserver(observerTag)
+    self.step4_1_passRateObserverTags = []
+    self.step4_1_passRateUpdateTimer.stop()
 
   #------------------------------------------------------------------------------
   def onGammaProgressUpdated(self, logic, event):
@@ -2215,6 +2563,7 @@ class GelDosimetryAnalysisTest(ScriptedLoadableModuleTest):
       self.TestSection_03_Register()
       self.TestSection_04_Calibrate()
       self.TestSection_05_CompareDoses()
+      self.TestSection_06_CalibrationPipeline()
 
     except Exception as e:
       logging.error('Exception happened! Details:')
@@ -2339,8 +2688,9 @@ class GelDosimetryAnalysisTest(ScriptedLoadableModuleTest):
       self.assertIsNotNone(self.slicelet)
 
       self.slicelet.step2_registrationCollapsibleButton.setChecked(True)
-      cbctToPlanTransformNode = self.slicelet.onPlanCtToCbctAutomaticRegistration()
-      slicer.app.processEvents()
+      registrationFuture = self.slicelet.onPlanCtToCbctAutomaticRegistration()
+      self.assertTrue(registrationFuture.wait())
+      cbctToPlanTransformNode = registrationFuture.result()
 
       self.assertIsNotNone(cbctToPlanTransformNode)
       cbctToPlanTransformMatrix = cbctToPlanTransformNode.GetTransformToParent().GetMatrix()
@@ -2476,8 +2826,17 @@ class GelDosimetryAnalysisTest(ScriptedLoadableModuleTest):
       self.slicelet.step4_maskSegmentationSelector.setCurrentNodeID(structureSetNode.GetID())
       self.slicelet.step4_maskSegmentationSelector.setCurrentSegmentID(self.maskSegmentID)
 
+      # The native engine is the default, but the expected values below were computed using SlicerRT if available
+      self.assertEqual(self.slicelet.step4_1_gammaEngineComboBox.itemData(0), 'native')
+      slicerRtEngineIndex = self.slicelet.step4_1_gammaEngineComboBox.findData('slicerrt')
+      if slicerRtEngineIndex >= 0:
+        self.slicelet.step4_1_gammaEngineComboBox.setCurrentIndex(slicerRtEngineIndex)
+
       # Calculate gamma
       gammaCalculationSuccessful = self.slicelet.onGammaDoseComparison()
+      if isinstance(gammaCalculationSuccessful, GelDosimetryAnalysisLogic.GammaComputationFuture):
+        # The native gamma engine runs in the background
+        gammaCalculationSuccessful = gammaCalculationSuccessful.wait()
       self.assertTrue(gammaCalculationSuccessful)
 
       # Check gamma volume statistics
@@ -2503,6 +2862,1119 @@ class GelDosimetryAnalysisTest(ScriptedLoadableModuleTest):
       self.delayDisplay('Test caused exception!\n' + str(e),self.delayMs*2)
       raise Exception("Exception occurred, handled, thrown further to workflow level")
 
+  #------------------------------------------------------------------------------
+  def TestSection_06_CalibrationPipeline(self):
+    self.delayDisplay("Perform calibration using the headless pipeline",self.delayMs)
+
+    try:
+      self.assertIsNotNone(self.slicelet)
+
+      # Use the same parameters as the interactive calibration
+      pipelineLogic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+      config = { 'pddFilePath': self.dicomDataDir + '/12MeV.csv',
+                 'calibrationVolumeNodeID': slicer.util.getNode(self.calibrationVolumeName).GetID(),
+                 'measuredVolumeNodeID': slicer.util.getNode(self.measuredVolumeName).GetID(),
+                 'centralRadiusMm': 5,
+                 'alignment': [1, 1.162, 1.28],
+                 'rdf': 0.989,
+                 'monitorUnits': 1850,
+                 'polynomialOrder': int(self.slicelet.step3_1_selectOrderOfPolynomialFitButton.currentText) }
+      results = pipelineLogic.runCalibrationPipeline(config)
+      self.assertIsNotNone(results)
+
+      self.assertTrue(numpy.allclose(results['calibrationPolynomialCoefficients'], self.slicelet.logic.calibrationPolynomialCoefficients))
+      self.assertIsNotNone(results['calibratedVolumeNode'])
+      slicer.mrmlScene.RemoveNode(results['calibratedVolumeNode'])
+
+    except Exception as e:
+      import traceback
+      traceback.print_exc()
+      self.delayDisplay('Test caused exception!\n' + str(e),self.delayMs*2)
+      raise Exception("Exception occurred, handled, thrown further to workflow level")
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CentralCylinderParsing(self):
+    self.delayDisplay("Compare vectorized central cylinder parsing to reference loop",self.delayMs)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    numpy.random.seed(0)
+    for dimensions, radiusMm in [ ([31,31,12], 5.0), ([40,33,7], 3.0), ([20,20,5], 1.0) ]:
+      calibrationVolumeNode = self.createSyntheticVolumeNode(dimensions, [1.0,1.0,2.0], numpy.random.rand(*dimensions[::-1]) * 100.0)
+      self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), radiusMm))
+
+      imageArray = numpy.transpose(slicer.util.arrayFromVolume(calibrationVolumeNode), (2,1,0))
+      referenceTable = self.computeCentralCylinderTableReference(imageArray, int(numpy.ceil(radiusMm)), 0.2)
+      self.assertEqual(logic.calibrationDataArray.shape, referenceTable.shape)
+      self.assertTrue(numpy.allclose(logic.calibrationDataArray, referenceTable))
+
+      slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CalibrationMemoryUsage(self):
+    self.delayDisplay("Check the voxel buffers allocated by calibration",self.delayMs)
+    from vtk.util import numpy_support
+
+    def getScalarBufferAddress(volumeNode):
+      return numpy_support.vtk_to_numpy(volumeNode.GetImageData().GetPointData().GetScalars()).ctypes.data
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.calibrationPolynomialCoefficients = numpy.array([0.5, 2.0, 1.0])
+
+    dimensions = [64, 48, 32]
+    measuredVolumeNode = self.createSyntheticVolumeNode(dimensions, [1.0,1.0,1.0], numpy.ones(dimensions[::-1]))
+    measuredImageData = measuredVolumeNode.GetImageData()
+    measuredScalars = measuredImageData.GetPointData().GetScalars()
+    measuredBufferAddress = getScalarBufferAddress(measuredVolumeNode)
+
+    # Calibrate into new volume: the input buffer is kept, and the output has a single new buffer
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID())
+    self.assertIsNotNone(calibratedVolumeNode)
+    self.assertEqual(measuredVolumeNode.GetImageData().GetPointData().GetScalars(), measuredScalars)
+    self.assertEqual(getScalarBufferAddress(measuredVolumeNode), measuredBufferAddress)
+    calibratedPointData = calibratedVolumeNode.GetImageData().GetPointData()
+    self.assertEqual(calibratedPointData.GetNumberOfArrays(), 1)
+    self.assertEqual(calibratedPointData.GetScalars().GetNumberOfTuples(), numpy.prod(dimensions))
+    self.assertNotEqual(getScalarBufferAddress(calibratedVolumeNode), measuredBufferAddress)
+    self.assertAlmostEqual(slicer.util.arrayFromVolume(calibratedVolumeNode)[0,0,0], 3.5, 5)
+    self.assertAlmostEqual(slicer.util.arrayFromVolume(measuredVolumeNode)[0,0,0], 1.0, 5)
+    slicer.mrmlScene.RemoveNode(calibratedVolumeNode)
+
+    # Calibrate in place: the voxels are written into the input buffer
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID(), inPlace=True)
+    self.assertEqual(calibratedVolumeNode, measuredVolumeNode)
+    self.assertEqual(measuredVolumeNode.GetImageData(), measuredImageData)
+    self.assertEqual(measuredImageData.GetPointData().GetScalars(), measuredScalars)
+    self.assertEqual(getScalarBufferAddress(measuredVolumeNode), measuredBufferAddress)
+    self.assertAlmostEqual(slicer.util.arrayFromVolume(measuredVolumeNode)[0,0,0], 3.5, 5)
+
+    slicer.mrmlScene.RemoveNode(measuredVolumeNode)
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CalibrationOutputScalarType(self):
+    self.delayDisplay("Check scalar type of calibrated integer volume",self.delayMs)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.calibrationPolynomialCoefficients = numpy.array([0.25, 0.1])
+    measuredVolumeNode = self.createSyntheticVolumeNode([8,8,4], [1.0,1.0,1.0], numpy.full([4,8,8], 3), vtk.VTK_UNSIGNED_SHORT)
+
+    # Integer input is calibrated to float by default
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID())
+    self.assertEqual(calibratedVolumeNode.GetImageData().GetScalarType(), vtk.VTK_FLOAT)
+    self.assertAlmostEqual(slicer.util.arrayFromVolume(calibratedVolumeNode)[0,0,0], 0.85, 5)
+    slicer.mrmlScene.RemoveNode(calibratedVolumeNode)
+
+    # Explicit output type
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID(), outputScalarType=vtk.VTK_DOUBLE)
+    self.assertEqual(calibratedVolumeNode.GetImageData().GetScalarType(), vtk.VTK_DOUBLE)
+    slicer.mrmlScene.RemoveNode(calibratedVolumeNode)
+
+    # In-place calibration of integer input replaces the buffer as the scalar type changes
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID(), inPlace=True)
+    self.assertEqual(calibratedVolumeNode, measuredVolumeNode)
+    self.assertEqual(measuredVolumeNode.GetImageData().GetScalarType(), vtk.VTK_FLOAT)
+    self.assertAlmostEqual(slicer.util.arrayFromVolume(measuredVolumeNode)[0,0,0], 0.85, 5)
+
+    slicer.mrmlScene.RemoveNode(measuredVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CalibrationLookupTableBenchmark(self):
+    self.delayDisplay("Compare lookup table calibration to direct polynomial evaluation",self.delayMs)
+    import time
+    from vtk.util import numpy_support
+
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    # Highest polynomial order offered in the slicelet, on 12-bit scanner values stored as unsigned short
+    coefficients = numpy_support.numpy_to_vtk(numpy.array([1.0e-13, 1.0e-9, -2.0e-5, 0.3, 1.5]))
+    numpy.random.seed(0)
+    dimensions = [128, 128, 128]
+    measuredVolumeNode = self.createSyntheticVolumeNode(dimensions, [1.0,1.0,1.0],
+      numpy.random.randint(0, 4096, dimensions[::-1]), vtk.VTK_UNSIGNED_SHORT)
+
+    calibrationTimes = {}
+    calibratedArrays = {}
+    for calibrationMethod in [ slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodPolynomial,
+                               slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodAutomatic ]:
+      calibratedVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+      algoLogic.SetCalibrationMethod(calibrationMethod)
+      start = time.time()
+      self.assertTrue(algoLogic.ApplyPolynomialFunctionOnVolume(measuredVolumeNode, coefficients, calibratedVolumeNode))
+      calibrationTimes[calibrationMethod] = time.time() - start
+      calibratedArrays[calibrationMethod] = slicer.util.arrayFromVolume(calibratedVolumeNode).copy()
+      slicer.mrmlScene.RemoveNode(calibratedVolumeNode)
+    algoLogic.SetCalibrationMethod(slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodAutomatic)
+
+    # The timings depend on the load of the machine, so they are only logged
+    logging.info('Calibration of {0} voxels: polynomial {1:.3f}s, lookup table {2:.3f}s'.format(
+      numpy.prod(dimensions), calibrationTimes[slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodPolynomial],
+      calibrationTimes[slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodAutomatic]))
+    self.assertTrue(numpy.array_equal(
+      calibratedArrays[slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodPolynomial],
+      calibratedArrays[slicer.vtkApplyPolynomialFunctionOnVolume.CalibrationMethodAutomatic]))
+
+    slicer.mrmlScene.RemoveNode(measuredVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CurveAlignment(self):
+    self.delayDisplay("Align calibration curve to PDD with known alignment parameters",self.delayMs)
+
+    # Electron PDD like curve, and calibration curve (depth, mean, std.dev.) created from it with known parameters
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    numpy.random.seed(0)
+    pddDepths = numpy.arange(0, 10.01, 0.05)
+    logic.pddDataArray = numpy.column_stack((pddDepths, 100.0 * numpy.exp(-((pddDepths - 2.5) / 1.8)**2)))
+    [xTransExpected, yScaleExpected, yTransExpected] = [1.2, 150.0, -2.0]
+    calibrationDepths = numpy.arange(0, 7.0, 0.2)
+    calibrationValues = (numpy.interp(calibrationDepths + xTransExpected, pddDepths, logic.pddDataArray[:,1]) - yTransExpected) / yScaleExpected
+    logic.calibrationDataArray = numpy.column_stack((calibrationDepths,
+      calibrationValues + numpy.random.normal(0, 0.002, calibrationDepths.shape[0]), numpy.zeros(calibrationDepths.shape[0])))
+
+    [error, xTrans, yScale, yTrans] = logic.alignPddToCalibration()
+    self.assertAlmostEqual(xTrans, xTransExpected, delta=0.02)
+    self.assertAlmostEqual(yScale, yScaleExpected, delta=yScaleExpected*0.02)
+    self.assertAlmostEqual(yTrans, yTransExpected, delta=0.5)
+
+    # The error is the cost function of the original minimizer, and it is not larger than what that minimizer finds
+    # (unless the original minimizer ends up outside the X translation search range)
+    self.assertAlmostEqual(error, self.computeCurveAlignmentErrorReference(
+      logic.pddDataArray, logic.calibrationDataCleanedArray, xTrans, yScale, yTrans), delta=error*1e-6)
+    [referenceError, referenceXTrans, referenceYScale, referenceYTrans] = self.alignPddToCalibrationReference(
+      logic.pddDataArray, logic.calibrationDataCleanedArray)
+    logging.info('Curve alignment error: closed form {0:.4f}, simplex search {1:.4f} (xTrans={2:.3f})'.format(error, referenceError, referenceXTrans))
+    if abs(referenceXTrans) <= 5.0:
+      self.assertLessEqual(error, referenceError * (1.0 + 1e-3) + 1e-6)
+
+    # X translations are only searched within the given range
+    [error, xTrans, yScale, yTrans] = logic.alignPddToCalibration(xTransSearchRangeCm=0.5)
+    self.assertLessEqual(xTrans, 0.5 + 1e-6)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_BatchManifest(self):
+    self.delayDisplay("Set up batch processing jobs from manifest",self.delayMs)
+    import tempfile
+    import json
+
+    batchDir = tempfile.mkdtemp()
+    manifestFilePath = os.path.join(batchDir, 'Manifest.csv')
+    with open(manifestFilePath, 'w') as manifestFile:
+      manifestFile.write('calibrationVolumeFilePath,pddFilePath,measuredVolumeFilePath,planDoseVolumeFilePath,rdf,calibrateInPlace,alignment,name\n')
+      manifestFile.write('Gel1/Calibration.vff,12MeV.csv,Gel1/Measured.vff,Gel1/PlanDose.nrrd,0.95,False,"[1, 1.162, 1.28]",007\n')
+      manifestFile.write('Gel2/Calibration.vff,12MeV.csv,Gel2/Measured.vff,,,TRUE,,\n')
+
+    batchLogic = GelDosimetryAnalysisLogic.BatchProcessingLogic()
+    manifest = batchLogic.loadManifest(manifestFilePath)
+    self.assertEqual(len(manifest), 2)
+    self.assertEqual(manifest[0]['pddFilePath'], os.path.join(batchDir, '12MeV.csv'))
+
+    commonConfig = { 'centralRadiusMm': 5, 'rdf': 0.989, 'monitorUnits': 1850, 'polynomialOrder': 3 }
+    outputDir = os.path.join(batchDir, 'Output')
+    jobConfigs = [ batchLogic.createJobConfig(index, entry, outputDir, commonConfig) for index, entry in enumerate(manifest) ]
+    # CSV values are converted to the types used by the pipeline, except for paths and names
+    self.assertEqual(jobConfigs[0]['rdf'], 0.95)
+    self.assertEqual(jobConfigs[1]['rdf'], 0.989)
+    self.assertIs(jobConfigs[0]['calibrateInPlace'], False)
+    self.assertIs(jobConfigs[1]['calibrateInPlace'], True)
+    self.assertEqual(jobConfigs[0]['alignment'], [1, 1.162, 1.28])
+    self.assertEqual(jobConfigs[0]['name'], '007')
+    self.assertTrue('outputGammaVolumeFilePath' in jobConfigs[0])
+    self.assertFalse('outputGammaVolumeFilePath' in jobConfigs[1])
+    with open(jobConfigs[1]['configFilePath'], 'r') as configFile:
+      self.assertEqual(json.load(configFile)['measuredVolumeFilePath'], os.path.join(batchDir, 'Gel2', 'Measured.vff'))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_BatchJob(self):
+    self.delayDisplay("Run batch processing jobs in process and in worker processes",self.delayMs)
+    import tempfile
+    import json
+    import csv
+
+    batchDir = tempfile.mkdtemp()
+    manifestEntry = self.createSyntheticGelDataset(batchDir)
+    commonConfig = { 'centralRadiusMm': 3, 'rdf': 1.0, 'monitorUnits': 100, 'polynomialOrder': 1 }
+    outputDir = os.path.join(batchDir, 'Output')
+    batchLogic = GelDosimetryAnalysisLogic.BatchProcessingLogic()
+
+    # Run job in this process
+    jobConfig = batchLogic.createJobConfig(0, manifestEntry, outputDir, commonConfig)
+    self.assertEqual(GelDosimetryAnalysisLogic.BatchProcessingLogic.runJob(jobConfig['configFilePath']), 0)
+    with open(jobConfig['resultsFilePath'], 'r') as resultsFile:
+      results = json.load(resultsFile)
+    # The dataset is created with xTrans=1.2, yScale=150, yTrans=-2, and the dose is PDD/100
+    self.assertTrue(numpy.allclose(results['alignment'], [1.2, 150.0, -2.0], rtol=0.02, atol=0.05))
+    self.assertTrue(numpy.allclose(results['calibrationPolynomialCoefficients'], [1.5, -0.02], atol=0.01))
+    self.assertEqual(results['calibratedVolumeFilePath'], jobConfig['outputCalibratedVolumeFilePath'])
+    calibratedVolumeNode = slicer.util.loadVolume(results['calibratedVolumeFilePath'])
+    self.assertTrue(numpy.allclose(slicer.util.arrayFromVolume(calibratedVolumeNode), 1.5 * 0.4 - 0.02, atol=0.01))
+
+    # Summary of a succeeded and a failed job
+    results.update({ 'name': jobConfig['name'], 'status': 'succeeded', 'time': 1.5 })
+    summaryFilePath = os.path.join(outputDir, 'BatchResults.csv')
+    batchLogic.writeSummary([results, { 'name': 'Failed', 'status': 'failed' }], summaryFilePath)
+    with open(summaryFilePath, 'r') as summaryFile:
+      summaryRows = list(csv.reader(summaryFile))
+    self.assertEqual(len(summaryRows), 3)
+    self.assertEqual(summaryRows[1][0:3], [jobConfig['name'], 'succeeded', '1.5'])
+    self.assertTrue(numpy.allclose([float(value) for value in summaryRows[1][3].split()], results['calibrationPolynomialCoefficients']))
+    self.assertEqual(summaryRows[1][6], results['calibratedVolumeFilePath'])
+    self.assertEqual(summaryRows[2][0:4], ['Failed', 'failed', '', ''])
+
+    # A job raising exception in the worker process fails instead of keeping the worker running
+    batchLogic.additionalModulePaths = [ os.path.dirname(slicer.modules.geldosimetryanalysis.path),
+                                         os.path.dirname(slicer.modules.geldosimetryanalysisalgo.path) ]
+    batchLogic.timeoutSec = 600
+    failingJobConfig = batchLogic.createJobConfig(1, manifestEntry, outputDir, dict(commonConfig, centralRadiusMm='invalid'))
+    result = batchLogic.runJobProcess(failingJobConfig, 1)
+    self.assertEqual(result['status'], 'failed')
+    self.assertFalse(os.path.exists(failingJobConfig['resultsFilePath']))
+    with open(failingJobConfig['logFilePath'], 'r') as logFile:
+      self.assertTrue('ValueError' in logFile.read())
+
+    # A job exceeding the memory limit fails
+    import sys
+    import shutil
+    if sys.platform.startswith('linux') and shutil.which('prlimit'):
+      batchLogic.memoryLimitMb = 50
+      memoryLimitedJobConfig = batchLogic.createJobConfig(3, manifestEntry, outputDir, commonConfig)
+      self.assertEqual(batchLogic.getJobCommand(memoryLimitedJobConfig, 1)[0:2], [shutil.which('prlimit'), '--data={0}'.format(50 * 1024 * 1024)])
+      result = batchLogic.runJobProcess(memoryLimitedJobConfig, 1)
+      self.assertEqual(result['status'], 'failed')
+      self.assertFalse(os.path.exists(memoryLimitedJobConfig['resultsFilePath']))
+      batchLogic.memoryLimitMb = None
+
+    # A job exceeding the timeout is killed
+    batchLogic.timeoutSec = 0.5
+    timeoutJobConfig = batchLogic.createJobConfig(2, manifestEntry, outputDir, commonConfig)
+    result = batchLogic.runJobProcess(timeoutJobConfig, 1)
+    self.assertEqual(result['status'], 'timeout')
+    self.assertLess(result['time'], 60)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_StreamingCalibration(self):
+    self.delayDisplay("Compare streaming calibration of volume file to in-memory calibration",self.delayMs)
+    import tempfile
+
+    numpy.random.seed(0)
+    dimensions = [64, 48, 40]
+    measuredVolumeNode = self.createSyntheticVolumeNode(dimensions, [0.5,0.5,1.0],
+      numpy.random.randint(0, 4096, dimensions[::-1]), vtk.VTK_SHORT)
+    tempDir = tempfile.mkdtemp()
+    measuredVolumeFilePath = os.path.join(tempDir, 'Measured.nrrd')
+    calibratedVolumeFilePath = os.path.join(tempDir, 'Calibrated.nrrd')
+    self.assertTrue(slicer.util.saveNode(measuredVolumeNode, measuredVolumeFilePath, {'useCompression': 0}))
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.calibrationPolynomialCoefficients = numpy.array([-1.0e-7, 2.0e-4, 0.05, 0.1])
+    calibratedVolumeNode = logic.calibrate(measuredVolumeNode.GetID())
+    self.assertIsNotNone(calibratedVolumeNode)
+
+    # Use slabs of a few slices to test processing in multiple slabs
+    self.assertTrue(logic.calibrateVolumeFile(measuredVolumeFilePath, calibratedVolumeFilePath, maximumSlabSizeMb=0.2))
+    streamedVolumeNode = slicer.util.loadVolume(calibratedVolumeFilePath)
+    self.assertTrue(numpy.allclose(slicer.util.arrayFromVolume(streamedVolumeNode), slicer.util.arrayFromVolume(calibratedVolumeNode)))
+    self.assertEqual(streamedVolumeNode.GetImageData().GetScalarType(), vtk.VTK_FLOAT)
+    self.assertEqual(streamedVolumeNode.GetSpacing(), measuredVolumeNode.GetSpacing())
+
+    # Compressed volume files (saved by default by Slicer) are decompressed slab by slab
+    compressedVolumeFilePath = os.path.join(tempDir, 'MeasuredCompressed.nrrd')
+    compressedCalibratedVolumeFilePath = os.path.join(tempDir, 'CalibratedCompressed.nrrd')
+    self.assertTrue(slicer.util.saveNode(measuredVolumeNode, compressedVolumeFilePath, {'useCompression': 1}))
+    self.assertEqual(logic.readNrrdHeader(compressedVolumeFilePath)['encoding'], 'gzip')
+    self.assertTrue(logic.calibrateVolumeFile(compressedVolumeFilePath, compressedCalibratedVolumeFilePath, maximumSlabSizeMb=0.2))
+    compressedStreamedVolumeNode = slicer.util.loadVolume(compressedCalibratedVolumeFilePath)
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(compressedStreamedVolumeNode), slicer.util.arrayFromVolume(streamedVolumeNode)))
+
+    # Failed calibration leaves no partial output file
+    truncatedVolumeFilePath = os.path.join(tempDir, 'MeasuredTruncated.nrrd')
+    truncatedCalibratedVolumeFilePath = os.path.join(tempDir, 'CalibratedTruncated.nrrd')
+    with open(measuredVolumeFilePath, 'rb') as measuredVolumeFile, open(truncatedVolumeFilePath, 'wb') as truncatedVolumeFile:
+      truncatedVolumeFile.write(measuredVolumeFile.read()[:-1000])
+    self.assertFalse(logic.calibrateVolumeFile(truncatedVolumeFilePath, truncatedCalibratedVolumeFilePath, maximumSlabSizeMb=0.2))
+    self.assertFalse(os.path.exists(truncatedCalibratedVolumeFilePath))
+    self.assertEqual(sorted(os.listdir(tempDir)), ['Calibrated.nrrd', 'CalibratedCompressed.nrrd', 'Measured.nrrd', 'MeasuredCompressed.nrrd', 'MeasuredTruncated.nrrd'])
+
+    for node in [measuredVolumeNode, calibratedVolumeNode, streamedVolumeNode, compressedStreamedVolumeNode]:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_PddLoading(self):
+    self.delayDisplay("Load PDD files of different formats",self.delayMs)
+    import tempfile
+
+    tempDir = tempfile.mkdtemp()
+    pddFileContents = { 'Legacy.csv': '100,0\n90,1.5\n50,3\n',
+                        'Header.csv': 'Depth (cm);PDD (%)\n0;100\n1.5;90\n3;50\n',
+                        'Tab.csv': '# Commissioning data\nDose\tDepth\n100\t0\n90\t1.5\n50\t3\n',
+                        'Malformed.csv': '100,0\n90,abc\n',
+                        'SingleColumn.csv': '100\n90\n' }
+    for fileName, content in pddFileContents.items():
+      with open(os.path.join(tempDir, fileName), 'w') as pddFile:
+        pddFile.write(content)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    expectedPdd = numpy.array([[0.0, 100.0], [1.5, 90.0], [3.0, 50.0]])
+    for fileName in ['Legacy.csv', 'Header.csv', 'Tab.csv']:
+      self.assertTrue(logic.loadPdd(os.path.join(tempDir, fileName)))
+      self.assertTrue(numpy.array_equal(logic.pddDataArray, expectedPdd))
+    for fileName in ['Malformed.csv', 'SingleColumn.csv', 'Missing.csv']:
+      self.assertFalse(logic.loadPdd(os.path.join(tempDir, fileName)))
+
+    # Loading the same file again uses the cache, which is not affected by changes of the loaded array
+    logic.pddDataArray[0, 1] = 0
+    otherLogic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    self.assertTrue(otherLogic.loadPdd(os.path.join(tempDir, 'Legacy.csv')))
+    self.assertTrue(numpy.array_equal(otherLogic.pddDataArray, expectedPdd))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_OutlierRemoval(self):
+    self.delayDisplay("Compare vectorized outlier removal to reference loop on noisy curves",self.delayMs)
+    import time
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    numpy.random.seed(0)
+    referenceTime = 0
+    vectorizedTime = 0
+    for curveIndex in range(2000):
+      # Decaying curve with noise and a random number of outliers at both ends
+      numberOfPoints = numpy.random.randint(20, 400)
+      x = numpy.linspace(0, 10, numberOfPoints)
+      y = 100.0 * numpy.exp(-0.2 * x) + numpy.random.normal(0, numpy.random.uniform(0.01, 2.0), numberOfPoints)
+      numberOfFirstOutliers, numberOfLastOutliers = numpy.random.randint(0, 10, 2)
+      y[:numberOfFirstOutliers] += numpy.random.uniform(-200, 200, numberOfFirstOutliers)
+      y[numberOfPoints-numberOfLastOutliers:] += numpy.random.uniform(-200, 200, numberOfLastOutliers)
+      curve = numpy.column_stack((x, y))
+
+      start = time.time()
+      [referenceArray, referenceNumberOfOutliers] = self.removeOutliersFromArrayReference(curve.copy(), 5, 10, 0.0075)
+      referenceTime += time.time() - start
+      start = time.time()
+      [cleanedArray, numberOfOutliers] = logic.removeOutliersFromArray(curve.copy(), 5, 10, 0.0075)
+      vectorizedTime += time.time() - start
+
+      self.assertTrue(numpy.array_equal(cleanedArray, referenceArray))
+      self.assertEqual(numberOfOutliers, referenceNumberOfOutliers)
+
+    # The timings of such short curves depend on the load of the machine, so they are only logged
+    logging.info('Outlier removal of 2000 curves: reference {0:.3f}s, vectorized {1:.3f}s'.format(referenceTime, vectorizedTime))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CalibrationFunctionArrays(self):
+    self.delayDisplay("Compare aligned calibration and OA vs dose arrays to reference implementation",self.delayMs)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    numpy.random.seed(0)
+    pddDepths = numpy.arange(0, 10.01, 0.1)
+    logic.pddDataArray = numpy.column_stack((pddDepths, 100.0 * numpy.exp(-((pddDepths - 2.5) / 2.0)**2)))
+    # Parsed CALIBRATION table (depth, mean, std.dev.) covering only part of the PDD depths
+    calibrationDepths = numpy.arange(0, 6.0, 0.2)
+    logic.calibrationDataCleanedArray = numpy.column_stack((calibrationDepths,
+      0.5 * numpy.exp(-((calibrationDepths - 1.3) / 2.0)**2) + numpy.random.normal(0, 0.01, calibrationDepths.shape[0]),
+      numpy.random.uniform(0, 0.05, calibrationDepths.shape[0]) ))
+    logic.computeDoseForMeasuredData(0.989, 1850)
+
+    # PDD rows out of the range of the aligned curve at both ends, with and without PDD range
+    for [xTrans, yScale, yTrans] in [[1.23, 180.0, -2.0], [0.0, 150.0, 0.5], [-0.35, 210.0, 1.0]]:
+      logic.createAlignedCalibrationArray(xTrans, yScale, yTrans)
+      [referenceAlignedArray, referenceAlignedToDisplayArray] = self.createAlignedCalibrationArrayReference(
+        logic.pddDataArray, logic.calibrationDataCleanedArray, xTrans, yScale, yTrans)
+      self.assertLess(logic.calibrationDataAlignedArray.shape[0], pddDepths.shape[0])
+      self.assertEqual(logic.calibrationDataAlignedArray.shape, referenceAlignedArray.shape)
+      self.assertTrue(numpy.allclose(logic.calibrationDataAlignedArray, referenceAlignedArray))
+      self.assertEqual(logic.calibrationDataAlignedToDisplayArray.shape, referenceAlignedToDisplayArray.shape)
+      self.assertTrue(numpy.allclose(logic.calibrationDataAlignedToDisplayArray, referenceAlignedToDisplayArray))
+
+      for [pddRangeMin, pddRangeMax] in [[-1000, 1000], [2.0, 4.5], [2.05, 100.0]]:
+        logic.createOpticalAttenuationVsDoseFunction(pddRangeMin, pddRangeMax)
+        referenceFunction = self.createOpticalAttenuationVsDoseFunctionReference(
+          logic.calculatedDose, logic.calibrationDataAlignedArray, pddRangeMin, pddRangeMax)
+        self.assertEqual(logic.opticalAttenuationVsDoseFunction.shape, referenceFunction.shape)
+        self.assertTrue(numpy.allclose(logic.opticalAttenuationVsDoseFunction, referenceFunction))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_AlignmentPreviewLatency(self):
+    self.delayDisplay("Check latency of updating aligned calibration curve during manual alignment",self.delayMs)
+    import time
+
+    # Dense PDD and calibration curve
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    pddDepths = numpy.linspace(0, 10, 50000)
+    logic.pddDataArray = numpy.column_stack((pddDepths, 100.0 * numpy.exp(-0.2 * pddDepths)))
+    calibrationDepths = numpy.linspace(0, 8, 2000)
+    logic.calibrationDataCleanedArray = numpy.column_stack((calibrationDepths, 0.5 * numpy.exp(-0.2 * calibrationDepths)))
+    logic.createAlignedCalibrationArray(1.0, 200.0, 0.0)
+
+    table = vtk.vtkTable()
+    for columnName in ['Depth (cm)', 'Aligned calibration data']:
+      column = vtk.vtkDoubleArray()
+      column.SetName(columnName)
+      table.AddColumn(column)
+    GelDosimetryAnalysisSlicelet.updateTableFromArray(table, logic.calibrationDataAlignedToDisplayArray)
+
+    # Changing only the Y parameters updates the display array in place
+    displayArray = logic.calibrationDataAlignedToDisplayArray
+    self.assertFalse(logic.updateAlignedCalibrationArray(1.0, 250.0, 0.0))
+    self.assertIs(logic.calibrationDataAlignedToDisplayArray, displayArray)
+
+    # Simulate dragging the Y scale and the X shift spinboxes
+    updateTimes = []
+    for step in range(100):
+      for [xTrans, yScale] in [[1.0, 200.0 + step], [1.0 + step * 0.01, 300.0]]:
+        start = time.time()
+        logic.updateAlignedCalibrationArray(xTrans, yScale, 0.5)
+        GelDosimetryAnalysisSlicelet.updateTableFromArray(table, logic.calibrationDataAlignedToDisplayArray)
+        updateTimes.append(time.time() - start)
+
+    expectedValues = numpy.interp(table.GetColumn(0).GetValue(0), calibrationDepths + 1.99, logic.calibrationDataCleanedArray[:,1]) * 300.0 + 0.5
+    self.assertAlmostEqual(table.GetColumn(1).GetValue(0), expectedValues)
+    # The latency depends on the load of the machine, so it is only logged
+    logging.info('Alignment preview update: median {0:.2f}ms, mean {1:.2f}ms, max {2:.2f}ms'.format(
+      numpy.median(updateTimes)*1000, numpy.mean(updateTimes)*1000, numpy.max(updateTimes)*1000))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_ChartTableDecimation(self):
+    self.delayDisplay("Create chart tables from arrays with and without decimation",self.delayMs)
+    from vtk.util import numpy_support
+
+    numpy.random.seed(0)
+    x = numpy.linspace(0, 10, 100000)
+    curve = numpy.column_stack((x, numpy.sin(x) + numpy.random.normal(0, 0.1, x.shape[0])))
+
+    table = GelDosimetryAnalysisSlicelet.createTableFromArray(['X', 'Y'], curve)
+    self.assertEqual(table.GetNumberOfRows(), curve.shape[0])
+    self.assertTrue(numpy.array_equal(numpy_support.vtk_to_numpy(table.GetColumnByName('Y')), curve[:,1]))
+
+    maximumNumberOfPoints = GelDosimetryAnalysisSlicelet.chartMaximumNumberOfPoints
+    decimatedTable = GelDosimetryAnalysisSlicelet.createTableFromArray(['X', 'Y'], curve, maximumNumberOfPoints)
+    decimatedX = numpy_support.vtk_to_numpy(decimatedTable.GetColumnByName('X'))
+    decimatedY = numpy_support.vtk_to_numpy(decimatedTable.GetColumnByName('Y'))
+    self.assertLessEqual(decimatedTable.GetNumberOfRows(), maximumNumberOfPoints)
+    # Extent and extremes of the curve are kept, and the points are in the original order
+    self.assertEqual([decimatedX[0], decimatedX[-1]], [x[0], x[-1]])
+    self.assertEqual([decimatedY.min(), decimatedY.max()], [curve[:,1].min(), curve[:,1].max()])
+    self.assertTrue(numpy.all(numpy.diff(decimatedX) > 0))
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CentralCylinderCache(self):
+    self.delayDisplay("Check on-disk cache of central cylinder parsing",self.delayMs)
+    import tempfile
+
+    cacheDirectory = tempfile.mkdtemp()
+    numpy.random.seed(0)
+    calibrationVolumeNode = self.createSyntheticVolumeNode([40,40,20], [1.0,1.0,2.0], numpy.random.rand(20,40,40) * 100.0)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.centralCylinderCacheDirectory = cacheDirectory
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    self.assertEqual(len(os.listdir(cacheDirectory)), 1)
+
+    # A new logic (e.g. after restart) gets the table from the cache without parsing the volume
+    cachedLogic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    cachedLogic.centralCylinderCacheDirectory = cacheDirectory
+    cachedLogic.showBusyCursor = False # Parsing may raise exception in this test
+    def failParsing(*args):
+      raise Exception('Central cylinder is parsed instead of using the cache')
+    cachedLogic.computeOpticalAttenuationOfCentralCylinderTable = failParsing
+    self.assertTrue(cachedLogic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    self.assertTrue(numpy.array_equal(cachedLogic.calibrationDataArray, logic.calibrationDataArray))
+
+    # Different radius or voxels result in new cache entries, and the least recently used ones are evicted
+    logic.centralCylinderCacheMaximumSizeMb = 1.5 * os.path.getsize(os.path.join(cacheDirectory, os.listdir(cacheDirectory)[0])) / (1024.0 * 1024.0)
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 3.0))
+    slicer.util.arrayFromVolume(calibrationVolumeNode)[0,0,0] += 1.0
+    calibrationVolumeNode.GetImageData().Modified()
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 3.0))
+    self.assertEqual(len(os.listdir(cacheDirectory)), 1)
+    self.assertRaises(Exception, cachedLogic.getMeanOpticalAttenuationOfCentralCylinder, calibrationVolumeNode.GetID(), 5.0)
+
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CentralCylinderCacheKey(self):
+    self.delayDisplay("Check that the central cylinder cache distinguishes the parsing settings",self.delayMs)
+    import tempfile
+
+    cacheDirectory = tempfile.mkdtemp()
+    numpy.random.seed(0)
+    calibrationVolumeNode = self.createSyntheticVolumeNode([40,40,20], [1.0,1.0,2.0], numpy.random.rand(20,40,40) * 100.0)
+
+    # Axis tracking, its threshold and the depth range all result in new cache entries
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.centralCylinderCacheDirectory = cacheDirectory
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    logic.trackCentralCylinderAxis = True
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    logic.centralCylinderAxisThreshold = 50.0
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    trackedTable = logic.calibrationDataArray
+    trackedCenters = logic.centralCylinderCenters
+    logic.calibrationVolumeParsingDepthRangeCm = [1.0, 2.0]
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    self.assertEqual(len(os.listdir(cacheDirectory)), 4)
+
+    # Cylinder centers of the tracked axis are restored from the cache
+    cachedLogic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    cachedLogic.centralCylinderCacheDirectory = cacheDirectory
+    cachedLogic.showBusyCursor = False # Parsing may raise exception in this test
+    cachedLogic.trackCentralCylinderAxis = True
+    cachedLogic.centralCylinderAxisThreshold = 50.0
+    def failParsing(*args):
+      raise Exception('Central cylinder is parsed instead of using the cache')
+    cachedLogic.computeCentralCylinderCenters = failParsing
+    cachedLogic.computeOpticalAttenuationOfCentralCylinderTableForCenters = failParsing
+    self.assertTrue(cachedLogic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    self.assertTrue(numpy.array_equal(cachedLogic.calibrationDataArray, trackedTable))
+    self.assertTrue(numpy.array_equal(cachedLogic.centralCylinderCenters, trackedCenters))
+
+    # Volumes loaded from the same unchanged file share the cache entry without hashing the voxels
+    volumeFilePath = os.path.join(tempfile.mkdtemp(), 'Calibration.nrrd')
+    self.assertTrue(slicer.util.saveNode(calibrationVolumeNode, volumeFilePath))
+    loadedVolumeNode = slicer.util.loadVolume(volumeFilePath)
+    self.assertIsNotNone(cachedLogic.getCentralCylinderCacheVolumeFileKey(loadedVolumeNode))
+    logic.calibrationVolumeParsingDepthRangeCm = None
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(loadedVolumeNode.GetID(), 5.0))
+    reloadedVolumeNode = slicer.util.loadVolume(volumeFilePath)
+    self.assertTrue(cachedLogic.getMeanOpticalAttenuationOfCentralCylinder(reloadedVolumeNode.GetID(), 5.0))
+    self.assertTrue(numpy.array_equal(cachedLogic.calibrationDataArray, logic.calibrationDataArray))
+
+    # Voxels are hashed once the volume is modified
+    slicer.util.arrayFromVolume(reloadedVolumeNode)[0,0,0] += 1.0
+    reloadedVolumeNode.GetImageData().Modified()
+    self.assertIsNone(cachedLogic.getCentralCylinderCacheVolumeFileKey(reloadedVolumeNode))
+    self.assertRaises(Exception, cachedLogic.getMeanOpticalAttenuationOfCentralCylinder, reloadedVolumeNode.GetID(), 5.0)
+
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+    slicer.mrmlScene.RemoveNode(loadedVolumeNode)
+    slicer.mrmlScene.RemoveNode(reloadedVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CentralCylinderRadii(self):
+    self.delayDisplay("Check central cylinder parsing for multiple radii in one pass",self.delayMs)
+
+    numpy.random.seed(0)
+    voxelValues = numpy.random.rand(12,31,30) * 100.0
+    calibrationVolumeNode = self.createSyntheticVolumeNode([30,31,12], [0.5,0.5,2.0], voxelValues)
+    imageArray = numpy.transpose(voxelValues, (2,1,0))
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    self.assertTrue(logic.computeMeanOpticalAttenuationOfCentralCylinderForRadii(calibrationVolumeNode.GetID(), 6.0))
+    self.assertEqual(logic.centralCylinderRadiusTables.shape, (13,12,3))
+
+    # Table of each radius matches the single radius parsing
+    for radiusPixel in range(1,13):
+      self.assertTrue(logic.selectCentralCylinderRadius(calibrationVolumeNode.GetID(), radiusPixel * 0.5))
+      referenceTable = self.computeCentralCylinderTableReference(imageArray, radiusPixel, 0.2)
+      self.assertTrue(numpy.allclose(logic.calibrationDataArray, referenceTable))
+
+    # Larger radius or modified volume need parsing again
+    self.assertFalse(logic.selectCentralCylinderRadius(calibrationVolumeNode.GetID(), 7.0))
+    calibrationVolumeNode.GetImageData().Modified()
+    self.assertFalse(logic.selectCentralCylinderRadius(calibrationVolumeNode.GetID(), 3.0))
+
+    radiusSensitivityArray = logic.getCentralCylinderRadiusSensitivity()
+    self.assertEqual(list(radiusSensitivityArray[:,0]), [0.5 * radiusPixel for radiusPixel in range(1,13)])
+    self.assertEqual(radiusSensitivityArray[-1,2], 0)
+
+    # Std.dev. is accurate for small variation on a large offset
+    offsetImageArray = 1.0e6 + imageArray * 1.0e-4
+    offsetTables = logic.computeOpticalAttenuationOfCentralCylinderTablesForRadii(offsetImageArray, 14.5, 15.0, 12, 0.2)
+    distanceOfX = numpy.abs(numpy.arange(30) - 14.5)[:, numpy.newaxis]
+    distanceOfY = numpy.abs(numpy.arange(31) - 15.0)[numpy.newaxis, :]
+    for radiusPixel in range(1,13):
+      diskMask = ((distanceOfX + distanceOfY) <= radiusPixel) | ((distanceOfX**2 + distanceOfY**2) <= radiusPixel**2)
+      self.assertTrue(numpy.allclose(offsetTables[radiusPixel,:,2], numpy.std(offsetImageArray[diskMask], axis=0)[::-1], rtol=1e-6, atol=0))
+
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CentralCylinderAxisTracking(self):
+    self.delayDisplay("Check central cylinder parsing around the tracked vial axis",self.delayMs)
+
+    # Tilted vial with optical attenuation increasing with z, surrounded by background of zero
+    numpy.random.seed(0)
+    numberOfSlices = 20
+    vialCenters = numpy.column_stack((15.0 + 0.5 * numpy.arange(numberOfSlices), 25.0 - 0.25 * numpy.arange(numberOfSlices)))
+    x, y = numpy.meshgrid(numpy.arange(40), numpy.arange(42), indexing='ij')
+    imageArray = numpy.zeros((40,42,numberOfSlices))
+    for z in range(numberOfSlices):
+      vialMask = (x - vialCenters[z,0])**2 + (y - vialCenters[z,1])**2 <= 8**2
+      imageArray[:,:,z] = vialMask * (1.0 + 0.1 * z + numpy.random.rand(40,42) * 0.01)
+    calibrationVolumeNode = self.createSyntheticVolumeNode([40,42,numberOfSlices], [1.0,1.0,2.0], numpy.transpose(imageArray, (2,1,0)))
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.useCentralCylinderCache = False
+    logic.trackCentralCylinderAxis = True
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 5.0))
+    self.assertTrue(numpy.allclose(logic.centralCylinderCenters, vialCenters, atol=0.1))
+
+    # Each slice is parsed around its own center, so the background is not averaged in
+    for z in range(numberOfSlices):
+      referenceTable = logic.computeOpticalAttenuationOfCentralCylinderTable(imageArray[:,:,z:z+1],
+        logic.centralCylinderCenters[z,0], logic.centralCylinderCenters[z,1], 5, 0.2)
+      self.assertTrue(numpy.allclose(logic.calibrationDataArray[numberOfSlices-z-1,1:], referenceTable[0,1:]))
+    self.assertTrue(numpy.all(numpy.abs(logic.calibrationDataArray[::-1,1] - (1.0 + 0.1 * numpy.arange(numberOfSlices))) < 0.01))
+
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_CroppedCalibrationParsing(self):
+    self.delayDisplay("Check parsing of the calibration volume in a depth range and ROI",self.delayMs)
+
+    numpy.random.seed(0)
+    voxelValues = numpy.random.rand(40,32,30) * 100.0
+    calibrationVolumeNode = self.createSyntheticVolumeNode([30,32,40], [1.0,1.0,2.0], voxelValues)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.useCentralCylinderCache = False
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 4.0))
+    fullTable = logic.calibrationDataArray
+
+    # Rows in the depth range are the same as when parsing the whole volume, including the depth
+    logic.calibrationVolumeParsingDepthRangeCm = [1.0, 3.0]
+    self.assertEqual(logic.getCalibrationVolumeParsingSubExtent(calibrationVolumeNode), [0,29,0,31,24,34])
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 4.0))
+    self.assertTrue(numpy.allclose(logic.calibrationDataArray, fullTable[5:16]))
+
+    # Cylinder is centered in the ROI
+    roiNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLAnnotationROINode')
+    roiNode.SetXYZ(13.0, 16.0, 50.0)
+    roiNode.SetRadiusXYZ(7.5, 12.5, 100.0)
+    logic.calibrationVolumeParsingRoiNodeID = roiNode.GetID()
+    self.assertEqual(logic.getCalibrationVolumeParsingSubExtent(calibrationVolumeNode), [6,20,4,28,24,34])
+    self.assertTrue(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 4.0))
+    referenceTable = self.computeCentralCylinderTableReference(numpy.transpose(voxelValues, (2,1,0))[6:21,4:29,24:35], 4, 0.2)
+    self.assertTrue(numpy.allclose(logic.calibrationDataArray[:,1:], referenceTable[:,1:]))
+
+    # Empty region
+    logic.calibrationVolumeParsingDepthRangeCm = [100.0, 200.0]
+    self.assertFalse(logic.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), 4.0))
+
+    slicer.mrmlScene.RemoveNode(roiNode)
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_LandmarkRegistration(self):
+    self.delayDisplay("Check in-process landmark registration",self.delayMs)
+
+    # Fixed fiducials are the moving ones rotated by 30 degrees around S and translated, plus noise on the last one
+    angle = numpy.radians(30.0)
+    rotation = numpy.array([[numpy.cos(angle), -numpy.sin(angle), 0], [numpy.sin(angle), numpy.cos(angle), 0], [0, 0, 1]])
+    translation = numpy.array([10.0, -20.0, 5.0])
+    movingPoints = numpy.array([[0,0,0], [50,0,0], [0,40,0], [0,0,30], [25,25,25]], dtype=numpy.float64)
+    fixedPoints = movingPoints.dot(rotation.T) + translation
+    movingFiducialsNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMarkupsFiducialNode')
+    fixedFiducialsNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLMarkupsFiducialNode')
+    for movingPoint, fixedPoint in zip(movingPoints, fixedPoints):
+      movingFiducialsNode.AddFiducial(*movingPoint)
+      fixedFiducialsNode.AddFiducial(*fixedPoint)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    transformNode, errorRms, residuals = logic.registerLandmarks(movingFiducialsNode.GetID(), fixedFiducialsNode.GetID(), 'LandmarkRegistrationTest')
+    self.assertTrue(numpy.allclose(slicer.util.arrayFromTransformMatrix(transformNode)[0:3,0:3], rotation))
+    self.assertTrue(numpy.allclose(slicer.util.arrayFromTransformMatrix(transformNode)[0:3,3], translation))
+    self.assertAlmostEqual(errorRms, 0.0, 6)
+    self.assertEqual(movingFiducialsNode.GetTransformNodeID(), transformNode.GetID())
+
+    # Registering again (e.g. while a fiducial is moved) uses the untransformed moving fiducials
+    fixedFiducialsNode.SetNthFiducialPosition(4, *(fixedPoints[4] + [0, 0, 2.0]))
+    transformNode, errorRms, residuals = logic.registerLandmarks(movingFiducialsNode.GetID(), fixedFiducialsNode.GetID(), 'LandmarkRegistrationTest')
+    self.assertEqual(len(residuals), 5)
+    self.assertEqual(numpy.argmax(residuals), 4)
+    self.assertAlmostEqual(errorRms, numpy.sqrt((residuals**2).mean()))
+
+    # Not enough fiducial pairs
+    movingFiducialsNode.RemoveMarkup(4)
+    self.assertIsNone(logic.registerLandmarks(movingFiducialsNode.GetID(), fixedFiducialsNode.GetID(), 'LandmarkRegistrationTest'))
+
+    slicer.mrmlScene.RemoveNode(transformNode)
+    slicer.mrmlScene.RemoveNode(movingFiducialsNode)
+    slicer.mrmlScene.RemoveNode(fixedFiducialsNode)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_NativeGamma(self):
+    self.delayDisplay("Check native gamma engine against brute force gamma",self.delayMs)
+
+    # Evaluated dose is the reference dose shifted by one voxel along I and scaled, so that part of the voxels fail
+    spacing = [1.5, 1.0, 2.0]
+    k, j, i = numpy.mgrid[0:8, 0:10, 0:12]
+    referenceDoseKJI = 2.0 * numpy.exp(-((i-5.5)**2/12.0 + (j-4.5)**2/8.0 + (k-3.5)**2/6.0))
+    evaluatedDoseKJI = 1.04 * numpy.roll(referenceDoseKJI, 1, axis=2)
+    referenceDoseVolumeNode = self.createSyntheticVolumeNode([12,10,8], spacing, referenceDoseKJI)
+    evaluatedDoseVolumeNode = self.createSyntheticVolumeNode([12,10,8], spacing, evaluatedDoseKJI)
+    gammaVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.showBusyCursor = False
+    parameters = { 'engine': 'native', 'dtaDistanceToleranceMm': 2.0, 'doseDifferenceTolerancePercent': 3.0,
+      'analysisThresholdPercent': 10.0, 'maximumGamma': 2.0 }
+    results = logic.computeGammaDoseComparison(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, parameters=parameters)
+    self.assertTrue(results.GetResultsValid())
+    self.assertEqual(results.GetGammaVolumeNode(), gammaVolumeNode)
+
+    gammaReferenceKJI = self.computeGammaReference(referenceDoseKJI, evaluatedDoseKJI, spacing, 2.0, 3.0, 10.0, 2.0)
+    gammaKJI = slicer.util.arrayFromVolume(gammaVolumeNode)
+    self.assertTrue(numpy.allclose(gammaKJI, gammaReferenceKJI, atol=1e-4))
+    analyzed = referenceDoseKJI >= 0.1 * referenceDoseKJI.max()
+    self.assertAlmostEqual(results.GetPassFractionPercent(), 100.0 * (gammaReferenceKJI[analyzed] <= 1.0).mean(), 3)
+    self.assertTrue(numpy.allclose(gammaVolumeNode.GetSpacing(), spacing))
+
+    # Only the voxels in the mask are analyzed
+    maskVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode')
+    maskVolumeNode.CopyOrientation(referenceDoseVolumeNode)
+    maskImageData = vtk.vtkImageData()
+    maskImageData.SetDimensions(12,10,8)
+    maskImageData.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
+    maskVolumeNode.SetAndObserveImageData(maskImageData)
+    maskKJI = (i < 6).astype(numpy.uint8)
+    slicer.util.updateVolumeFromArray(maskVolumeNode, maskKJI)
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    self.assertTrue(algoLogic.ComputeGammaDoseDifference(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskVolumeNode, 2.0, 3.0, 0.0, 10.0, 2.0))
+    gammaKJI = slicer.util.arrayFromVolume(gammaVolumeNode)
+    self.assertTrue(numpy.all(gammaKJI[maskKJI == 0] == 0))
+    self.assertTrue(numpy.allclose(gammaKJI[maskKJI > 0], gammaReferenceKJI[maskKJI > 0], atol=1e-4))
+    self.assertEqual(algoLogic.GetNumberOfGammaVoxelsAnalyzed(), numpy.count_nonzero(analyzed & (maskKJI > 0)))
+
+    for node in [referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskVolumeNode]:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_GammaCriteriaSweep(self):
+    self.delayDisplay("Check gamma criteria sweep",self.delayMs)
+
+    spacing = [1.0, 1.0, 1.5]
+    k, j, i = numpy.mgrid[0:10, 0:14, 0:14]
+    referenceDoseKJI = 2.0 * numpy.exp(-((i-6.5)**2/15.0 + (j-6.5)**2/15.0 + (k-4.5)**2/8.0))
+    evaluatedDoseKJI = 0.97 * numpy.roll(referenceDoseKJI, 1, axis=1)
+    referenceDoseVolumeNode = self.createSyntheticVolumeNode([14,14,10], spacing, referenceDoseKJI)
+    evaluatedDoseVolumeNode = self.createSyntheticVolumeNode([14,14,10], spacing, evaluatedDoseKJI)
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.showBusyCursor = False
+    parameters = { 'analysisThresholdPercent': 10.0, 'maximumGamma': 2.0 }
+    sweepResults = logic.computeGammaDoseComparisonSweep(referenceDoseVolumeNode, evaluatedDoseVolumeNode, parameters=parameters, createGammaVolumes=True)
+    self.assertEqual(len(sweepResults), len(logic.gammaSweepDefaultCriteria))
+
+    # Each criterion matches the brute force gamma, and the pass rates are ordered by strictness
+    analyzed = referenceDoseKJI >= 0.1 * referenceDoseKJI.max()
+    for result in sweepResults:
+      gammaReferenceKJI = self.computeGammaReference(referenceDoseKJI, evaluatedDoseKJI, spacing,
+        result['dtaDistanceToleranceMm'], result['doseDifferenceTolerancePercent'], 10.0, 2.0)
+      self.assertTrue(numpy.allclose(slicer.util.arrayFromVolume(result['gammaVolumeNode']), gammaReferenceKJI, atol=1e-4))
+      self.assertAlmostEqual(result['passFractionPercent'], 100.0 * (gammaReferenceKJI[analyzed] <= 1.0).mean(), 3)
+    passFractions = dict([((result['dtaDistanceToleranceMm'], result['doseDifferenceTolerancePercent']), result['passFractionPercent']) for result in sweepResults])
+    self.assertGreaterEqual(passFractions[(3.0, 3.0)], passFractions[(2.0, 3.0)])
+    self.assertGreaterEqual(passFractions[(2.0, 3.0)], passFractions[(2.0, 2.0)])
+    self.assertGreaterEqual(passFractions[(2.0, 2.0)], passFractions[(1.0, 1.0)])
+
+    for node in [referenceDoseVolumeNode, evaluatedDoseVolumeNode] + [result['gammaVolumeNode'] for result in sweepResults]:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_GammaPassFractionOnly(self):
+    self.delayDisplay("Check gamma pass fraction computed without gamma volume",self.delayMs)
+
+    spacing = [1.0, 1.0, 1.5]
+    k, j, i = numpy.mgrid[0:10, 0:14, 0:14]
+    referenceDoseKJI = 2.0 * numpy.exp(-((i-6.5)**2/15.0 + (j-6.5)**2/15.0 + (k-4.5)**2/8.0))
+    evaluatedDoseKJI = 1.05 * numpy.roll(referenceDoseKJI, 2, axis=2)
+    referenceDoseVolumeNode = self.createSyntheticVolumeNode([14,14,10], spacing, referenceDoseKJI)
+    evaluatedDoseVolumeNode = self.createSyntheticVolumeNode([14,14,10], spacing, evaluatedDoseKJI)
+    numberOfVolumeNodes = slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLScalarVolumeNode')
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    parameters = { 'dtaDistanceToleranceMm': 2.0, 'doseDifferenceTolerancePercent': 2.0, 'analysisThresholdPercent': 10.0, 'maximumGamma': 2.0 }
+    passRateResults = logic.computeGammaPassFraction(referenceDoseVolumeNode, evaluatedDoseVolumeNode, parameters=parameters, histogramBinWidth=0.25)
+    self.assertIsNotNone(passRateResults)
+    self.assertEqual(slicer.mrmlScene.GetNumberOfNodesByClass('vtkMRMLScalarVolumeNode'), numberOfVolumeNodes)
+
+    # Pass fraction and histogram match the brute force gamma. The first bin contains the passed voxels
+    gammaReferenceKJI = self.computeGammaReference(referenceDoseKJI, evaluatedDoseKJI, spacing, 2.0, 2.0, 10.0, 2.0)
+    analyzedGamma = gammaReferenceKJI[referenceDoseKJI >= 0.1 * referenceDoseKJI.max()]
+    self.assertEqual(passRateResults['numberOfAnalyzedVoxels'], analyzedGamma.size)
+    self.assertAlmostEqual(passRateResults['passFractionPercent'], 100.0 * (analyzedGamma <= 1.0).mean(), 3)
+    self.assertEqual(passRateResults['histogramBinEdges'], [0.0, 1.0, 1.25, 1.5, 1.75, 2.0])
+    referenceCounts = [(analyzedGamma <= 1.0).sum()] + [((analyzedGamma > lower + 1e-4) & (analyzedGamma <= upper + 1e-4)).sum()
+      for lower, upper in zip(passRateResults['histogramBinEdges'][1:-1], passRateResults['histogramBinEdges'][2:])]
+    self.assertEqual(passRateResults['histogramCounts'], [int(count) for count in referenceCounts])
+
+    for node in [referenceDoseVolumeNode, evaluatedDoseVolumeNode]:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_GammaMaskCropping(self):
+    self.delayDisplay("Check gamma computed in the mask bounding box only",self.delayMs)
+
+    # The mask covers a small part of the dose grid, as the gel in the plan dose
+    spacing = [1.0, 1.0, 1.5]
+    k, j, i = numpy.mgrid[0:20, 0:30, 0:30]
+    referenceDoseKJI = 2.0 * numpy.exp(-((i-14.5)**2/40.0 + (j-14.5)**2/40.0 + (k-9.5)**2/20.0))
+    evaluatedDoseKJI = 0.97 * numpy.roll(referenceDoseKJI, 1, axis=1)
+    maskKJI = ((k >= 6) & (k < 12) & (j >= 10) & (j < 17) & (i >= 11) & (i < 19)).astype(numpy.uint8)
+    referenceDoseVolumeNode = self.createSyntheticVolumeNode([30,30,20], spacing, referenceDoseKJI)
+    evaluatedDoseVolumeNode = self.createSyntheticVolumeNode([30,30,20], spacing, evaluatedDoseKJI)
+    maskVolumeNode = self.createSyntheticVolumeNode([30,30,20], spacing, maskKJI, vtk.VTK_UNSIGNED_CHAR)
+    gammaVolumeNodes = [slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode') for index in range(2)]
+
+    # Cropping does not change the gamma values, the pass fraction or the reference dose
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    gammaResults = []
+    for cropGammaToMask, gammaVolumeNode in zip([False, True], gammaVolumeNodes):
+      algoLogic.SetCropGammaToMask(cropGammaToMask)
+      self.assertTrue(algoLogic.ComputeGammaDoseDifference(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskVolumeNode, 2.0, 2.0, 0.0, 10.0, 2.0))
+      gammaResults.append((algoLogic.GetGammaPassFractionPercent(), algoLogic.GetNumberOfGammaVoxelsAnalyzed(), algoLogic.GetGammaReferenceDoseGy()))
+    algoLogic.SetCropGammaToMask(True)
+    self.assertEqual(gammaResults[0], gammaResults[1])
+    self.assertAlmostEqual(gammaResults[1][2], referenceDoseKJI.max(), 5)
+    self.assertEqual(list(gammaVolumeNodes[1].GetImageData().GetDimensions()), [30,30,20])
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(gammaVolumeNodes[0]), slicer.util.arrayFromVolume(gammaVolumeNodes[1])))
+
+    # The reference dose cropped for the SlicerRT engine keeps its physical position, and pasting restores the region
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    cropSlices = (slice(3, 15), slice(6, 21), slice(7, 23))
+    croppedVolumeNode = logic.createCroppedVolume(referenceDoseVolumeNode, cropSlices)
+    expectedCroppedKJI = slicer.util.arrayFromVolume(referenceDoseVolumeNode)[cropSlices]
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(croppedVolumeNode), expectedCroppedKJI))
+    referenceIjkToRas = vtk.vtkMatrix4x4()
+    referenceDoseVolumeNode.GetIJKToRASMatrix(referenceIjkToRas)
+    self.assertTrue(numpy.allclose(croppedVolumeNode.GetOrigin(), referenceIjkToRas.MultiplyPoint([7, 6, 3, 1])[0:3]))
+    logic.pasteCroppedVolume(croppedVolumeNode, referenceDoseVolumeNode, cropSlices)
+    expectedPastedKJI = numpy.zeros(referenceDoseKJI.shape, dtype=expectedCroppedKJI.dtype)
+    expectedPastedKJI[cropSlices] = expectedCroppedKJI
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(croppedVolumeNode), expectedPastedKJI))
+    self.assertTrue(numpy.allclose(croppedVolumeNode.GetOrigin(), referenceDoseVolumeNode.GetOrigin()))
+
+    for node in [referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode, croppedVolumeNode] + gammaVolumeNodes:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def test_GelDosimetryAnalysis_BackgroundGamma(self):
+    self.delayDisplay("Check gamma computation in a background thread",self.delayMs)
+
+    spacing = [1.0, 1.0, 1.0]
+    k, j, i = numpy.mgrid[0:40, 0:60, 0:60]
+    referenceDoseKJI = 2.0 * numpy.exp(-((i-29.5)**2/200.0 + (j-29.5)**2/200.0 + (k-19.5)**2/100.0))
+    evaluatedDoseKJI = 1.03 * numpy.roll(referenceDoseKJI, 2, axis=2)
+    referenceDoseVolumeNode = self.createSyntheticVolumeNode([60,60,40], spacing, referenceDoseKJI)
+    evaluatedDoseVolumeNode = self.createSyntheticVolumeNode([60,60,40], spacing, evaluatedDoseKJI)
+    gammaVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+    synchronousGammaVolumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+
+    logic = GelDosimetryAnalysisLogic.GelDosimetryAnalysisLogic()
+    logic.showBusyCursor = False
+    parameters = { 'engine': 'native', 'dtaDistanceToleranceMm': 3.0, 'doseDifferenceTolerancePercent': 3.0,
+      'analysisThresholdPercent': 10.0, 'maximumGamma': 2.0 }
+
+    # A canceled computation leaves the gamma volume untouched
+    completedStatuses = []
+    gammaFuture = logic.computeGammaDoseComparisonNativeAsync(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode,
+      parameters=parameters, completedCallback=lambda future: completedStatuses.append(future.status))
+    self.assertFalse(gammaFuture.done())
+    self.assertTrue(gammaFuture.cancel())
+    self.assertFalse(gammaFuture.wait())
+    self.assertEqual(gammaFuture.status, 'cancelled')
+    self.assertEqual(completedStatuses, ['cancelled'])
+    self.assertIsNone(gammaFuture.result())
+    self.assertIsNone(gammaVolumeNode.GetImageData())
+    self.assertFalse(slicer.modules.geldosimetryanalysisalgo.logic().IsGammaDoseDifferenceRunning())
+
+    # A completed computation gives the same results as the synchronous computation, which can run meanwhile.
+    # Modifying the volumes after starting the computation does not affect it
+    progressValues = []
+    gammaFuture = logic.computeGammaDoseComparisonNativeAsync(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode,
+      parameters=parameters, progressCallback=progressValues.append)
+    synchronousResults = logic.computeGammaDoseComparison(referenceDoseVolumeNode, evaluatedDoseVolumeNode, synchronousGammaVolumeNode, parameters=parameters)
+    self.assertTrue(synchronousResults.GetResultsValid())
+    for doseVolumeNode in [referenceDoseVolumeNode, evaluatedDoseVolumeNode]:
+      slicer.util.arrayFromVolume(doseVolumeNode)[:] = 0.0
+      slicer.util.arrayFromVolumeModified(doseVolumeNode)
+    self.assertTrue(gammaFuture.wait())
+    self.assertTrue(all([0.0 <= progress <= 1.0 for progress in progressValues]))
+    self.assertEqual(gammaFuture.result().GetPassFractionPercent(), synchronousResults.GetPassFractionPercent())
+    self.assertTrue(numpy.array_equal(slicer.util.arrayFromVolume(gammaVolumeNode), slicer.util.arrayFromVolume(synchronousGammaVolumeNode)))
+
+    for node in [referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, synchronousGammaVolumeNode]:
+      slicer.mrmlScene.RemoveNode(node)
+
+  #------------------------------------------------------------------------------
+  def createSyntheticVolumeNode(self, dimensions, spacing, voxelValuesKJI, scalarType=vtk.VTK_FLOAT):
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(dimensions)
+    imageData.AllocateScalars(scalarType, 1)
+    volumeNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLScalarVolumeNode')
+    volumeNode.SetSpacing(spacing)
+    volumeNode.SetAndObserveImageData(imageData)
+    slicer.util.updateVolumeFromArray(volumeNode, voxelValuesKJI.astype(slicer.util.arrayFromVolume(volumeNode).dtype))
+    return volumeNode
+
+  #------------------------------------------------------------------------------
+  def createSyntheticGelDataset(self, directory):
+    # Write PDD, CALIBRATION and MEASURED volume files of a gel dataset, for which the CALIBRATION data is aligned
+    # to the PDD by xTrans=1.2, yScale=150, yTrans=-2, and the MEASURED volume has uniform optical attenuation of 0.4
+    # Returns manifest entry of the dataset
+    numpy.random.seed(0)
+    pddDepths = numpy.arange(0, 12.01, 0.1)
+    pddDoses = 100.0 * numpy.exp(-((pddDepths - 2.5) / 1.8)**2)
+    pddFilePath = os.path.join(directory, 'Pdd.csv')
+    with open(pddFilePath, 'w') as pddFile:
+      pddFile.write('Depth (cm);PDD (%)\n')
+      for [depth, dose] in zip(pddDepths, pddDoses):
+        pddFile.write('{0!r};{1!r}\n'.format(depth, dose))
+
+    # Depth of a slice is measured from the last slice
+    numberOfSlices = 50
+    sliceDepths = (numberOfSlices - 1 - numpy.arange(numberOfSlices)) * 0.2
+    sliceOpticalAttenuations = (numpy.interp(sliceDepths + 1.2, pddDepths, pddDoses) + 2.0) / 150.0
+    calibrationVolumeNode = self.createSyntheticVolumeNode([16,16,numberOfSlices], [1.0,1.0,2.0],
+      sliceOpticalAttenuations[:, numpy.newaxis, numpy.newaxis] + numpy.random.normal(0, 0.001, [numberOfSlices,16,16]))
+    measuredVolumeNode = self.createSyntheticVolumeNode([10,10,5], [1.0,1.0,2.0], numpy.full([5,10,10], 0.4))
+
+    manifestEntry = { 'pddFilePath': pddFilePath,
+                      'calibrationVolumeFilePath': os.path.join(directory, 'Calibration.nrrd'),
+                      'measuredVolumeFilePath': os.path.join(directory, 'Measured.nrrd') }
+    self.assertTrue(slicer.util.saveNode(calibrationVolumeNode, manifestEntry['calibrationVolumeFilePath']))
+    self.assertTrue(slicer.util.saveNode(measuredVolumeNode, manifestEntry['measuredVolumeFilePath']))
+    slicer.mrmlScene.RemoveNode(calibrationVolumeNode)
+    slicer.mrmlScene.RemoveNode(measuredVolumeNode)
+    return manifestEntry
+
+  #------------------------------------------------------------------------------
+  def computeGammaReference(self, referenceDoseKJI, evaluatedDoseKJI, spacingIJK, dtaMm, doseDifferencePercent, analysisThresholdPercent, maximumGamma):
+    # Global gamma searching all evaluated voxels closer than DTA * maximum gamma, used as reference
+    doseDifferenceGy = doseDifferencePercent / 100.0 * referenceDoseKJI.max()
+    bestGammaSquared = numpy.full(referenceDoseKJI.shape, maximumGamma**2)
+    radius = [int(numpy.floor(dtaMm * maximumGamma / spacing)) for spacing in reversed(spacingIJK)]
+    for offset in numpy.ndindex(*[2*r+1 for r in radius]):
+      offset = [o - r for o, r in zip(offset, radius)]
+      distanceTerm = sum([(o * spacing)**2 for o, spacing in zip(offset, reversed(spacingIJK))]) / dtaMm**2
+      targetSlices = tuple([slice(max(0, -o), min(n, n - o)) for o, n in zip(offset, referenceDoseKJI.shape)])
+      sourceSlices = tuple([slice(max(0, o), min(n, n + o)) for o, n in zip(offset, referenceDoseKJI.shape)])
+      gammaSquared = distanceTerm + ((evaluatedDoseKJI[sourceSlices] - referenceDoseKJI[targetSlices]) / doseDifferenceGy)**2
+      bestGammaSquared[targetSlices] = numpy.minimum(bestGammaSquared[targetSlices], gammaSquared)
+    gamma = numpy.sqrt(bestGammaSquared)
+    gamma[referenceDoseKJI < analysisThresholdPercent / 100.0 * referenceDoseKJI.max()] = 0
+    return gamma
+
+  #------------------------------------------------------------------------------
+  def computeCentralCylinderTableReference(self, imageArray, centralRadiusPixel, sliceThicknessCm):
+    # Per-voxel loop matching the original central cylinder parsing, used as reference
+    import math
+    centerXCoordinate = (imageArray.shape[0]-1)/2
+    centerYCoordinate = (imageArray.shape[1]-1)/2
+    numberOfSlices = imageArray.shape[2]
+    referenceTable = numpy.zeros((numberOfSlices, 3))
+    for sliceNumber in range(numberOfSlices):
+      z = numberOfSlices - sliceNumber - 1
+      listOfOpticalDensities = []
+      for y in range(math.floor(centerYCoordinate - centralRadiusPixel + 0.5), math.ceil(centerYCoordinate + centralRadiusPixel + 0.5)):
+        for x in range(math.floor(centerXCoordinate - centralRadiusPixel + 0.5), math.ceil(centerXCoordinate + centralRadiusPixel + 0.5)):
+          distanceOfX = abs(x - centerXCoordinate)
+          distanceOfY = abs(y - centerYCoordinate)
+          if ((distanceOfX + distanceOfY) <= centralRadiusPixel) or ((distanceOfX**2 + distanceOfY**2) <= centralRadiusPixel**2):
+            listOfOpticalDensities.append(float(imageArray[x, y, z]))
+      meanOpticalAttenuation = sum(listOfOpticalDensities) / len(listOfOpticalDensities)
+      variance = sum([(value - meanOpticalAttenuation)**2 for value in listOfOpticalDensities]) / len(listOfOpticalDensities)
+      referenceTable[sliceNumber] = [sliceNumber * sliceThicknessCm, meanOpticalAttenuation, math.sqrt(variance)]
+    return referenceTable
+
+  #------------------------------------------------------------------------------
+  def removeOutliersFromArrayReference(self, arrayToClean, outlierThreshold, maxNumberOfOutlierIterations, minimumMeanDifferenceInFractionOfMaxValueThreshold):
+    # Row by row outlier removal matching the original implementation, used as reference
+    numberOfFoundOutliers = -1
+    numberOfIterations = 0
+    numberOfRows = arrayToClean.shape[0]
+    while numberOfIterations < maxNumberOfOutlierIterations and numberOfFoundOutliers != 0 and numberOfRows > 0:
+      maxValue = -1
+      sumDifferences = 0
+      for index in range(numberOfRows):
+        if arrayToClean[index, 1] > maxValue:
+          maxValue = arrayToClean[index, 1]
+        if index < numberOfRows-1:
+          sumDifferences += abs(arrayToClean[index, 1] - arrayToClean[index+1, 1])
+      meanDifference = sumDifferences / (numberOfRows-1)
+      if meanDifference < maxValue * minimumMeanDifferenceInFractionOfMaxValueThreshold:
+        break
+      numberOfFoundOutliers = 0
+      while abs(arrayToClean[0,1] - arrayToClean[1,1]) > meanDifference * outlierThreshold:
+        arrayToClean = numpy.delete(arrayToClean, 0, 0)
+        numberOfFoundOutliers += 1
+      numberOfRows = arrayToClean.shape[0]
+      while abs(arrayToClean[numberOfRows-1,1] - arrayToClean[numberOfRows-2,1]) > meanDifference * outlierThreshold:
+        arrayToClean = numpy.delete(arrayToClean, numberOfRows-1, 0)
+        numberOfRows = arrayToClean.shape[0]
+        numberOfFoundOutliers += 1
+      numberOfIterations += 1
+    return [arrayToClean, numberOfFoundOutliers]
+
+  #------------------------------------------------------------------------------
+  def createAlignedCalibrationArrayReference(self, pddArray, calibrationArray, xTrans, yScale, yTrans):
+    # Piecewise function sampling matching the original implementation, used as reference
+    # Returns the aligned array and the aligned array used for display
+    alignedArrays = []
+    for [scale, translation] in [[1, 0], [yScale, yTrans]]:
+      interpolator = vtk.vtkPiecewiseFunction()
+      for calibrationRowIndex in range(calibrationArray.shape[0]):
+        interpolator.AddPoint(calibrationArray[calibrationRowIndex, 0] + xTrans, calibrationArray[calibrationRowIndex, 1] * scale + translation)
+      interpolatorRange = interpolator.GetRange()
+      alignedArray = numpy.zeros([pddArray.shape[0], 2])
+      alignedRowIndex = -1
+      for pddRowIndex in range(pddArray.shape[0]):
+        pddCurrentDepth = pddArray[pddRowIndex, 0]
+        if pddCurrentDepth >= interpolatorRange[0] and pddCurrentDepth <= interpolatorRange[1]:
+          alignedRowIndex += 1
+          alignedArray[alignedRowIndex, 0] = pddCurrentDepth
+          alignedArray[alignedRowIndex, 1] = interpolator.GetValue(pddCurrentDepth)
+        else:
+          alignedArray = numpy.delete(alignedArray, alignedArray.shape[0]-1, 0)
+      alignedArrays.append(alignedArray)
+    return alignedArrays
+
+  #------------------------------------------------------------------------------
+  def createOpticalAttenuationVsDoseFunctionReference(self, calculatedDose, calibrationAlignedArray, pddRangeMin, pddRangeMax):
+    # Piecewise function sampling matching the original implementation, used as reference
+    interpolator = vtk.vtkPiecewiseFunction()
+    for calibrationRowIndex in range(calibrationAlignedArray.shape[0]):
+      interpolator.AddPoint(calibrationAlignedArray[calibrationRowIndex, 0], calibrationAlignedArray[calibrationRowIndex, 1])
+    interpolatorRange = interpolator.GetRange()
+    opticalAttenuationVsDoseFunction = numpy.zeros(calculatedDose.shape)
+    doseNumberOfRows = calculatedDose.shape[0]
+    for doseRowIndex in range(doseNumberOfRows):
+      currentDepth = calculatedDose[doseRowIndex, 0]
+      if currentDepth >= interpolatorRange[0] and currentDepth <= interpolatorRange[1] and currentDepth >= pddRangeMin and currentDepth <= pddRangeMax:
+        opticalAttenuationVsDoseFunction[doseNumberOfRows-doseRowIndex-1, 0] = interpolator.GetValue(currentDepth)
+        opticalAttenuationVsDoseFunction[doseNumberOfRows-doseRowIndex-1, 1] = calculatedDose[doseRowIndex, 1]
+      else:
+        opticalAttenuationVsDoseFunction = numpy.delete(opticalAttenuationVsDoseFunction, doseNumberOfRows-doseRowIndex-1, 0)
+    return opticalAttenuationVsDoseFunction
+
+  #------------------------------------------------------------------------------
+  def computeCurveAlignmentErrorReference(self, pddArray, calibrationArray, xTrans, yScale, yTrans):
+    # Cost function of the original curve alignment, used as reference: sum of squared differences between
+    # the Pdd and the transformed calibration curve, at the Pdd depths within the range of the calibration curve
+    interpolator = vtk.vtkPiecewiseFunction()
+    for calibrationRowIndex in range(calibrationArray.shape[0]):
+      interpolator.AddPoint(calibrationArray[calibrationRowIndex, 0] + xTrans, calibrationArray[calibrationRowIndex, 1] * yScale + yTrans)
+    interpolatorRange = interpolator.GetRange()
+    sumSquaredDifference = 0.0
+    for pddRowIndex in range(pddArray.shape[0]):
+      pddCurrentDepth = pddArray[pddRowIndex, 0]
+      if pddCurrentDepth >= interpolatorRange[0] and pddCurrentDepth <= interpolatorRange[1]:
+        sumSquaredDifference += (pddArray[pddRowIndex, 1] - interpolator.GetValue(pddCurrentDepth)) ** 2
+    return sumSquaredDifference
+
+  #------------------------------------------------------------------------------
+  def alignPddToCalibrationReference(self, pddArray, calibrationArray):
+    # Simplex search of the original curve alignment, used as reference. Returns [error, xTrans, yScale, yTrans]
+    minimizer = vtk.vtkAmoebaMinimizer()
+    def computeError():
+      minimizer.SetFunctionValue(self.computeCurveAlignmentErrorReference(pddArray, calibrationArray,
+        minimizer.GetParameterValue("xTrans"), minimizer.GetParameterValue("yScale"), minimizer.GetParameterValue("yTrans")))
+    minimizer.SetFunction(computeError)
+    minimizer.SetParameterValue("xTrans",0)
+    minimizer.SetParameterScale("xTrans",2)
+    minimizer.SetParameterValue("yScale",pddArray[:,1].max() / calibrationArray[:,1].max())
+    minimizer.SetParameterScale("yScale",0.1)
+    minimizer.SetParameterValue("yTrans",0)
+    minimizer.SetParameterScale("yTrans",0.2)
+    minimizer.SetMaxIterations(50)
+    minimizer.Minimize()
+    return [minimizer.GetFunctionValue(), minimizer.GetParameterValue("xTrans"), minimizer.GetParameterValue("yScale"), minimizer.GetParameterValue("yTrans")]
+
   #------------------------------------------------------------------------------
   # Mandatory functions
   #------------------------------------------------------------------------------
@@ -2523,6 +3995,30 @@ class GelDosimetryAnalysisTest(ScriptedLoadableModuleTest):
     self.setUp()
 
     self.test_GelDosimetryAnalysis_FullTest()
+    self.test_GelDosimetryAnalysis_CentralCylinderParsing()
+    self.test_GelDosimetryAnalysis_CalibrationMemoryUsage()
+    self.test_GelDosimetryAnalysis_CalibrationOutputScalarType()
+    self.test_GelDosimetryAnalysis_CalibrationLookupTableBenchmark()
+    self.test_GelDosimetryAnalysis_CurveAlignment()
+    self.test_GelDosimetryAnalysis_BatchManifest()
+    self.test_GelDosimetryAnalysis_BatchJob()
+    self.test_GelDosimetryAnalysis_StreamingCalibration()
+    self.test_GelDosimetryAnalysis_PddLoading()
+    self.test_GelDosimetryAnalysis_OutlierRemoval()
+    self.test_GelDosimetryAnalysis_CalibrationFunctionArrays()
+    self.test_GelDosimetryAnalysis_AlignmentPreviewLatency()
+    self.test_GelDosimetryAnalysis_ChartTableDecimation()
+    self.test_GelDosimetryAnalysis_CentralCylinderCache()
+    self.test_GelDosimetryAnalysis_CentralCylinderCacheKey()
+    self.test_GelDosimetryAnalysis_CentralCylinderRadii()
+    self.test_GelDosimetryAnalysis_CentralCylinderAxisTracking()
+    self.test_GelDosimetryAnalysis_CroppedCalibrationParsing()
+    self.test_GelDosimetryAnalysis_LandmarkRegistration()
+    self.test_GelDosimetryAnalysis_NativeGamma()
+    self.test_GelDosimetryAnalysis_GammaCriteriaSweep()
+    self.test_GelDosimetryAnalysis_GammaPassFractionOnly()
+    self.test_GelDosimetryAnalysis_GammaMaskCropping()
+    self.test_GelDosimetryAnalysis_BackgroundGamma()
 
 
 #
@@ -0,0 +1,255 @@
+import os
+import sys
+import json
+import csv
+import time
+import signal
+import shutil
+import logging
+import subprocess
+from __main__ import vtk, qt, ctk, slicer
+
+#
+# BatchProcessingLogic
+#
+# Runs the calibration pipeline (see GelDosimetryAnalysisLogic.runCalibrationPipeline) on many gel datasets.
+# Each dataset is processed in a separate Slicer process started without main window, so that the datasets
+# are processed in parallel on multiple cores, and the memory of a dataset is released when its process exits.
+#
+class BatchProcessingLogic():
+
+  def __init__(self):
+    # Maximum number of datasets processed at the same time. If None, then the number of CPU cores is used
+    self.numberOfProcesses = None
+    # Data segment (heap) size limit of each worker process in megabytes (Linux only, set using the prlimit utility).
+    # If None, then there is no limit. The virtual address space is not limited, because Slicer, Qt and ITK
+    # reserve far more address space than they use, so a limit of a few GB would make Slicer fail at startup
+    self.memoryLimitMb = None
+    # Maximum run time of a single dataset in seconds, after which its worker process is killed. If None, then
+    # there is no limit, and a worker process that does not exit (e.g. hangs in a dialog) blocks its slot forever
+    self.timeoutSec = 4 * 3600
+    # Additional module paths passed to the worker processes (e.g. the build tree of the extension)
+    self.additionalModulePaths = []
+
+    # Keys of the manifest entries that need to be specified for each dataset
+    self.requiredManifestKeys = ['calibrationVolumeFilePath', 'pddFilePath', 'measuredVolumeFilePath']
+    # Suffixes of the manifest keys whose values are always strings (the other CSV values are parsed, see parseManifestValue)
+    self.stringManifestKeySuffixes = ['FilePath', 'NodeID', 'Directory', 'name']
+
+  # ---------------------------------------------------------------------------
+  def loadManifest(self, manifestFilePath):
+    # Load manifest from a JSON file (list of dictionaries) or CSV file (header row containing the keys)
+    # Each entry contains the keys calibrationVolumeFilePath, pddFilePath, measuredVolumeFilePath, and optionally
+    # planDoseVolumeFilePath and name, as well as any further calibration pipeline configuration keys.
+    # Relative file paths are interpreted relative to the manifest file.
+    if manifestFilePath.lower().endswith('.json'):
+      with open(manifestFilePath, 'r') as manifestFile:
+        manifest = json.load(manifestFile)
+    else:
+      with open(manifestFilePath, 'r') as manifestFile:
+        # Empty cells mean that the common configuration is used
+        manifest = [dict([(key, self.parseManifestValue(key, value)) for (key, value) in row.items() if value]) for row in csv.DictReader(manifestFile)]
+
+    manifestDir = os.path.dirname(os.path.abspath(manifestFilePath))
+    for entry in manifest:
+      for key in entry.keys():
+        if key.endswith('FilePath') and entry[key] and not os.path.isabs(entry[key]):
+          entry[key] = os.path.normpath(os.path.join(manifestDir, entry[key]))
+    return manifest
+
+  # ---------------------------------------------------------------------------
+  def parseManifestValue(self, key, value):
+    # Convert the text of a CSV manifest cell to the type used in the pipeline configuration, so that for example
+    # rdf=0.95 is a number and calibrateInPlace=False is false. File paths, node IDs and names are kept as strings.
+    # True/False (any case) are booleans, other values are parsed as JSON (numbers, lists such as alignment,
+    # dictionaries such as gammaParameters), and kept as strings if they are not valid JSON
+    if any([key.endswith(suffix) for suffix in self.stringManifestKeySuffixes]):
+      return value
+    if value.strip().lower() in ['true', 'false']:
+      return value.strip().lower() == 'true'
+    try:
+      return json.loads(value)
+    except ValueError:
+      return value
+
+  # ---------------------------------------------------------------------------
+  def runBatch(self, manifest, outputDirectory, commonConfig={}):
+    # Process all datasets in the manifest (list of dictionaries or manifest file path) in parallel.
+    # commonConfig contains the calibration pipeline configuration shared by all datasets (e.g. centralRadiusMm,
+    # rdf, monitorUnits, polynomialOrder, gammaParameters), which is overridden by the keys in the manifest entries.
+    # The outputs of each dataset are written in a subdirectory of outputDirectory, and the summary of
+    # all datasets in BatchResults.csv. Returns list of result dictionaries in the order of the manifest.
+    if not isinstance(manifest, list):
+      manifest = self.loadManifest(manifest)
+    if not os.path.exists(outputDirectory):
+      os.makedirs(outputDirectory)
+
+    # Set up job configurations
+    jobConfigs = []
+    for index, entry in enumerate(manifest):
+      missingKeys = [key for key in self.requiredManifestKeys if not entry.get(key)]
+      if len(missingKeys) > 0:
+        raise ValueError('Manifest entry {0} does not contain {1}'.format(index, ', '.join(missingKeys)))
+      jobConfigs.append(self.createJobConfig(index, entry, outputDirectory, commonConfig))
+
+    numberOfProcesses = self.numberOfProcesses if self.numberOfProcesses else (os.cpu_count() or 1)
+    numberOfProcesses = max(1, min(numberOfProcesses, len(jobConfigs)))
+    logging.info('Processing {0} datasets using {1} processes'.format(len(jobConfigs), numberOfProcesses))
+
+    # Each job runs in its own process, the threads of the executor only wait for the processes
+    import concurrent.futures
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=numberOfProcesses) as executor:
+      threadsPerJob = max(1, (os.cpu_count() or 1) // numberOfProcesses)
+      results = list(executor.map(lambda jobConfig: self.runJobProcess(jobConfig, threadsPerJob), jobConfigs))
+    end = time.time()
+
+    numberOfSucceededJobs = len([result for result in results if result['status'] == 'succeeded'])
+    logging.info('Batch processing finished: {0} of {1} datasets succeeded (time: {2})'.format(numberOfSucceededJobs, len(results), end - start))
+    self.writeSummary(results, os.path.join(outputDirectory, 'BatchResults.csv'))
+    return results
+
+  # ---------------------------------------------------------------------------
+  def createJobConfig(self, index, entry, outputDirectory, commonConfig):
+    name = entry.get('name') or '{0:03d}_{1}'.format(index, os.path.splitext(os.path.basename(entry['measuredVolumeFilePath']))[0])
+    jobOutputDirectory = os.path.join(outputDirectory, name)
+    if not os.path.exists(jobOutputDirectory):
+      os.makedirs(jobOutputDirectory)
+
+    jobConfig = dict(commonConfig)
+    jobConfig.update(entry)
+    jobConfig['name'] = name
+    jobConfig.setdefault('calibrateInPlace', True) # The MEASURED volume is not needed after calibration
+    jobConfig.setdefault('outputCalibratedVolumeFilePath', os.path.join(jobOutputDirectory, 'CalibratedVolume.nrrd'))
+    jobConfig.setdefault('outputCalibrationDirectory', jobOutputDirectory)
+    if jobConfig.get('planDoseVolumeFilePath'):
+      jobConfig.setdefault('outputGammaVolumeFilePath', os.path.join(jobOutputDirectory, 'GammaVolume.nrrd'))
+    jobConfig['configFilePath'] = os.path.join(jobOutputDirectory, 'Config.json')
+    jobConfig['resultsFilePath'] = os.path.join(jobOutputDirectory, 'Results.json')
+    jobConfig['logFilePath'] = os.path.join(jobOutputDirectory, 'Log.txt')
+
+    with open(jobConfig['configFilePath'], 'w') as configFile:
+      json.dump(jobConfig, configFile, indent=2)
+    return jobConfig
+
+  # ---------------------------------------------------------------------------
+  def runJobProcess(self, jobConfig, numberOfThreads):
+    # Start Slicer without main window to process one dataset, and wait for it to finish
+    command = self.getJobCommand(jobConfig, numberOfThreads)
+
+    # Avoid oversubscribing the cores by the multithreaded filters of the parallel processes
+    environment = dict(os.environ)
+    environment['ITK_GLOBAL_DEFAULT_NUMBER_OF_THREADS'] = str(numberOfThreads)
+    environment['OMP_NUM_THREADS'] = str(numberOfThreads)
+
+    result = { 'name': jobConfig['name'], 'status': 'failed' }
+    start = time.time()
+    try:
+      with open(jobConfig['logFilePath'], 'w') as logFile:
+        # The worker gets its own process group (POSIX), so that it can be killed together with its child processes
+        process = subprocess.Popen(command, stdout=logFile, stderr=subprocess.STDOUT, env=environment,
+          start_new_session=not sys.platform.startswith('win'))
+        try:
+          exitCode = process.wait(timeout=self.timeoutSec)
+        except subprocess.TimeoutExpired:
+          self.killJobProcess(process)
+          result['status'] = 'timeout'
+          exitCode = None
+    except OSError as e:
+      logging.error('Failed to start worker process for dataset ' + jobConfig['name'] + ': ' + str(e))
+      return result
+    result['time'] = time.time() - start
+
+    if exitCode == 0 and os.path.exists(jobConfig['resultsFilePath']):
+      with open(jobConfig['resultsFilePath'], 'r') as resultsFile:
+        result.update(json.load(resultsFile))
+      result['status'] = 'succeeded'
+    else:
+      logging.error('Processing dataset {0} failed (status: {1}, exit code: {2}), see {3}'.format(
+        jobConfig['name'], result['status'], exitCode, jobConfig['logFilePath']))
+    return result
+
+  # ---------------------------------------------------------------------------
+  def getJobCommand(self, jobConfig, numberOfThreads):
+    # Command line of the worker process processing one dataset. The Python code always exits Slicer, even if
+    # the logic cannot be imported or raises an exception, otherwise Slicer started without main window keeps running
+    launcherFilePath = slicer.app.launcherExecutableFilePath if hasattr(slicer.app, 'launcherExecutableFilePath') else slicer.app.applicationFilePath()
+    pythonCode = ("import slicer\n"
+      "try:\n"
+      "  import GelDosimetryAnalysisLogic\n"
+      "  exitCode = GelDosimetryAnalysisLogic.BatchProcessingLogic.runJob({0}, {1})\n"
+      "except:\n"
+      "  import traceback\n"
+      "  traceback.print_exc()\n"
+      "  exitCode = 2\n"
+      "slicer.util.exit(exitCode)\n").format(repr(jobConfig['configFilePath']), numberOfThreads)
+    command = self.getMemoryLimitCommandPrefix() + [launcherFilePath, '--no-splash', '--no-main-window']
+    if len(self.additionalModulePaths) > 0:
+      command += ['--additional-module-paths'] + self.additionalModulePaths
+    command += ['--python-code', pythonCode]
+    return command
+
+  # ---------------------------------------------------------------------------
+  def killJobProcess(self, process):
+    # Kill the worker process and the processes it started (the launcher starts the actual Slicer executable)
+    if sys.platform.startswith('win'):
+      subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    else:
+      try:
+        os.killpg(process.pid, signal.SIGKILL)
+      except OSError:
+        pass
+    process.kill()
+    process.wait()
+
+  # ---------------------------------------------------------------------------
+  def getMemoryLimitCommandPrefix(self):
+    # Returns command prefix limiting the data segment of the worker process. prlimit sets the limit and then executes
+    # the command, so the limit is inherited by Slicer started by the launcher. The limit is not set using preexec_fn
+    # of Popen, because that may deadlock in the forked child, as the executor and Slicer run other threads
+    if self.memoryLimitMb is None:
+      return []
+    prlimitFilePath = shutil.which('prlimit') if sys.platform.startswith('linux') else None
+    if not prlimitFilePath:
+      logging.warning('Memory limit of the worker processes is only supported on Linux with the prlimit utility')
+      return []
+    return [prlimitFilePath, '--data={0}'.format(int(self.memoryLimitMb * 1024 * 1024))]
+
+  # ---------------------------------------------------------------------------
+  def writeSummary(self, results, summaryFilePath):
+    with open(summaryFilePath, 'w') as summaryFile:
+      csvWriter = csv.writer(summaryFile, delimiter=',', lineterminator='\n')
+      csvWriter.writerow(['Name', 'Status', 'Time (s)', 'Polynomial coefficients', 'Residuals', 'Gamma pass fraction (%)', 'Calibrated volume', 'Gamma volume'])
+      for result in results:
+        csvWriter.writerow([result['name'], result['status'], '{0:.1f}'.format(result['time']) if 'time' in result else '',
+          ' '.join([repr(coefficient) for coefficient in result.get('calibrationPolynomialCoefficients', [])]),
+          ' '.join([repr(residual) for residual in result.get('fittingResiduals', [])]),
+          result.get('gammaPassFractionPercent', ''), result.get('calibratedVolumeFilePath', ''), result.get('gammaVolumeFilePath', '')])
+
+  # ---------------------------------------------------------------------------
+  @staticmethod
+  def runJob(configFilePath, numberOfThreads=0):
+    # Process one dataset. Called in the worker process. Returns the process exit code:
+    # 0 on success, 1 if the calibration pipeline failed, 2 if an exception was raised
+    from .GelDosimetryAnalysisLogic import GelDosimetryAnalysisLogic
+    try:
+      with open(configFilePath, 'r') as configFile:
+        jobConfig = json.load(configFile)
+      if numberOfThreads > 0:
+        slicer.modules.geldosimetryanalysisalgo.logic().SetNumberOfThreads(numberOfThreads)
+
+      logic = GelDosimetryAnalysisLogic()
+      results = logic.runCalibrationPipeline(jobConfig)
+      if results is None:
+        return 1
+
+      # Only keep the serializable results, the nodes are not needed after the process exits
+      results = dict([(key, value) for (key, value) in results.items() if not key.endswith('Node')])
+      with open(jobConfig['resultsFilePath'], 'w') as resultsFile:
+        json.dump(results, resultsFile, indent=2)
+      return 0
+
+    except Exception:
+      import traceback
+      logging.error('Processing dataset from ' + repr(configFilePath) + ' failed:\n' + traceback.format_exc())
+      return 2
@@ -19,23 +19,64 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
   https://github.com/Slicer/Slicer/blob/master/Base/Python/slicer/ScriptedLoadableModule.py
   """
 
+  # Parsed PDD files shared by all logic instances: absolute path and column indices -> [(mtime, size), PDD array]
+  pddFileCache = {}
+
   def __init__(self):
     # Define constants
     self.cbctToPlanTransformName = 'cbctToPlanTransform'
     self.cbctToMeasuredTransformName = "cbctToMeasuredTransform"
+    # Gamma criteria (DTA in mm, dose difference in %) commonly reported in QA: 3%/3mm, 2%/2mm, 3%/2mm, 1%/1mm
+    self.gammaSweepDefaultCriteria = [(3.0, 3.0), (2.0, 2.0), (2.0, 3.0), (1.0, 1.0)]
 
     # Declare member variables (mainly for documentation)
     self.pddDataArray = None
     self.calculatedDose = None # Computed from Pdd usinf RDF and Electron MUs
     self.calibrationDataArray = None
+    self.centralCylinderRadiusTables = None # Calibration arrays for each averaging radius in pixels (first index: radius)
+    self.centralCylinderRadiusSpacingMm = None # In-plane spacing of the CALIBRATION volume, for converting radii to pixels
+    self.centralCylinderRadiusTablesSource = None # CALIBRATION volume node ID and image data modified time the tables were computed from
+    self.calibrationDataCleanedArray = None # Calibration array without the zeros and outliers at the two ends
     self.calibrationDataAlignedArray = None # Calibration array registered (X shift) to the Pdd curve (for computation)
     self.calibrationDataAlignedToDisplayArray = None # Calibration array registered (X shift, Y scale, Y shift) to the Pdd curve (for visual alignment)
+    self.calibrationDataAlignedXTranslation = None # X shift used to create the aligned calibration arrays
     self.opticalAttenuationVsDoseFunction = None
     self.calibrationPolynomialCoefficients = None # Calibration polynomial coefficients, highest power first
 
-    # Set logic instance to the global variable that supplies it to the calibration curve alignment minimizer function
-    global gelDosimetryLogicInstanceGlobal
-    gelDosimetryLogicInstanceGlobal = self
+    # Flag determining whether the busy cursor is shown during calibration computations. Turned off for headless processing
+    self.showBusyCursor = True
+
+    # On-disk cache of the central cylinder tables of CALIBRATION volumes, keyed by the hash of the volume file (or
+    # the voxels if the volume is not stored in a file), geometry, averaging radius, axis tracking settings and
+    # parsed region. The least recently used tables are removed above the maximum size
+    self.useCentralCylinderCache = True
+    self.centralCylinderCacheDirectory = None # If None, then the GelDosimetry/CentralCylinderCache directory in the Slicer cache
+    self.centralCylinderCacheMaximumSizeMb = 20
+
+    # Flag determining whether the central cylinder follows the vial axis (centroid of each slice of the CALIBRATION
+    # volume) instead of being fixed at the center of the volume. Needed for tilted or off-center vials
+    self.trackCentralCylinderAxis = False
+    # Optical attenuation threshold separating the vial from the background when tracking the axis.
+    # If None, then the midpoint between the minimum and maximum of each slice is used
+    self.centralCylinderAxisThreshold = None
+    self.centralCylinderCenters = None # Center (x, y in pixels) of the central cylinder for each slice, if the axis is tracked
+
+    # Region of the CALIBRATION volume that is parsed: ROI node ID (markups or annotation ROI) and/or depth range
+    # [min, max] in cm. Only this sub-extent of the volume is accessed, and the center of the cylinder is the center
+    # of the region. If None, then the whole volume is parsed
+    self.calibrationVolumeParsingRoiNodeID = None
+    self.calibrationVolumeParsingDepthRangeCm = None
+
+    self.gammaErrorMessage = None # Error message of the last failed gamma dose comparison
+
+  # ---------------------------------------------------------------------------
+  def setBusyCursor(self, busy):
+    if not self.showBusyCursor:
+      return
+    if busy:
+      qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
+    else:
+      qt.QApplication.restoreOverrideCursor()
 
   # ---------------------------------------------------------------------------
   # Show and select DICOM browser
@@ -47,164 +88,218 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
   # Use BRAINS registration to register PlanCT to CBCT volume
   # and apply the result to the PlanCT and PlanDose
   def registerPlanCtToCbctAutomatic(self, planCtVolumeID, cbctVolumeID):
-    try:
-      qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
-      parametersRigid = {}
-      parametersRigid["fixedVolume"] = cbctVolumeID
-      parametersRigid["movingVolume"] = planCtVolumeID
-      parametersRigid["useRigid"] = True
-      parametersRigid["initializeTransformMode"] = "useGeometryAlign"
-      parametersRigid["samplingPercentage"] = 0.0005
-      parametersRigid["maximumStepLength"] = 15 # Start with long-range translations
-      parametersRigid["relaxationFactor"] = 0.8 # Relax quickly
-      parametersRigid["translationScale"] = 1000000 # Suppress rotation
-      # parametersRigid["backgroundFillValue"] = -1000.0
-
-      # Set output transform
-      try:
-        cbctToPlanTransformNode = slicer.util.getNode(self.cbctToPlanTransformName)
-      except:
-        cbctToPlanTransformNode = slicer.vtkMRMLLinearTransformNode()
-        slicer.mrmlScene.AddNode(cbctToPlanTransformNode)
-        cbctToPlanTransformNode.SetName(self.cbctToPlanTransformName)
-      parametersRigid["linearTransform"] = cbctToPlanTransformNode.GetID()
-
-      # Runs the brainsfit registration
-      brainsFit = slicer.modules.brainsfit
-      cliBrainsFitRigidNode = None
-      cliBrainsFitRigidNode = slicer.cli.run(brainsFit, None, parametersRigid)
-
-      waitCount = 0
-      while cliBrainsFitRigidNode.GetStatusString() != 'Completed' and waitCount < 200:
-        self.delayDisplay( "Register PlanCT to CBCT using rigid registration... %d" % waitCount )
-        waitCount += 1
-      self.delayDisplay("Register PlanCT to CBCT using rigid registration finished")
-      qt.QApplication.restoreOverrideCursor()
+    # Blocking version of registerPlanCtToCbctAutomaticAsync. Returns the transform node, or None on failure
+    future = self.registerPlanCtToCbctAutomaticAsync(planCtVolumeID, cbctVolumeID)
+    future.wait()
+    return future.result()
 
+  # ---------------------------------------------------------------------------
+  def registerPlanCtToCbctAutomaticAsync(self, planCtVolumeID, cbctVolumeID, completedCallback=None, timeoutSec=None):
+    # Start rigid registration and return immediately. The result of the returned CliRunFuture is the cbctToPlan transform node
+    parametersRigid = {}
+    parametersRigid["fixedVolume"] = cbctVolumeID
+    parametersRigid["movingVolume"] = planCtVolumeID
+    parametersRigid["useRigid"] = True
+    parametersRigid["initializeTransformMode"] = "useGeometryAlign"
+    parametersRigid["samplingPercentage"] = 0.0005
+    parametersRigid["maximumStepLength"] = 15 # Start with long-range translations
+    parametersRigid["relaxationFactor"] = 0.8 # Relax quickly
+    parametersRigid["translationScale"] = 1000000 # Suppress rotation
+    # parametersRigid["backgroundFillValue"] = -1000.0
+
+    # Set output transform
+    cbctToPlanTransformNode = self.getOrCreateLinearTransformNode(self.cbctToPlanTransformName)
+    parametersRigid["linearTransform"] = cbctToPlanTransformNode.GetID()
+
+    def finalizeRegistration(cliNode):
+      logging.info("Register PlanCT to CBCT using rigid registration finished")
       # Invert output transform (planToCbct) to get the desired cbctToPlan transform
       cbctToPlanTransformNode.GetMatrixTransformToParent().Invert()
-
       return cbctToPlanTransformNode
 
-    except Exception as e:
-      import traceback
-      traceback.print_exc()
+    # Runs the brainsfit registration
+    return self.runCliAsync(slicer.modules.brainsfit, parametersRigid, finalizeRegistration, completedCallback, timeoutSec)
 
   # ---------------------------------------------------------------------------
   def registerPlanCtToCbctLandmark(self, planCtFiducialListID, cbctFiducialListID):
-    try:
-      qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
-      parametersFiducial = {}
-      parametersFiducial["fixedLandmarks"] = cbctFiducialListID
-      parametersFiducial["movingLandmarks"] = planCtFiducialListID
+    # Register PLANCT fiducials to CBCT fiducials. Returns [transform node, RMS error], or None on failure
+    registrationResult = self.registerLandmarks(planCtFiducialListID, cbctFiducialListID, self.cbctToPlanTransformName)
+    if registrationResult is None:
+      return None
+    return [registrationResult[0], registrationResult[1]]
 
-      # Create linear transform which will store the registration transform
-      try:
-        cbctToPlanTransformNode = slicer.util.getNode(self.cbctToPlanTransformName)
-      except:
-        cbctToPlanTransformNode = slicer.vtkMRMLLinearTransformNode()
-        slicer.mrmlScene.AddNode(cbctToPlanTransformNode)
-        cbctToPlanTransformNode.SetName(self.cbctToPlanTransformName)
-      parametersFiducial["saveTransform"] = cbctToPlanTransformNode.GetID()
-      parametersFiducial["transformType"] = "Rigid"
-
-      # Run fiducial registration
-      fiducialRegistration = slicer.modules.fiducialregistration
-      cliFiducialRegistrationRigidNode = None
-      cliFiducialRegistrationRigidNode = slicer.cli.run(fiducialRegistration, None, parametersFiducial)
-
-      waitCount = 0
-      while cliFiducialRegistrationRigidNode.GetStatusString() != 'Completed' and waitCount < 200:
-        self.delayDisplay( "Register PLANCT to CBCT using fiducial registration... %d" % waitCount )
-        waitCount += 1
-      self.delayDisplay("Register PLANCT to CBCT using fiducial registration finished")
-      qt.QApplication.restoreOverrideCursor()
+  # ---------------------------------------------------------------------------
+  def registerMeasuredToCbct(self, measuredFiducialListID, cbctFiducialListID):
+    # Register MEASURED fiducials to CBCT fiducials. Returns the RMS error, or None on failure
+    registrationResult = self.registerLandmarks(measuredFiducialListID, cbctFiducialListID, self.cbctToMeasuredTransformName)
+    if registrationResult is None:
+      return None
+    return registrationResult[1]
 
-      # Apply transform to PLANCT fiducials
-      planCtFiducialsNode = slicer.mrmlScene.GetNodeByID(planCtFiducialListID)
-      planCtFiducialsNode.SetAndObserveTransformNodeID(cbctToPlanTransformNode.GetID())
+  # ---------------------------------------------------------------------------
+  def registerLandmarks(self, movingFiducialListID, fixedFiducialListID, transformNodeName):
+    # Rigid registration of the moving fiducials to the fixed fiducials (corresponding by index), computed in-process
+    # so that it can be repeated while the fiducials are being placed. The result is stored in the transform node of the
+    # given name, and the moving fiducials are transformed by it
+    # Returns [transform node, RMS error (mm), residual distance of each fiducial pair (mm)], or None on failure
+    movingFiducialsNode = slicer.mrmlScene.GetNodeByID(movingFiducialListID)
+    fixedFiducialsNode = slicer.mrmlScene.GetNodeByID(fixedFiducialListID)
+    numberOfFiducials = movingFiducialsNode.GetNumberOfFiducials()
+    if numberOfFiducials != fixedFiducialsNode.GetNumberOfFiducials() or numberOfFiducials < 3:
+      logging.error('Fiducial registration needs the same number (at least 3) of moving and fixed fiducials (found {0} and {1})'.format(
+        numberOfFiducials, fixedFiducialsNode.GetNumberOfFiducials()))
+      return None
 
-      return [cbctToPlanTransformNode, cliFiducialRegistrationRigidNode.GetParameterAsString('rms')]
+    # Moving fiducials are taken in their own coordinate system, as they are transformed by the result
+    movingPoints = numpy.zeros((numberOfFiducials, 3))
+    fixedPoints = numpy.zeros((numberOfFiducials, 3))
+    movingPoint = [0.0] * 3
+    fixedPointWorld = [0.0] * 4
+    for fiducialIndex in range(numberOfFiducials):
+      movingFiducialsNode.GetNthFiducialPosition(fiducialIndex, movingPoint)
+      fixedFiducialsNode.GetNthFiducialWorldCoordinates(fiducialIndex, fixedPointWorld)
+      movingPoints[fiducialIndex] = movingPoint
+      fixedPoints[fiducialIndex] = fixedPointWorld[0:3]
 
-    except Exception as e:
-      import traceback
-      traceback.print_exc()
+    movingToFixedMatrix, errorRms, residuals = self.computeRigidLandmarkRegistration(fixedPoints, movingPoints)
 
-  # ---------------------------------------------------------------------------
-  def registerMeasuredToCbct(self, measuredFiducialListID, cbctFiducialListID):
-    try:
-      qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
-      parametersFiducial = {}
-      parametersFiducial["fixedLandmarks"] = cbctFiducialListID
-      parametersFiducial["movingLandmarks"] = measuredFiducialListID
+    transformNode = self.getOrCreateLinearTransformNode(transformNodeName)
+    transformNode.SetMatrixTransformToParent(slicer.util.vtkMatrixFromArray(movingToFixedMatrix))
+    movingFiducialsNode.SetAndObserveTransformNodeID(transformNode.GetID())
+    return [transformNode, errorRms, residuals]
 
-      # Create linear transform which will store the registration transform
-      try:
-        cbctToMeasuredTransformNode = slicer.util.getNode(self.cbctToMeasuredTransformName)
-      except:
-        cbctToMeasuredTransformNode = slicer.vtkMRMLLinearTransformNode()
-        slicer.mrmlScene.AddNode(cbctToMeasuredTransformNode)
-        cbctToMeasuredTransformNode.SetName(self.cbctToMeasuredTransformName)
-      parametersFiducial["saveTransform"] = cbctToMeasuredTransformNode.GetID()
-      parametersFiducial["transformType"] = "Rigid"
-
-      # Run fiducial registration
-      fiducialRegistration = slicer.modules.fiducialregistration
-      cliFiducialRegistrationRigidNode = None
-      cliFiducialRegistrationRigidNode = slicer.cli.run(fiducialRegistration, None, parametersFiducial)
-
-      waitCount = 0
-      while cliFiducialRegistrationRigidNode.GetStatusString() != 'Completed' and waitCount < 200:
-        self.delayDisplay( "Register MEASURED to CBCT using fiducial registration... %d" % waitCount )
-        waitCount += 1
-      self.delayDisplay("Register MEASURED to CBCT using fiducial registration finished")
-      qt.QApplication.restoreOverrideCursor()
+  # ---------------------------------------------------------------------------
+  def computeRigidLandmarkRegistration(self, fixedPoints, movingPoints):
+    # Least squares rigid transform mapping the moving points to the fixed points (arrays of shape (N,3)) using the
+    # Kabsch method: the rotation is computed from the SVD of the covariance matrix of the centered point sets
+    # Returns the 4x4 homogeneous transformation matrix, the RMS error, and the residual distance of each point pair
+    fixedCentroid = fixedPoints.mean(axis=0)
+    movingCentroid = movingPoints.mean(axis=0)
+    covarianceMatrix = (movingPoints - movingCentroid).T.dot(fixedPoints - fixedCentroid)
+    u, s, vt = numpy.linalg.svd(covarianceMatrix)
+    # Avoid reflection
+    correction = numpy.diag([1.0, 1.0, numpy.sign(numpy.linalg.det(vt.T.dot(u.T))) or 1.0])
+    rotation = vt.T.dot(correction).dot(u.T)
+
+    movingToFixedMatrix = numpy.eye(4)
+    movingToFixedMatrix[0:3, 0:3] = rotation
+    movingToFixedMatrix[0:3, 3] = fixedCentroid - rotation.dot(movingCentroid)
+
+    residuals = numpy.linalg.norm(movingPoints.dot(rotation.T) + movingToFixedMatrix[0:3, 3] - fixedPoints, axis=1)
+    errorRms = sqrt((residuals**2).mean())
+    return movingToFixedMatrix, errorRms, residuals
 
-      # Apply transform to MEASURED fiducials
-      measuredFiducialsNode = slicer.mrmlScene.GetNodeByID(measuredFiducialListID)
-      measuredFiducialsNode.SetAndObserveTransformNodeID(cbctToMeasuredTransformNode.GetID())
+  # ---------------------------------------------------------------------------
+  def getOrCreateLinearTransformNode(self, name):
+    try:
+      transformNode = slicer.util.getNode(name)
+    except:
+      transformNode = slicer.vtkMRMLLinearTransformNode()
+      slicer.mrmlScene.AddNode(transformNode)
+      transformNode.SetName(name)
+    return transformNode
 
-      return cliFiducialRegistrationRigidNode.GetParameterAsString('rms')
-    except Exception as e:
-      import traceback
-      traceback.print_exc()
+  # ---------------------------------------------------------------------------
+  def runCliAsync(self, cliModule, parameters, finalizeFunction=None, completedCallback=None, timeoutSec=None):
+    # Start CLI module without waiting for it to finish. Returns CliRunFuture. The busy cursor is shown until the CLI finishes
+    self.setBusyCursor(True)
+    cliNode = slicer.cli.run(cliModule, None, parameters)
+    future = CliRunFuture(cliNode, finalizeFunction, timeoutSec)
+    future.addCompletedCallback(lambda future: self.setBusyCursor(False))
+    if completedCallback is not None:
+      future.addCompletedCallback(completedCallback)
+    return future
 
   # ---------------------------------------------------------------------------
-  def loadPdd(self, fileName):
+  def loadPdd(self, fileName, depthColumnIndex=None, doseColumnIndex=None):
+    # Load PDD data from CSV file into pddDataArray (columns: depth (cm), percent depth dose)
+    # The delimiter (comma, semicolon, tab or whitespace) is detected automatically, and header rows are skipped.
+    # If the column indices are not specified, then the columns are identified by the header names ('depth' and
+    # 'dose'/'pdd'), or if there is no such header, then the first column is the dose and the second is the depth.
+    # Parsed files are cached by path and modification time, so loading the same file again does not parse it.
     if fileName == None or fileName == '':
       logging.error('Empty PDD file name')
       return False
 
-    readFile = open(fileName, 'r')
-    lines = readFile.readlines()
-    doseTable = numpy.zeros([len(lines), 2]) # 2 columns
-
-    rowCounter = 0
-    for line in lines:
-      firstValue, endOfLine = line.partition(',')[::2]
-      if endOfLine == '':
-        logging.error("File formatted incorrectly")
-        return False
-      valueOne = float(firstValue)
-      doseTable[rowCounter, 1] = valueOne
-      secondValue, lineEnd = endOfLine.partition('\n')[::2]
-      if (secondValue == ''):
-        logging.error("Two values are required per line in the file")
-        return False
-      valueTwo = float(secondValue)
-      doseTable[rowCounter, 0] = secondValue
-      # logging.debug('PDD row ' + rowCounter + ': ' + firstValue + ', ' + secondValue) # For testing
-      rowCounter += 1
+    try:
+      fileStat = os.stat(fileName)
+      cacheKey = (os.path.abspath(fileName), depthColumnIndex, doseColumnIndex)
+      cachedEntry = GelDosimetryAnalysisLogic.pddFileCache.get(cacheKey)
+      if cachedEntry is not None and cachedEntry[0] == (fileStat.st_mtime, fileStat.st_size):
+        logging.info("Pdd data loaded from cache for file '" + fileName + "'")
+        self.pddDataArray = cachedEntry[1].copy()
+        return True
+
+      pddDataArray = self.parsePddFile(fileName, depthColumnIndex, doseColumnIndex)
+    except (IOError, OSError, ValueError) as e:
+      logging.error("Failed to load PDD data from file '" + fileName + "': " + str(e))
+      return False
 
+    GelDosimetryAnalysisLogic.pddFileCache[cacheKey] = [(fileStat.st_mtime, fileStat.st_size), pddDataArray]
     logging.info("Pdd data successfully loaded from file '" + fileName + "'")
-    self.pddDataArray = doseTable
+    self.pddDataArray = pddDataArray.copy()
     return True
 
+  # ---------------------------------------------------------------------------
+  def parsePddFile(self, fileName, depthColumnIndex=None, doseColumnIndex=None):
+    # Parse PDD CSV file. Returns array with depth and dose columns. Raises ValueError if the file is malformed
+    import io
+    with open(fileName, 'r') as pddFile:
+      content = pddFile.read()
+    lines = content.splitlines()
+
+    # Find header rows (the rows before the first one starting with a number) and the delimiter
+    firstDataLineIndex = None
+    for lineIndex, line in enumerate(lines):
+      strippedLine = line.strip()
+      if strippedLine == '' or strippedLine.startswith('#'):
+        continue
+      try:
+        float(strippedLine.replace(';', ',').replace('\t', ',').split(',')[0].split()[0])
+        firstDataLineIndex = lineIndex
+        break
+      except (ValueError, IndexError):
+        pass
+    if firstDataLineIndex is None:
+      raise ValueError('No numeric data found')
+    firstDataLine = lines[firstDataLineIndex]
+    delimiter = None # Whitespace
+    for candidateDelimiter in [',', ';', '\t']:
+      if candidateDelimiter in firstDataLine:
+        delimiter = candidateDelimiter
+        break
+
+    # Identify columns
+    if depthColumnIndex is None or doseColumnIndex is None:
+      headerLines = [line for line in lines[:firstDataLineIndex] if line.strip() != '' and not line.strip().startswith('#')]
+      headerNames = [name.strip().lower() for name in headerLines[-1].split(delimiter)] if len(headerLines) > 0 else []
+      depthColumnIndices = [index for index, name in enumerate(headerNames) if 'depth' in name]
+      doseColumnIndices = [index for index, name in enumerate(headerNames) if 'dose' in name or 'pdd' in name or '%' in name]
+      doseColumnIndices = [index for index in doseColumnIndices if index not in depthColumnIndices]
+      if len(depthColumnIndices) == 1 and len(doseColumnIndices) == 1:
+        depthColumnIndex = depthColumnIndices[0] if depthColumnIndex is None else depthColumnIndex
+        doseColumnIndex = doseColumnIndices[0] if doseColumnIndex is None else doseColumnIndex
+      else:
+        # Legacy format without header: dose, depth
+        depthColumnIndex = 1 if depthColumnIndex is None else depthColumnIndex
+        doseColumnIndex = 0 if doseColumnIndex is None else doseColumnIndex
+
+    # Parse all data rows at once
+    data = numpy.loadtxt(io.StringIO(content), delimiter=delimiter, skiprows=firstDataLineIndex, comments='#', ndmin=2)
+    if data.shape[1] <= max(depthColumnIndex, doseColumnIndex):
+      raise ValueError('Expected at least {0} columns, found {1}'.format(max(depthColumnIndex, doseColumnIndex) + 1, data.shape[1]))
+    if data.shape[0] < 2:
+      raise ValueError('At least two rows of data are required')
+    pddDataArray = numpy.column_stack((data[:, depthColumnIndex], data[:, doseColumnIndex]))
+    if not numpy.all(numpy.isfinite(pddDataArray)):
+      raise ValueError('The file contains invalid (NaN or infinite) values')
+    return pddDataArray
+
   # ---------------------------------------------------------------------------
   def getMeanOpticalAttenuationOfCentralCylinder(self, calibrationVolumeNodeID, centralRadiusMm):
     # Format of output array: the following values are provided for each slice:
     #   depth (cm), mean optical attenuation on the slice at depth, std.dev. of optical attenuation
-    qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
+    self.setBusyCursor(True)
 
     calibrationVolume = slicer.util.getNode(calibrationVolumeNodeID)
     calibrationVolumeImageData = calibrationVolume.GetImageData()
@@ -219,56 +314,365 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
     if centralRadiusPixel != centralRadiusMm / calibrationVolumeInPlaneSpacing:
       logging.info('Central radius has been rounded up to {0} (original radius is {1}mm = {2}px)'.format(centralRadiusPixel, centralRadiusMm, centralRadiusMm / calibrationVolumeInPlaneSpacing))
 
-    numberOfSlices = calibrationVolumeImageData.GetExtent()[5] - calibrationVolumeImageData.GetExtent()[4] + 1
-    centerXCoordinate = (calibrationVolumeImageData.GetExtent()[1] - calibrationVolumeImageData.GetExtent()[0])/2
-    centerYCoordinate = (calibrationVolumeImageData.GetExtent()[3] - calibrationVolumeImageData.GetExtent()[2])/2
-
-    # Get image data in numpy array
-    calibrationVolumeImageDataAsScalars = calibrationVolumeImageData.GetPointData().GetScalars()
-    numpyImageDataArray = numpy_support.vtk_to_numpy(calibrationVolumeImageDataAsScalars)
-    numpyImageDataArray = numpy.reshape(numpyImageDataArray, (calibrationVolumeImageData.GetExtent()[1]+1, calibrationVolumeImageData.GetExtent()[3]+1, calibrationVolumeImageData.GetExtent()[5]+1), 'F')
-
-    opticalAttenuationOfCentralCylinderTable = numpy.zeros((numberOfSlices, 3))
-    sliceNumber = 0
-    z = calibrationVolumeImageData.GetExtent()[5]
-    zMin = calibrationVolumeImageData.GetExtent()[4]
-    while z  >= zMin:
-      totalPixels = 0
-      totalOpticalAttenuation = 0
-      listOfOpticalDensities = []
-      meanOpticalAttenuation = 0
-
-      for y in range(floor(centerYCoordinate - centralRadiusPixel + 0.5), ceil(centerYCoordinate + centralRadiusPixel + 0.5)):
-        for x in range(floor(centerXCoordinate - centralRadiusPixel + 0.5), ceil(centerXCoordinate + centralRadiusPixel + 0.5)):
-          distanceOfX = abs(x - centerXCoordinate)
-          distanceOfY = abs(y - centerYCoordinate)
-          if ((distanceOfX + distanceOfY) <= centralRadiusPixel) or ((pow(distanceOfX, 2) + pow(distanceOfY, 2)) <= pow(centralRadiusPixel, 2)):
-            currentOpticalAttenuation = numpyImageDataArray[x, y, z]
-            listOfOpticalDensities.append(currentOpticalAttenuation)
-            totalOpticalAttenuation = totalOpticalAttenuation + currentOpticalAttenuation
-            totalPixels+=1
-
-      meanOpticalAttenuation = totalOpticalAttenuation / totalPixels
-      standardDeviationOpticalAttenuation	= 0
-      for currentOpticalAttenuationValue in range(totalPixels):
-        standardDeviationOpticalAttenuation += pow((listOfOpticalDensities[currentOpticalAttenuationValue] - meanOpticalAttenuation), 2)
-      standardDeviationOpticalAttenuation = sqrt(standardDeviationOpticalAttenuation / totalPixels)
-      opticalAttenuationOfCentralCylinderTable[sliceNumber, 0] = sliceNumber * calibrationVolumeSliceThicknessCm
-      opticalAttenuationOfCentralCylinderTable[sliceNumber, 1] = meanOpticalAttenuation
-      opticalAttenuationOfCentralCylinderTable[sliceNumber, 2] = standardDeviationOpticalAttenuation
-      # logging.debug('Slice (cm): ' + repr(sliceNumber*calibrationVolumeSliceThicknessCm))
-      # logging.debug('  Mean: ' + repr(meanOpticalAttenuation) + '  StdDev: ' + repr(standardDeviationOpticalAttenuation))
-      sliceNumber += 1
-      z -= 1
-
-    qt.QApplication.restoreOverrideCursor()
+    # Get image data in numpy array (view of the parsed region of the volume)
+    numpyImageDataArray, subExtent, depthOffsetCm = self.getCalibrationVolumeArrayForParsing(calibrationVolume)
+    if numpyImageDataArray is None:
+      self.setBusyCursor(False)
+      return False
+    centerXCoordinate = (numpyImageDataArray.shape[0]-1)/2
+    centerYCoordinate = (numpyImageDataArray.shape[1]-1)/2
+
+    # Use cached table (and cylinder centers) if the same volume has been parsed with the same settings before
+    cacheKey = None
+    opticalAttenuationOfCentralCylinderTable = None
+    self.centralCylinderCenters = None
+    if self.useCentralCylinderCache:
+      cacheKey = self.getCentralCylinderCacheKey(calibrationVolume, numpyImageDataArray, centralRadiusMm, subExtent)
+      [opticalAttenuationOfCentralCylinderTable, self.centralCylinderCenters] = self.loadFromCentralCylinderCache(cacheKey)
+
+    if opticalAttenuationOfCentralCylinderTable is None:
+      if self.trackCentralCylinderAxis:
+        self.centralCylinderCenters = self.computeCentralCylinderCenters(numpyImageDataArray, self.centralCylinderAxisThreshold)
+        opticalAttenuationOfCentralCylinderTable = self.computeOpticalAttenuationOfCentralCylinderTableForCenters(
+          numpyImageDataArray, self.centralCylinderCenters, centralRadiusPixel, calibrationVolumeSliceThicknessCm)
+      else:
+        opticalAttenuationOfCentralCylinderTable = self.computeOpticalAttenuationOfCentralCylinderTable(
+          numpyImageDataArray, centerXCoordinate, centerYCoordinate, centralRadiusPixel, calibrationVolumeSliceThicknessCm)
+      # Depths are measured from the last slice of the whole volume
+      opticalAttenuationOfCentralCylinderTable[:, 0] += depthOffsetCm
+      if cacheKey is not None:
+        self.saveToCentralCylinderCache(cacheKey, opticalAttenuationOfCentralCylinderTable, self.centralCylinderCenters)
+
+    self.setBusyCursor(False)
     logging.info('CALIBRATION data has been successfully parsed with averaging radius {0}mm ({1}px)'.format(centralRadiusMm, centralRadiusPixel))
     self.calibrationDataArray = opticalAttenuationOfCentralCylinderTable
     return True
 
   # ---------------------------------------------------------------------------
-  def alignPddToCalibration(self):
-    qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
+  def computeMeanOpticalAttenuationOfCentralCylinderForRadii(self, calibrationVolumeNodeID, maximumRadiusMm):
+    # Compute the central cylinder tables (see getMeanOpticalAttenuationOfCentralCylinder) for all averaging radii
+    # up to the maximum radius in one pass over the CALIBRATION volume. The table for a radius can then be
+    # selected using selectCentralCylinderRadius without parsing the volume again
+    self.setBusyCursor(True)
+
+    calibrationVolume = slicer.util.getNode(calibrationVolumeNodeID)
+    calibrationVolumeImageData = calibrationVolume.GetImageData()
+    calibrationVolumeSliceThicknessCm = calibrationVolume.GetSpacing()[2] / 10.0
+    self.centralCylinderRadiusSpacingMm = calibrationVolume.GetSpacing()[0]
+    maximumRadiusPixel = int(numpy.ceil(maximumRadiusMm / self.centralCylinderRadiusSpacingMm))
+
+    numpyImageDataArray, subExtent, depthOffsetCm = self.getCalibrationVolumeArrayForParsing(calibrationVolume)
+    if numpyImageDataArray is None:
+      self.setBusyCursor(False)
+      return False
+    self.centralCylinderRadiusTablesSource = (calibrationVolumeNodeID, calibrationVolumeImageData.GetMTime(), subExtent)
+    centerXCoordinate = (numpyImageDataArray.shape[0]-1)/2
+    centerYCoordinate = (numpyImageDataArray.shape[1]-1)/2
+
+    self.centralCylinderRadiusTables = self.computeOpticalAttenuationOfCentralCylinderTablesForRadii(
+      numpyImageDataArray, centerXCoordinate, centerYCoordinate, maximumRadiusPixel, calibrationVolumeSliceThicknessCm)
+    self.centralCylinderRadiusTables[:, :, 0] += depthOffsetCm
+
+    self.setBusyCursor(False)
+    logging.info('CALIBRATION data has been parsed for averaging radii up to {0}mm ({1}px)'.format(maximumRadiusMm, maximumRadiusPixel))
+    return True
+
+  # ---------------------------------------------------------------------------
+  def computeOpticalAttenuationOfCentralCylinderTablesForRadii(self, imageArray, centerXCoordinate, centerYCoordinate, maximumRadiusPixel, sliceThicknessCm):
+    # Compute the tables of computeOpticalAttenuationOfCentralCylinderTable for the radii 0..maximumRadiusPixel
+    # A pixel is in the disk of radius r if its distance from the center is at most r, so the pixels are binned by
+    # the smallest radius containing them, and cumulative sums and squared sums over the bins give the statistics
+    # for every radius. Returns array indexed by [radius, row, column]. The rows are NaN for radii without pixels
+    xMin = max(floor(centerXCoordinate - maximumRadiusPixel + 0.5), 0)
+    xMax = min(ceil(centerXCoordinate + maximumRadiusPixel + 0.5), imageArray.shape[0])
+    yMin = max(floor(centerYCoordinate - maximumRadiusPixel + 0.5), 0)
+    yMax = min(ceil(centerYCoordinate + maximumRadiusPixel + 0.5), imageArray.shape[1])
+
+    distanceOfX = numpy.abs(numpy.arange(xMin, xMax) - centerXCoordinate)[:, numpy.newaxis]
+    distanceOfY = numpy.abs(numpy.arange(yMin, yMax) - centerYCoordinate)[numpy.newaxis, :]
+    pixelRadii = numpy.ceil(numpy.sqrt(distanceOfX**2 + distanceOfY**2)).ravel()
+
+    # Voxels of the cylinder with one row per pixel (sorted by radius) and one column per slice
+    numberOfSlices = imageArray.shape[2]
+    cylinderVoxels = imageArray[xMin:xMax, yMin:yMax, :].reshape(-1, numberOfSlices).astype(numpy.float64)
+    sortedPixelIndices = numpy.argsort(pixelRadii, kind='stable')
+    pixelRadii = pixelRadii[sortedPixelIndices]
+    cylinderVoxels = cylinderVoxels[sortedPixelIndices]
+
+    # Subtract the mean of each slice before summing, as the variance computed from the sums of values and squared
+    # values would lose all precision for voxels with large offset compared to their variation
+    sliceShifts = cylinderVoxels.mean(axis=0)
+    cylinderVoxels -= sliceShifts
+
+    # Cumulative sums with a leading zero row, so that the sums for the first n pixels are in row n
+    cumulativeSums = numpy.zeros((cylinderVoxels.shape[0]+1, numberOfSlices))
+    numpy.cumsum(cylinderVoxels, axis=0, out=cumulativeSums[1:])
+    cumulativeSquaredSums = numpy.zeros((cylinderVoxels.shape[0]+1, numberOfSlices))
+    numpy.cumsum(cylinderVoxels**2, axis=0, out=cumulativeSquaredSums[1:])
+    numberOfPixelsForRadii = numpy.searchsorted(pixelRadii, numpy.arange(maximumRadiusPixel+1), side='right')
+
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+      shiftedMeans = cumulativeSums[numberOfPixelsForRadii] / numberOfPixelsForRadii[:, numpy.newaxis]
+      variances = cumulativeSquaredSums[numberOfPixelsForRadii] / numberOfPixelsForRadii[:, numpy.newaxis] - shiftedMeans**2
+    means = shiftedMeans + sliceShifts
+    tables = numpy.zeros((maximumRadiusPixel+1, numberOfSlices, 3))
+    tables[:, :, 0] = numpy.arange(numberOfSlices) * sliceThicknessCm
+    tables[:, :, 1] = means[:, ::-1]
+    tables[:, :, 2] = numpy.sqrt(numpy.maximum(variances[:, ::-1], 0))
+    return tables
+
+  # ---------------------------------------------------------------------------
+  def selectCentralCylinderRadius(self, calibrationVolumeNodeID, centralRadiusMm):
+    # Use the central cylinder table of the given radius (computed by computeMeanOpticalAttenuationOfCentralCylinderForRadii)
+    # as CALIBRATION data. Returns False if the tables have not been computed for the radius or the current volume
+    if self.centralCylinderRadiusTables is None:
+      return False
+    calibrationVolume = slicer.util.getNode(calibrationVolumeNodeID)
+    subExtent = self.getCalibrationVolumeParsingSubExtent(calibrationVolume)
+    if self.centralCylinderRadiusTablesSource != (calibrationVolumeNodeID, calibrationVolume.GetImageData().GetMTime(), subExtent):
+      return False
+    if self.trackCentralCylinderAxis:
+      # The tables of the radii are computed around the center of the volume
+      return False
+    centralRadiusPixel = int(numpy.ceil(centralRadiusMm / self.centralCylinderRadiusSpacingMm))
+    if centralRadiusPixel >= self.centralCylinderRadiusTables.shape[0] or numpy.isnan(self.centralCylinderRadiusTables[centralRadiusPixel, 0, 1]):
+      return False
+    logging.info('CALIBRATION data has been taken from the parsed radii with averaging radius {0}mm ({1}px)'.format(centralRadiusMm, centralRadiusPixel))
+    self.calibrationDataArray = self.centralCylinderRadiusTables[centralRadiusPixel].copy()
+    return True
+
+  # ---------------------------------------------------------------------------
+  def getCentralCylinderRadiusSensitivity(self):
+    # Returns array with the following columns for each radius with pixels: radius (mm), mean of the per-slice
+    # std.dev. of optical attenuation, RMS difference of the mean optical attenuation curve from that of the largest radius
+    validRadii = numpy.flatnonzero(~numpy.isnan(self.centralCylinderRadiusTables[:, 0, 1]))
+    meanCurves = self.centralCylinderRadiusTables[validRadii, :, 1]
+    return numpy.column_stack((
+      validRadii * self.centralCylinderRadiusSpacingMm,
+      self.centralCylinderRadiusTables[validRadii, :, 2].mean(axis=1),
+      numpy.sqrt(((meanCurves - meanCurves[-1])**2).mean(axis=1)) ))
+
+  # ---------------------------------------------------------------------------
+  def getCalibrationVolumeParsingSubExtent(self, calibrationVolume):
+    # Compute the sub-extent [iMin, iMax, jMin, jMax, kMin, kMax] (0-based, inclusive) of the CALIBRATION volume
+    # to parse from the ROI and depth range. Returns None if the region does not contain any voxels
+    dimensions = calibrationVolume.GetImageData().GetDimensions()
+    subExtent = [0, dimensions[0]-1, 0, dimensions[1]-1, 0, dimensions[2]-1]
+
+    # Voxels whose center is inside the bounding box of the ROI in IJK coordinates
+    if self.calibrationVolumeParsingRoiNodeID:
+      roiNode = slicer.util.getNode(self.calibrationVolumeParsingRoiNodeID)
+      roiBoundsRas = [0.0] * 6
+      roiNode.GetRASBounds(roiBoundsRas)
+      rasToIjk = vtk.vtkMatrix4x4()
+      calibrationVolume.GetRASToIJKMatrix(rasToIjk)
+      roiCornersIjk = numpy.array([rasToIjk.MultiplyPoint([r, a, s, 1.0])[0:3]
+        for r in roiBoundsRas[0:2] for a in roiBoundsRas[2:4] for s in roiBoundsRas[4:6]])
+      for axis in range(3):
+        subExtent[2*axis] = max(subExtent[2*axis], int(ceil(roiCornersIjk[:,axis].min() - 1e-6)))
+        subExtent[2*axis+1] = min(subExtent[2*axis+1], int(floor(roiCornersIjk[:,axis].max() + 1e-6)))
+
+    # Depth increases with decreasing slice index, starting from the last slice
+    if self.calibrationVolumeParsingDepthRangeCm is not None:
+      sliceThicknessCm = calibrationVolume.GetSpacing()[2] / 10.0
+      depthRangeSlices = numpy.array(self.calibrationVolumeParsingDepthRangeCm, dtype=numpy.float64) / sliceThicknessCm
+      subExtent[4] = max(subExtent[4], dimensions[2]-1 - int(floor(depthRangeSlices[1] + 1e-6)))
+      subExtent[5] = min(subExtent[5], dimensions[2]-1 - int(ceil(depthRangeSlices[0] - 1e-6)))
+
+    if subExtent[0] > subExtent[1] or subExtent[2] > subExtent[3] or subExtent[4] > subExtent[5]:
+      return None
+    return subExtent
+
+  # ---------------------------------------------------------------------------
+  def getCalibrationVolumeArrayForParsing(self, calibrationVolume):
+    # Returns the voxels of the parsed region of the CALIBRATION volume as a view indexed as [x, y, z] (no voxels
+    # are copied), its sub-extent, and the depth (cm) of its last slice. Returns None array if the region is empty
+    subExtent = self.getCalibrationVolumeParsingSubExtent(calibrationVolume)
+    if subExtent is None:
+      logging.error('The parsed region of the CALIBRATION volume (ROI and depth range) does not contain any voxels')
+      return None, None, None
+    calibrationVolumeImageData = calibrationVolume.GetImageData()
+    dimensions = calibrationVolumeImageData.GetDimensions()
+    imageArray = numpy.reshape(numpy_support.vtk_to_numpy(calibrationVolumeImageData.GetPointData().GetScalars()), dimensions, 'F')
+    imageArray = imageArray[subExtent[0]:subExtent[1]+1, subExtent[2]:subExtent[3]+1, subExtent[4]:subExtent[5]+1]
+    depthOffsetCm = (dimensions[2]-1 - subExtent[5]) * calibrationVolume.GetSpacing()[2] / 10.0
+    return imageArray, subExtent, depthOffsetCm
+
+  # ---------------------------------------------------------------------------
+  def getCentralCylinderCacheKey(self, calibrationVolume, voxelArray, centralRadiusMm, subExtent):
+    # Hash of everything the central cylinder table depends on: the voxels of the parsed region (identified by the
+    # volume file if possible), geometry, averaging radius, axis tracking settings and parsed region (ROI and depth range)
+    import hashlib
+    hasher = hashlib.blake2b(digest_size=20)
+    axisThreshold = float(self.centralCylinderAxisThreshold) if self.centralCylinderAxisThreshold is not None else None
+    hasher.update(repr(['CentralCylinderTable_v2', str(voxelArray.dtype), list(calibrationVolume.GetImageData().GetExtent()),
+      list(calibrationVolume.GetSpacing()), float(centralRadiusMm), bool(self.trackCentralCylinderAxis), axisThreshold, list(subExtent)]).encode())
+    # The volume file is hashed instead of the voxels if possible: hashing reads every voxel of the parsed region,
+    # which takes a significant part of the parsing time that the cache is meant to save
+    volumeFileKey = self.getCentralCylinderCacheVolumeFileKey(calibrationVolume)
+    if volumeFileKey is not None:
+      hasher.update(repr(volumeFileKey).encode())
+    else:
+      # The voxel array is a strided view if the region is cropped, so it is hashed one slice at a time
+      # instead of copying the whole region into a contiguous array
+      for sliceIndex in range(voxelArray.shape[2]):
+        hasher.update(memoryview(numpy.ascontiguousarray(voxelArray[:, :, sliceIndex].T)).cast('B'))
+    return hasher.hexdigest()
+
+  # ---------------------------------------------------------------------------
+  def getCentralCylinderCacheVolumeFileKey(self, calibrationVolume):
+    # Identify the voxels by the file the volume was loaded from (path, modification time and size), so that the
+    # voxels do not need to be hashed. Returns None if the volume is not stored in a file or has been modified since read
+    storageNode = calibrationVolume.GetStorageNode()
+    if storageNode is None or calibrationVolume.GetModifiedSinceRead():
+      return None
+    filePath = storageNode.GetFileName()
+    if not filePath or not os.path.isfile(filePath):
+      return None
+    fileStat = os.stat(filePath)
+    return ['VolumeFile', os.path.abspath(filePath), fileStat.st_mtime, fileStat.st_size]
+
+  # ---------------------------------------------------------------------------
+  def getCentralCylinderCacheDirectory(self):
+    if self.centralCylinderCacheDirectory:
+      return self.centralCylinderCacheDirectory
+    cacheRootDirectory = slicer.app.cachePath if hasattr(slicer.app, 'cachePath') else slicer.app.temporaryPath
+    return os.path.join(cacheRootDirectory, 'GelDosimetry', 'CentralCylinderCache')
+
+  # ---------------------------------------------------------------------------
+  def loadFromCentralCylinderCache(self, cacheKey):
+    # Returns the cached table and cylinder centers (None if the axis was not tracked), or [None, None] if not found
+    cacheFilePath = os.path.join(self.getCentralCylinderCacheDirectory(), cacheKey + '.npz')
+    if not os.path.exists(cacheFilePath):
+      return [None, None]
+    try:
+      with numpy.load(cacheFilePath, allow_pickle=False) as cacheData:
+        table = cacheData['table']
+        centers = cacheData['centers'] if 'centers' in cacheData.files else None
+      # Update modification time to mark the entry as recently used
+      os.utime(cacheFilePath, None)
+    except (IOError, OSError, ValueError, KeyError) as e:
+      logging.warning('Failed to read central cylinder cache file ' + repr(cacheFilePath) + ': ' + str(e))
+      return [None, None]
+    logging.info('Central cylinder table loaded from cache')
+    return [table, centers]
+
+  # ---------------------------------------------------------------------------
+  def saveToCentralCylinderCache(self, cacheKey, table, centers=None):
+    # Save the table (and the cylinder centers if the axis is tracked) and remove the least recently used entries if the cache exceeds its maximum size
+    cacheDirectory = self.getCentralCylinderCacheDirectory()
+    try:
+      if not os.path.exists(cacheDirectory):
+        os.makedirs(cacheDirectory)
+      # Write to temporary file then rename, so that concurrent processes never read partial files
+      temporaryFilePath = os.path.join(cacheDirectory, cacheKey + '.{0}.tmp'.format(os.getpid()))
+      cacheData = {'table': table}
+      if centers is not None:
+        cacheData['centers'] = centers
+      with open(temporaryFilePath, 'wb') as cacheFile:
+        numpy.savez(cacheFile, **cacheData)
+      os.replace(temporaryFilePath, os.path.join(cacheDirectory, cacheKey + '.npz'))
+
+      # Entries of older cache versions are also counted, so that they are evicted eventually
+      cacheEntries = []
+      for fileName in os.listdir(cacheDirectory):
+        if fileName.endswith('.npz') or fileName.endswith('.npy'):
+          fileStat = os.stat(os.path.join(cacheDirectory, fileName))
+          cacheEntries.append([fileStat.st_mtime, fileStat.st_size, fileName])
+      cacheEntries.sort(reverse=True)
+      cacheSize = 0
+      for [modificationTime, fileSize, fileName] in cacheEntries:
+        cacheSize += fileSize
+        if cacheSize > self.centralCylinderCacheMaximumSizeMb * 1024 * 1024 and fileName != cacheKey + '.npz':
+          os.remove(os.path.join(cacheDirectory, fileName))
+    except (IOError, OSError) as e:
+      logging.warning('Failed to write central cylinder cache in ' + repr(cacheDirectory) + ': ' + str(e))
+
+  # ---------------------------------------------------------------------------
+  def computeOpticalAttenuationOfCentralCylinderTable(self, imageArray, centerXCoordinate, centerYCoordinate, centralRadiusPixel, sliceThicknessCm):
+    # Compute the depth/mean/std.dev. table of the central cylinder from an image array indexed as [x, y, z]
+    # The first row of the table corresponds to the last slice (highest z), as the depth increases with decreasing z
+    # The disk mask is built once and applied to every slice in a single reduction
+    xMin = max(floor(centerXCoordinate - centralRadiusPixel + 0.5), 0)
+    xMax = min(ceil(centerXCoordinate + centralRadiusPixel + 0.5), imageArray.shape[0])
+    yMin = max(floor(centerYCoordinate - centralRadiusPixel + 0.5), 0)
+    yMax = min(ceil(centerYCoordinate + centralRadiusPixel + 0.5), imageArray.shape[1])
+
+    distanceOfX = numpy.abs(numpy.arange(xMin, xMax) - centerXCoordinate)[:, numpy.newaxis]
+    distanceOfY = numpy.abs(numpy.arange(yMin, yMax) - centerYCoordinate)[numpy.newaxis, :]
+    diskMask = ((distanceOfX + distanceOfY) <= centralRadiusPixel) | ((distanceOfX**2 + distanceOfY**2) <= centralRadiusPixel**2)
+
+    # Voxels of the cylinder with one row per disk pixel and one column per slice
+    cylinderVoxels = imageArray[xMin:xMax, yMin:yMax, :][diskMask].astype(numpy.float64)
+
+    numberOfSlices = imageArray.shape[2]
+    opticalAttenuationOfCentralCylinderTable = numpy.zeros((numberOfSlices, 3))
+    opticalAttenuationOfCentralCylinderTable[:, 0] = numpy.arange(numberOfSlices) * sliceThicknessCm
+    opticalAttenuationOfCentralCylinderTable[:, 1] = cylinderVoxels.mean(axis=0)[::-1]
+    opticalAttenuationOfCentralCylinderTable[:, 2] = cylinderVoxels.std(axis=0)[::-1]
+    return opticalAttenuationOfCentralCylinderTable
+
+  # ---------------------------------------------------------------------------
+  def computeCentralCylinderCenters(self, imageArray, threshold=None):
+    # Compute the centroid of the voxels above the threshold on each slice of an image array indexed as [x, y, z]
+    # If threshold is None, then the midpoint between the minimum and maximum of each slice is used
+    # Slices without voxels above the threshold get the center of the slice. Returns array indexed by [z, (x,y)]
+    if threshold is None:
+      threshold = (imageArray.min(axis=(0,1)) + imageArray.max(axis=(0,1))) / 2.0
+    vialMask = imageArray >= threshold
+    vialPixelsInColumns = vialMask.sum(axis=1, dtype=numpy.int64) # Indexed as [x, z]
+    vialPixelsInRows = vialMask.sum(axis=0, dtype=numpy.int64) # Indexed as [y, z]
+    numberOfVialPixels = vialPixelsInColumns.sum(axis=0)
+
+    # First moments of the mask along X and Y divided by the zeroth moment
+    centers = numpy.zeros((imageArray.shape[2], 2))
+    centers[:,0] = (imageArray.shape[0]-1) / 2.0
+    centers[:,1] = (imageArray.shape[1]-1) / 2.0
+    slicesWithVial = numberOfVialPixels > 0
+    firstMomentX = numpy.arange(imageArray.shape[0]).dot(vialPixelsInColumns)
+    firstMomentY = numpy.arange(imageArray.shape[1]).dot(vialPixelsInRows)
+    centers[slicesWithVial,0] = firstMomentX[slicesWithVial] / numberOfVialPixels[slicesWithVial]
+    centers[slicesWithVial,1] = firstMomentY[slicesWithVial] / numberOfVialPixels[slicesWithVial]
+    return centers
+
+  # ---------------------------------------------------------------------------
+  def computeOpticalAttenuationOfCentralCylinderTableForCenters(self, imageArray, centers, centralRadiusPixel, sliceThicknessCm):
+    # Same as computeOpticalAttenuationOfCentralCylinderTable, but the disk is centered on centers[z] on slice z
+    # The window containing the disk is gathered for all slices at once, and the pixels outside the disk
+    # or the image are excluded from the statistics by a mask
+    numberOfSlices = imageArray.shape[2]
+    windowSize = 2 * centralRadiusPixel + 2
+    windowX = numpy.floor(centers[:,0] - centralRadiusPixel + 0.5).astype(int)[numpy.newaxis, :] + numpy.arange(windowSize)[:, numpy.newaxis]
+    windowY = numpy.floor(centers[:,1] - centralRadiusPixel + 0.5).astype(int)[numpy.newaxis, :] + numpy.arange(windowSize)[:, numpy.newaxis]
+
+    # Arrays indexed as [window x, window y, z]
+    distanceOfX = numpy.abs(windowX - centers[:,0])[:, numpy.newaxis, :]
+    distanceOfY = numpy.abs(windowY - centers[:,1])[numpy.newaxis, :, :]
+    diskMask = ((distanceOfX + distanceOfY) <= centralRadiusPixel) | ((distanceOfX**2 + distanceOfY**2) <= centralRadiusPixel**2)
+    diskMask &= ((windowX >= 0) & (windowX < imageArray.shape[0]))[:, numpy.newaxis, :]
+    diskMask &= ((windowY >= 0) & (windowY < imageArray.shape[1]))[numpy.newaxis, :, :]
+    cylinderVoxels = imageArray[
+      numpy.clip(windowX, 0, imageArray.shape[0]-1)[:, numpy.newaxis, :],
+      numpy.clip(windowY, 0, imageArray.shape[1]-1)[numpy.newaxis, :, :],
+      numpy.arange(numberOfSlices)[numpy.newaxis, numpy.newaxis, :] ].astype(numpy.float64)
+
+    numberOfDiskPixels = numpy.count_nonzero(diskMask, axis=(0,1))
+    means = numpy.where(diskMask, cylinderVoxels, 0).sum(axis=(0,1)) / numberOfDiskPixels
+    variances = numpy.where(diskMask, (cylinderVoxels - means)**2, 0).sum(axis=(0,1)) / numberOfDiskPixels
+
+    opticalAttenuationOfCentralCylinderTable = numpy.zeros((numberOfSlices, 3))
+    opticalAttenuationOfCentralCylinderTable[:, 0] = numpy.arange(numberOfSlices) * sliceThicknessCm
+    opticalAttenuationOfCentralCylinderTable[:, 1] = means[::-1]
+    opticalAttenuationOfCentralCylinderTable[:, 2] = numpy.sqrt(variances[::-1])
+    return opticalAttenuationOfCentralCylinderTable
+
+  # ---------------------------------------------------------------------------
+  def alignPddToCalibration(self, xTransSearchRangeCm=5.0, xTransSearchStepCm=0.01):
+    # Align the calibration curve to the Pdd by translating it along X, and scaling and translating it along Y
+    # The X translation is searched within +/- xTransSearchRangeCm, first on a grid with the given step, then
+    # refined around the best grid point. The Y scale and translation are computed in closed form for each X translation
+    # Unlike the unbounded simplex search used before, X translations outside the search range are never considered,
+    # so the range needs to be increased if the curves are shifted by more than that
     error = -1.0
 
     # Check the input arrays
@@ -276,6 +680,8 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
       logging.error('Pdd or calibration data is empty')
       return error
 
+    self.setBusyCursor(True)
+
     # Discard values of 0 from both ends of the data (it is considered invalid)
     self.calibrationDataCleanedArray = self.calibrationDataArray
     calibrationCleanedNumberOfRows = self.calibrationDataCleanedArray.shape[0]
@@ -289,73 +695,124 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
     # Remove outliers from calibration array
     self.calibrationDataCleanedArray = self.removeOutliersFromArray(self.calibrationDataCleanedArray, 5, 10, 0.0075)[0]
 
-    # Do initial scaling of the calibration array based on the maximum values
-    maxPdd = self.findMaxValueInArray(self.pddDataArray)
-    maxCalibration = self.findMaxValueInArray(self.calibrationDataCleanedArray)
-    initialScaling = maxPdd / maxCalibration
-    # logging.debug('Initial scaling factor {0:.4f}'.format(initialScaling))
-
-    # Create the working structures
-    self.minimizer = vtk.vtkAmoebaMinimizer()
-    self.minimizer.SetFunction(curveAlignmentCalibrationFunction)
-    self.minimizer.SetParameterValue("xTrans",0)
-    self.minimizer.SetParameterScale("xTrans",2)
-    self.minimizer.SetParameterValue("yScale",initialScaling)
-    self.minimizer.SetParameterScale("yScale",0.1)
-    self.minimizer.SetParameterValue("yTrans",0)
-    self.minimizer.SetParameterScale("yTrans",0.2)
-    self.minimizer.SetMaxIterations(50)
-
-    self.minimizer.Minimize()
-    error = self.minimizer.GetFunctionValue()
-    xTrans = self.minimizer.GetParameterValue("xTrans")
-    yScale = self.minimizer.GetParameterValue("yScale")
-    yTrans = self.minimizer.GetParameterValue("yTrans")
+    # Evaluate the alignment error on a grid of X translations
+    xTransCandidates = numpy.arange(-xTransSearchRangeCm, xTransSearchRangeCm + xTransSearchStepCm/2, xTransSearchStepCm)
+    errors, yScales, yTranslations = self.computeCurveAlignmentForTranslations(xTransCandidates, self.pddDataArray, self.calibrationDataCleanedArray)
+    bestCandidateIndex = numpy.argmin(errors)
+    if not numpy.isfinite(errors[bestCandidateIndex]):
+      self.setBusyCursor(False)
+      logging.error('Pdd and calibration data do not overlap within the X translation search range')
+      return error
+    if bestCandidateIndex == 0 or bestCandidateIndex == xTransCandidates.shape[0]-1:
+      logging.warning('The best X translation is at the boundary of the search range (+/- {0}cm), the curves may be better aligned with a larger range'.format(xTransSearchRangeCm))
+
+    # Refine X translation around the best grid point using golden section search
+    goldenRatio = (sqrt(5.0) - 1.0) / 2.0
+    lowerXTrans = max(xTransCandidates[bestCandidateIndex] - xTransSearchStepCm, -xTransSearchRangeCm)
+    upperXTrans = min(xTransCandidates[bestCandidateIndex] + xTransSearchStepCm, xTransSearchRangeCm)
+    while upperXTrans - lowerXTrans > 1e-4:
+      innerXTranslations = numpy.array([upperXTrans - goldenRatio * (upperXTrans - lowerXTrans), lowerXTrans + goldenRatio * (upperXTrans - lowerXTrans)])
+      innerErrors = self.computeCurveAlignmentForTranslations(innerXTranslations, self.pddDataArray, self.calibrationDataCleanedArray)[0]
+      if innerErrors[0] < innerErrors[1]:
+        upperXTrans = innerXTranslations[1]
+      else:
+        lowerXTrans = innerXTranslations[0]
+    refinedResult = self.computeCurveAlignmentForTranslations(numpy.array([(lowerXTrans + upperXTrans) / 2.0]), self.pddDataArray, self.calibrationDataCleanedArray)
+
+    if refinedResult[0][0] <= errors[bestCandidateIndex]:
+      xTrans = (lowerXTrans + upperXTrans) / 2.0
+      [error, yScale, yTrans] = [refinedResult[0][0], refinedResult[1][0], refinedResult[2][0]]
+    else:
+      xTrans = xTransCandidates[bestCandidateIndex]
+      [error, yScale, yTrans] = [errors[bestCandidateIndex], yScales[bestCandidateIndex], yTranslations[bestCandidateIndex]]
+    [error, xTrans, yScale, yTrans] = [float(error), float(xTrans), float(yScale), float(yTrans)]
 
     # Create aligned array
     self.createAlignedCalibrationArray(xTrans, yScale, yTrans)
 
-    qt.QApplication.restoreOverrideCursor()
+    self.setBusyCursor(False)
     logging.info('CALIBRATION successfully aligned with PDD with error={0:.2f} and parameters xTrans={1:.2f}, yScale={2:.2f}, yTrans={3:.2f}'.format(error, xTrans, yScale, yTrans))
     return [error, xTrans, yScale, yTrans]
 
+  # ---------------------------------------------------------------------------
+  def computeCurveAlignmentForTranslations(self, xTranslations, pddArray, calibrationArray):
+    # Compute the alignment of the calibration curve to the Pdd for each X translation
+    # The calibration curve translated by xTrans, scaled by yScale and translated by yTrans is interpolated
+    # linearly at the Pdd depths within its range. For each X translation the yScale and yTrans minimizing the
+    # sum of squared differences are computed in closed form (linear least squares)
+    # Calibration array depths need to be in increasing order
+    # Returns the arrays of the sum of squared differences (infinity if there is no valid fit), yScale and yTrans
+    pddDepths = pddArray[:, 0]
+    pddDoses = pddArray[:, 1]
+
+    # One row for each X translation, one column for each Pdd depth
+    calibrationDepths = pddDepths[numpy.newaxis, :] - numpy.asarray(xTranslations)[:, numpy.newaxis]
+    inRange = (calibrationDepths >= calibrationArray[0, 0]) & (calibrationDepths <= calibrationArray[-1, 0])
+    calibrationValues = numpy.where(inRange, numpy.interp(calibrationDepths, calibrationArray[:, 0], calibrationArray[:, 1]), 0.0)
+    doseValues = numpy.where(inRange, pddDoses[numpy.newaxis, :], 0.0)
+
+    # Closed form linear least squares solution of dose = yScale * calibration + yTrans
+    numberOfPoints = inRange.sum(axis=1)
+    sumCalibration = calibrationValues.sum(axis=1)
+    sumDose = doseValues.sum(axis=1)
+    sumCalibrationSquared = (calibrationValues**2).sum(axis=1)
+    sumCalibrationDose = (calibrationValues * doseValues).sum(axis=1)
+    denominator = numberOfPoints * sumCalibrationSquared - sumCalibration**2
+    valid = (numberOfPoints >= 2) & (denominator > 0)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+      yScales = numpy.where(valid, (numberOfPoints * sumCalibrationDose - sumCalibration * sumDose) / denominator, numpy.nan)
+      yTranslations = numpy.where(valid, (sumDose - yScales * sumCalibration) / numberOfPoints, numpy.nan)
+
+    residuals = numpy.where(inRange, doseValues - yScales[:, numpy.newaxis] * calibrationValues - yTranslations[:, numpy.newaxis], 0.0)
+    errors = numpy.where(valid, (residuals**2).sum(axis=1), numpy.inf)
+    return [errors, yScales, yTranslations]
+
   # ---------------------------------------------------------------------------
   def createAlignedCalibrationArray(self, xTrans, yScale, yTrans):
+    # Sample the X-translated cleaned CALIBRATION curve at the PDD depths within its range
+    # (the std.dev. column of the parsed CALIBRATION data is not used)
+    calibrationTranslatedArray = self.calibrationDataCleanedArray[:,0:2] + [xTrans, 0]
+    pddDepths = self.pddDataArray[:,0]
+    if calibrationTranslatedArray.shape[0] > 0:
+      inRange = (pddDepths >= calibrationTranslatedArray[:,0].min()) & (pddDepths <= calibrationTranslatedArray[:,0].max())
+    else:
+      inRange = numpy.zeros(pddDepths.shape, dtype=bool)
+    alignedDepths = pddDepths[inRange]
+    alignedValues = self.interpolateFunctionArray(calibrationTranslatedArray, alignedDepths)
+
     # Create aligned array used for computation
-    self.calibrationDataAlignedArray = numpy.zeros([self.pddDataArray.shape[0], 2])
-    interpolator = vtk.vtkPiecewiseFunction()
-    self.populateInterpolatorForParameters(interpolator, xTrans, 1, 0)
-    interpolatorRange = interpolator.GetRange()
-    sumSquaredDifference = 0.0
-    calibrationAlignedRowIndex = -1
-    pddNumberOfRows = self.pddDataArray.shape[0]
-    for pddRowIndex in range(pddNumberOfRows):
-      pddCurrentDepth = self.pddDataArray[pddRowIndex, 0]
-      if pddCurrentDepth >= interpolatorRange[0] and pddCurrentDepth <= interpolatorRange[1]:
-        calibrationAlignedRowIndex += 1
-        self.calibrationDataAlignedArray[calibrationAlignedRowIndex, 0] = pddCurrentDepth
-        self.calibrationDataAlignedArray[calibrationAlignedRowIndex, 1] = interpolator.GetValue(pddCurrentDepth)
-      else:
-        # If the Pdd depth value is out of range then delete the last row (it will never be set, but we need to remove the zeros from the end)
-        self.calibrationDataAlignedArray = numpy.delete(self.calibrationDataAlignedArray, self.calibrationDataAlignedArray.shape[0]-1, 0)
-
-    # Create aligned array used for display (visual alignment)
-    self.calibrationDataAlignedToDisplayArray = numpy.zeros([self.pddDataArray.shape[0], 2])
-    interpolator = vtk.vtkPiecewiseFunction()
-    self.populateInterpolatorForParameters(interpolator, xTrans, yScale, yTrans)
-    interpolatorRange = interpolator.GetRange()
-    sumSquaredDifference = 0.0
-    calibrationAlignedRowIndex = -1
-    pddNumberOfRows = self.pddDataArray.shape[0]
-    for pddRowIndex in range(pddNumberOfRows):
-      pddCurrentDepth = self.pddDataArray[pddRowIndex, 0]
-      if pddCurrentDepth >= interpolatorRange[0] and pddCurrentDepth <= interpolatorRange[1]:
-        calibrationAlignedRowIndex += 1
-        self.calibrationDataAlignedToDisplayArray[calibrationAlignedRowIndex, 0] = pddCurrentDepth
-        self.calibrationDataAlignedToDisplayArray[calibrationAlignedRowIndex, 1] = interpolator.GetValue(pddCurrentDepth)
-      else:
-        # If the Pdd depth value is out of range then delete the last row (it will never be set, but we need to remove the zeros from the end)
-        self.calibrationDataAlignedToDisplayArray = numpy.delete(self.calibrationDataAlignedToDisplayArray, self.calibrationDataAlignedToDisplayArray.shape[0]-1, 0)
+    self.calibrationDataAlignedArray = numpy.column_stack((alignedDepths, alignedValues))
+    # Create aligned array used for display (visual alignment). Y scaling and translation commute with the linear interpolation
+    self.calibrationDataAlignedToDisplayArray = numpy.column_stack((alignedDepths, alignedValues * yScale + yTrans))
+    self.calibrationDataAlignedXTranslation = xTrans
+
+  # ---------------------------------------------------------------------------
+  def updateAlignedCalibrationArray(self, xTrans, yScale, yTrans):
+    # Update the aligned calibration arrays after changing the alignment parameters (e.g. during manual adjustment)
+    # If only the Y scale or translation changed, then the display array is updated in place without re-sampling
+    # the CALIBRATION curve. Returns True if the arrays were re-created (the number of rows may have changed)
+    if self.calibrationDataAlignedArray is None or self.calibrationDataAlignedToDisplayArray is None or xTrans != self.calibrationDataAlignedXTranslation:
+      self.createAlignedCalibrationArray(xTrans, yScale, yTrans)
+      return True
+
+    displayValues = self.calibrationDataAlignedToDisplayArray[:,1]
+    numpy.multiply(self.calibrationDataAlignedArray[:,1], yScale, out=displayValues)
+    displayValues += yTrans
+    return False
+
+  # ---------------------------------------------------------------------------
+  def interpolateFunctionArray(self, functionArray, xValues):
+    # Linear interpolation of the function given by the (x,y) rows of the array at the given x values
+    # (same as vtkPiecewiseFunction, which sorts the points by x)
+    functionX = functionArray[:,0]
+    functionY = functionArray[:,1]
+    if functionX.shape[0] == 0:
+      return numpy.zeros(numpy.shape(xValues))
+    if numpy.any(functionX[1:] < functionX[:-1]):
+      sortedIndices = numpy.argsort(functionX, kind='stable')
+      functionX = functionX[sortedIndices]
+      functionY = functionY[sortedIndices]
+    return numpy.interp(xValues, functionX, functionY)
 
   # ---------------------------------------------------------------------------
   def removeOutliersFromArray(self, arrayToClean, outlierThreshold, maxNumberOfOutlierIterations, minimumMeanDifferenceInFractionOfMaxValueThreshold):
@@ -367,108 +824,82 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
     #   minimumMeanDifferenceInFractionOfMaxValueThreshold: The array is considered not to contain outliers
     #     if the mean differences are less than the maximum value multiplied by this value
     numberOfFoundOutliers = -1
-    numberOfIterations = 0
 
     # Compute average difference between two adjacent points. Go from both ends of the curve,
     # and throw away points that have a difference bigger than the computed average multiplied by N.
     # Do this until no points are thrown away in an iteration OR there are no points left (error)
     # OR the average difference is small enough
-    numberOfRows = arrayToClean.shape[0]
-    while numberOfIterations < maxNumberOfOutlierIterations and numberOfFoundOutliers != 0 and numberOfRows > 0:
-      maxValue = self.findMaxValueInArray(arrayToClean)
-      meanDifference = self.computeMeanDifferenceOfNeighborsForArray(arrayToClean)
-      # logging.debug('Outlier removal iteration {0}: MeanDifference={1:.2f} (fraction of max value: {2:.4f})'.format(numberOfIterations, meanDifference, meanDifference/maxValue))
-      # logging.debug('  Difference at edges: first={0:.2f}  last={1:.2f}'.format(abs(arrayToClean[0,1] - arrayToClean[1,1]), abs(arrayToClean[numberOfRows-1,1] - arrayToClean[numberOfRows-2,1])))
+    # The differences are computed once, and the kept range [firstRow, endRow) is narrowed in each iteration
+    # using masks on the differences. The array is only sliced at the end
+    values = arrayToClean[:,1]
+    differences = numpy.abs(numpy.diff(values))
+    firstRow = 0
+    endRow = arrayToClean.shape[0]
+    for numberOfIterations in range(maxNumberOfOutlierIterations):
+      if endRow - firstRow < 2:
+        break
+      maxValue = self.findMaxValueInArray(arrayToClean[firstRow:endRow])
+      rangeDifferences = differences[firstRow:endRow-1]
+      # Sequential summation (as opposed to the pairwise summation of numpy.sum) to get the exact same mean as before
+      meanDifference = numpy.add.accumulate(rangeDifferences)[-1] / rangeDifferences.shape[0]
       if meanDifference < maxValue * minimumMeanDifferenceInFractionOfMaxValueThreshold:
-        # logging.debug('  MaxValue: {0:.2f} ({1:.4f}), finishing outlier search'.format(maxValue,maxValue*minimumMeanDifferenceInFractionOfMaxValueThreshold))
         break
-      numberOfFoundOutliers = 0
-      # Remove outliers from the beginning
-      while abs(arrayToClean[0,1] - arrayToClean[1,1]) > meanDifference * outlierThreshold:
-        # logging.debug('  Deleted first: {0:.2f},{0:.2f}  difference={0:.2f}'.format(arrayToClean[0,0], arrayToClean[0,1], abs(arrayToClean[0,1] - arrayToClean[1,1])))
-        arrayToClean = numpy.delete(arrayToClean, 0, 0)
-        numberOfFoundOutliers += 1
-      # Remove outliers from the end
-      numberOfRows = arrayToClean.shape[0]
-      while abs(arrayToClean[numberOfRows-1,1] - arrayToClean[numberOfRows-2,1]) > meanDifference * outlierThreshold:
-        # logging.debug('  Deleted last: {0:.2f},{0:.2f}  difference={0:.2f}'.format(arrayToClean[numberOfRows-1,0], arrayToClean[numberOfRows-1,1], abs(arrayToClean[numberOfRows-1,1] - arrayToClean[numberOfRows-2,1])))
-        arrayToClean = numpy.delete(arrayToClean, numberOfRows-1, 0)
-        numberOfRows = arrayToClean.shape[0]
-        numberOfFoundOutliers += 1
-      numberOfRows = arrayToClean.shape[0]
-      numberOfIterations += 1
-
-    return [arrayToClean, numberOfFoundOutliers]
+      isNotOutlierDifference = ~(rangeDifferences > meanDifference * outlierThreshold)
+      if not isNotOutlierDifference.any():
+        # All points are outliers
+        numberOfFoundOutliers = endRow - firstRow - 1
+        firstRow = endRow - 1
+        break
+      # Remove outliers from the beginning (until the first non-outlier difference)
+      # and from the end (after the last non-outlier difference)
+      numberOfRemovedFirstRows = numpy.argmax(isNotOutlierDifference)
+      numberOfRemovedLastRows = numpy.argmax(isNotOutlierDifference[::-1])
+      numberOfFoundOutliers = int(numberOfRemovedFirstRows + numberOfRemovedLastRows)
+      firstRow += numberOfRemovedFirstRows
+      endRow -= numberOfRemovedLastRows
+      if numberOfFoundOutliers == 0:
+        break
+
+    return [arrayToClean[firstRow:endRow].copy(), numberOfFoundOutliers]
 
   # ---------------------------------------------------------------------------
   def computeMeanDifferenceOfNeighborsForArray(self, array):
-    numberOfValues = array.shape[0]
-    sumDifferences = 0
-    for index in range(numberOfValues-1):
-      sumDifferences += abs(array[index, 1] - array[index+1, 1])
-    return sumDifferences / (numberOfValues-1)
+    differences = numpy.abs(numpy.diff(array[:,1]))
+    return numpy.add.accumulate(differences)[-1] / differences.shape[0]
 
   # ---------------------------------------------------------------------------
   def findMaxValueInArray(self, array):
-    numberOfValues = array.shape[0]
-    maximumValue = -1
-    for index in range(numberOfValues):
-      if array[index, 1] > maximumValue:
-        maximumValue = array[index, 1]
-    return maximumValue
-
-  # ---------------------------------------------------------------------------
-  def populateInterpolatorForParameters(self, interpolator, xTrans, yScale, yTrans):
-    calibrationNumberOfRows = self.calibrationDataCleanedArray.shape[0]
-    for calibrationRowIndex in range(calibrationNumberOfRows):
-      xTranslated = self.calibrationDataCleanedArray[calibrationRowIndex, 0] + xTrans
-      yScaled = self.calibrationDataCleanedArray[calibrationRowIndex, 1] * yScale
-      yStretched = yScaled + yTrans
-      interpolator.AddPoint(xTranslated, yStretched)
+    # Returns -1 if all values are smaller than that
+    return numpy.fmax.reduce(array[:,1], initial=-1)
 
   # ---------------------------------------------------------------------------
   def computeDoseForMeasuredData(self, rdf, monitorUnits):
-    self.calculatedDose = numpy.zeros(self.pddDataArray.shape)
-    pddNumberOfRows = self.pddDataArray.shape[0]
-    for pddRowIndex in range(pddNumberOfRows):
-      self.calculatedDose[pddRowIndex, 0] = self.pddDataArray[pddRowIndex, 0]
-      self.calculatedDose[pddRowIndex, 1] = self.pddDataArray[pddRowIndex, 1] * rdf * monitorUnits / 10000.0
+    self.calculatedDose = numpy.column_stack((self.pddDataArray[:,0], self.pddDataArray[:,1] * rdf * monitorUnits / 10000.0))
     return True
 
   # ---------------------------------------------------------------------------
   def createOpticalAttenuationVsDoseFunction(self, pddRangeMin=-1000, pddRangeMax=1000):
-    # Create interpolator for aligned calibration function to allow getting the values for the
-    # depths present in the calculated dose function
-    interpolator = vtk.vtkPiecewiseFunction()
-    calibrationAlignedNumberOfRows = self.calibrationDataAlignedArray.shape[0]
-    for calibrationRowIndex in range(calibrationAlignedNumberOfRows):
-      currentDose = self.calibrationDataAlignedArray[calibrationRowIndex, 0]
-      currentOpticalAttenuation = self.calibrationDataAlignedArray[calibrationRowIndex, 1]
-      interpolator.AddPoint(currentDose, currentOpticalAttenuation)
-    interpolatorRange = interpolator.GetRange()
-
-    # Get the optical attenuation and the dose values from the aligned calibration function and the calculated dose
-    self.opticalAttenuationVsDoseFunction = numpy.zeros(self.calculatedDose.shape)
-    doseNumberOfRows = self.calculatedDose.shape[0]
-    for doseRowIndex in range(doseNumberOfRows):
-      # Reverse the function so that smallest dose comes first (which decreases with depth)
-      currentDepth = self.calculatedDose[doseRowIndex, 0]
-      if currentDepth >= interpolatorRange[0] and currentDepth <= interpolatorRange[1] and currentDepth >= pddRangeMin and currentDepth <= pddRangeMax:
-        self.opticalAttenuationVsDoseFunction[doseNumberOfRows-doseRowIndex-1, 0] = interpolator.GetValue(currentDepth)
-        self.opticalAttenuationVsDoseFunction[doseNumberOfRows-doseRowIndex-1, 1] = self.calculatedDose[doseRowIndex, 1]
-      else:
-        # If the depth value is out of range then delete the last row (it will never be set, but we need to remove the zeros from the end)
-        self.opticalAttenuationVsDoseFunction = numpy.delete(self.opticalAttenuationVsDoseFunction, doseNumberOfRows-doseRowIndex-1, 0)
+    # Get the optical attenuation values of the aligned calibration function at the depths of the calculated dose
+    # within the range of the aligned calibration function and the given PDD range
+    alignedDepths = self.calibrationDataAlignedArray[:,0]
+    doseDepths = self.calculatedDose[:,0]
+    inRange = (doseDepths >= pddRangeMin) & (doseDepths <= pddRangeMax)
+    if alignedDepths.shape[0] > 0:
+      inRange &= (doseDepths >= alignedDepths.min()) & (doseDepths <= alignedDepths.max())
+    else:
+      inRange[:] = False
+
+    # Reverse the function so that smallest dose comes first (which decreases with depth)
+    inRangeRowIndices = numpy.flatnonzero(inRange)[::-1]
+    self.opticalAttenuationVsDoseFunction = numpy.column_stack((
+      self.interpolateFunctionArray(self.calibrationDataAlignedArray, doseDepths[inRangeRowIndices]),
+      self.calculatedDose[inRangeRowIndices, 1] ))
 
   # ---------------------------------------------------------------------------
   def fitCurveToOpticalAttenuationVsDoseFunctionArray(self, orderOfFittedPolynomial):
     # Fit polynomial on the cleaned OA vs dose function array
-    oaVsDoseNumberOfRows = self.opticalAttenuationVsDoseFunction.shape[0]
-    opticalAttenuationData = numpy.zeros((oaVsDoseNumberOfRows))
-    doseData = numpy.zeros((oaVsDoseNumberOfRows))
-    for rowIndex in range(oaVsDoseNumberOfRows):
-      opticalAttenuationData[rowIndex] = self.opticalAttenuationVsDoseFunction[rowIndex, 0]
-      doseData[rowIndex] = self.opticalAttenuationVsDoseFunction[rowIndex, 1]
+    opticalAttenuationData = self.opticalAttenuationVsDoseFunction[:,0]
+    doseData = self.opticalAttenuationVsDoseFunction[:,1]
     fittingResult = numpy.polyfit(opticalAttenuationData, doseData, orderOfFittedPolynomial, None, True)
     self.calibrationPolynomialCoefficients = fittingResult[0]
     self.fittingResiduals = fittingResult[1]
@@ -477,13 +908,13 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
     return self.fittingResiduals
 
   # ---------------------------------------------------------------------------
-  def exportCalibrationToCSV(self):
+  def exportCalibrationToCSV(self, outputDir=None):
     import csv
     import os
 
-    self.outputDir = slicer.app.temporaryPath + '/GelDosimetry'
+    self.outputDir = outputDir if outputDir else slicer.app.temporaryPath + '/GelDosimetry'
     if not os.access(self.outputDir, os.F_OK):
-      os.mkdir(self.outputDir)
+      os.makedirs(self.outputDir)
 
     # Assemble file name for calibration curve points file
     from time import gmtime, strftime
@@ -491,7 +922,7 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
 
     # Write calibration curve points CSV file
     message = ''
-    if self.opticalAttenuationVsDoseFunction != None:
+    if self.opticalAttenuationVsDoseFunction is not None:
       message = 'Optical attenuation to dose values saved in file\n' + fileName + '\n\n'
       with open(fileName, 'w') as fp:
         csvWriter = csv.writer(fp, delimiter=',', lineterminator='\n')
@@ -501,7 +932,7 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
         csvWriter.writerows(data)
 
     # Assemble file name for polynomial coefficients
-    if not hasattr(self, 'calibrationPolynomialCoefficients'):
+    if self.calibrationPolynomialCoefficients is None:
       message += 'Calibration polynomial has not been fitted to the curve yet!\nClick Fit polynomial in step 4/B to do the fitting.\n'
       return message
     fileName = self.outputDir + '/' + strftime("%Y%m%d_%H%M%S_", gmtime()) + 'CalibrationPolynomialCoefficients.csv'
@@ -522,69 +953,1005 @@ class GelDosimetryAnalysisLogic(ScriptedLoadableModuleLogic):
     return message
 
   # ---------------------------------------------------------------------------
-  def calibrate(self, measuredVolumeID):
-    qt.QApplication.setOverrideCursor(qt.QCursor(qt.Qt.BusyCursor))
+  def calibrate(self, measuredVolumeID, inPlace=False, outputScalarType=-1):
+    # Apply the calibration polynomial on the MEASURED volume
+    # If inPlace is True, then the voxels of the MEASURED volume are overwritten with the calibrated values,
+    # otherwise the calibrated values are written into a newly allocated buffer of a new volume
+    # The scalar type of the calibrated volume is outputScalarType (e.g. vtk.VTK_FLOAT). If -1, then it is
+    # float for integer MEASURED volumes (avoiding truncated dose values) and the MEASURED type otherwise
+    self.setBusyCursor(True)
     import time
     start = time.time()
 
     measuredVolume = slicer.util.getNode(measuredVolumeID)
-    calibratedVolume = slicer.vtkMRMLScalarVolumeNode()
-    calibratedVolumeName = measuredVolume.GetName() + '_Calibrated'
-    calibratedVolumeName = slicer.mrmlScene.GenerateUniqueName(calibratedVolumeName)
-    calibratedVolume.SetName(calibratedVolumeName)
-    slicer.mrmlScene.AddNode(calibratedVolume)
-    measuredImageDataCopy = vtk.vtkImageData()
-    measuredImageDataCopy.DeepCopy(measuredVolume.GetImageData())
-    calibratedVolume.SetAndObserveImageData(measuredImageDataCopy)
-    calibratedVolume.CopyOrientation(measuredVolume)
-    if measuredVolume.GetParentTransformNode() != None:
-      calibratedVolume.SetAndObserveTransformNodeID(measuredVolume.GetParentTransformNode().GetID())
+    if inPlace:
+      calibratedVolume = measuredVolume
+    else:
+      calibratedVolume = slicer.vtkMRMLScalarVolumeNode()
+      calibratedVolumeName = measuredVolume.GetName() + '_Calibrated'
+      calibratedVolumeName = slicer.mrmlScene.GenerateUniqueName(calibratedVolumeName)
+      calibratedVolume.SetName(calibratedVolumeName)
+      slicer.mrmlScene.AddNode(calibratedVolume)
+      calibratedVolume.CopyOrientation(measuredVolume)
+      if measuredVolume.GetParentTransformNode() != None:
+        calibratedVolume.SetAndObserveTransformNodeID(measuredVolume.GetParentTransformNode().GetID())
 
     coefficients = numpy_support.numpy_to_vtk(self.calibrationPolynomialCoefficients)
 
-    if slicer.modules.geldosimetryanalysisalgo.logic().ApplyPolynomialFunctionOnVolume(calibratedVolume, coefficients) == False:
+    if slicer.modules.geldosimetryanalysisalgo.logic().ApplyPolynomialFunctionOnVolume(measuredVolume, coefficients, calibratedVolume, outputScalarType) == False:
       logging.error('Calibration failed')
-      slicer.mrmlScene.RemoveNode(calibratedVolume)
+      if not inPlace:
+        slicer.mrmlScene.RemoveNode(calibratedVolume)
+      self.setBusyCursor(False)
       return None
 
     end = time.time()
-    qt.QApplication.restoreOverrideCursor()
+    self.setBusyCursor(False)
     logging.info('Calibration of MEASURED volume is successful (time: {0})'.format(end - start))
     return calibratedVolume
 
+  # ---------------------------------------------------------------------------
+  def calibrateVolumeFile(self, measuredVolumeFilePath, calibratedVolumeFilePath, outputScalarType=-1, maximumSlabSizeMb=64):
+    # Apply the calibration polynomial on a MEASURED volume file without loading the whole volume into memory,
+    # for volumes that do not fit in the memory. The volume is processed in slabs of consecutive slices, so
+    # the peak memory usage is determined by maximumSlabSizeMb instead of the volume size.
+    # The MEASURED volume needs to be a raw or gzip encoded NRRD file (attached or detached header), and the calibrated
+    # volume is written to a raw encoded NRRD file with attached header and the same geometry. The calibrated volume
+    # is written to a temporary file that is renamed when complete, so no partial file is left if calibration fails.
+    # The scalar type of the calibrated volume is determined by outputScalarType the same way as in calibrate
+    if self.calibrationPolynomialCoefficients is None:
+      logging.error('Calibration polynomial has not been computed')
+      return False
+    self.setBusyCursor(True)
+    import time
+    import zlib
+    start = time.time()
+
+    temporaryFilePath = calibratedVolumeFilePath + '.{0}.tmp'.format(os.getpid())
+    try:
+      header = self.readNrrdHeader(measuredVolumeFilePath)
+      inputDtype = header['dtype']
+      if outputScalarType == -1:
+        outputDtype = numpy.dtype(numpy.float32) if inputDtype.kind in 'iu' else inputDtype.newbyteorder('=')
+      else:
+        outputDtype = numpy.dtype(numpy_support.get_numpy_array_type(outputScalarType))
+
+      # Slices are the slowest varying axis of the data
+      sliceSize = int(numpy.prod(header['sizes'][:-1]))
+      numberOfSlices = header['sizes'][-1]
+      bytesPerSlice = sliceSize * (inputDtype.itemsize + numpy.dtype(numpy.float64).itemsize + outputDtype.itemsize)
+      numberOfSlicesPerSlab = max(1, min(numberOfSlices, int(maximumSlabSizeMb * 1024 * 1024) // bytesPerSlice))
+
+      # The polynomial is evaluated in double precision (as in vtkApplyPolynomialFunctionOnVolume) in a buffer reused by all slabs
+      coefficients = numpy.asarray(self.calibrationPolynomialCoefficients, dtype=numpy.float64)
+      valueBuffer = numpy.empty(numberOfSlicesPerSlab * sliceSize, dtype=numpy.float64)
+
+      with open(header['dataFilePath'], 'rb') as inputFile, open(temporaryFilePath, 'wb') as outputFile:
+        outputFile.write(self.createNrrdHeader(header['fields'], outputDtype).encode('latin-1'))
+        readVoxels = self.createNrrdDataReader(header, inputFile)
+        for firstSliceIndex in range(0, numberOfSlices, numberOfSlicesPerSlab):
+          slabNumberOfVoxels = min(numberOfSlicesPerSlab, numberOfSlices - firstSliceIndex) * sliceSize
+          measuredSlab = readVoxels(slabNumberOfVoxels)
+          if measuredSlab.size != slabNumberOfVoxels:
+            raise ValueError('Unexpected end of data in ' + repr(header['dataFilePath']))
+
+          # Horner's scheme in place
+          value = valueBuffer[:slabNumberOfVoxels]
+          value.fill(coefficients[0])
+          for coefficient in coefficients[1:]:
+            value *= measuredSlab
+            value += coefficient
+          value.astype(outputDtype, copy=False).tofile(outputFile)
+      os.replace(temporaryFilePath, calibratedVolumeFilePath)
+
+    except (IOError, OSError, ValueError, KeyError, zlib.error) as e:
+      logging.error('Failed to calibrate volume file ' + repr(measuredVolumeFilePath) + ': ' + str(e))
+      if os.path.exists(temporaryFilePath):
+        os.remove(temporaryFilePath)
+      return False
+    finally:
+      self.setBusyCursor(False)
+
+    end = time.time()
+    logging.info('Calibration of MEASURED volume file is successful in slabs of {0} slices (time: {1})'.format(numberOfSlicesPerSlab, end - start))
+    return True
+
+  # ---------------------------------------------------------------------------
+  def readNrrdHeader(self, filePath):
+    # Parse header of raw or gzip encoded 3D scalar NRRD file
+    # Returns dictionary with the header fields (list of [key, separator, value] for each line), the numpy data type,
+    # the sizes (fastest varying axis first), the encoding, the data file path, the offset of the (compressed) data in
+    # the data file, and the number of bytes to skip at the beginning of the decompressed data
+    nrrdTypes = { 'signed char': 'i1', 'int8': 'i1', 'int8_t': 'i1',
+                  'uchar': 'u1', 'unsigned char': 'u1', 'uint8': 'u1', 'uint8_t': 'u1',
+                  'short': 'i2', 'short int': 'i2', 'signed short': 'i2', 'signed short int': 'i2', 'int16': 'i2', 'int16_t': 'i2',
+                  'ushort': 'u2', 'unsigned short': 'u2', 'unsigned short int': 'u2', 'uint16': 'u2', 'uint16_t': 'u2',
+                  'int': 'i4', 'signed int': 'i4', 'int32': 'i4', 'int32_t': 'i4',
+                  'uint': 'u4', 'unsigned int': 'u4', 'uint32': 'u4', 'uint32_t': 'u4',
+                  'longlong': 'i8', 'long long': 'i8', 'long long int': 'i8', 'signed long long': 'i8', 'signed long long int': 'i8', 'int64': 'i8', 'int64_t': 'i8',
+                  'ulonglong': 'u8', 'unsigned long long': 'u8', 'unsigned long long int': 'u8', 'uint64': 'u8', 'uint64_t': 'u8',
+                  'float': 'f4', 'double': 'f8' }
+
+    fields = []
+    with open(filePath, 'rb') as headerFile:
+      if not headerFile.readline().startswith(b'NRRD'):
+        raise ValueError('Not an NRRD file')
+      while True:
+        line = headerFile.readline()
+        if line.strip() == b'':
+          break # Empty line (or end of file in case of detached header) ends the header
+        line = line.decode('latin-1').rstrip('\r\n')
+        if line.startswith('#'):
+          continue
+        separator = ':=' if ':=' in line.split(': ')[0] else ': '
+        key, value = line.split(separator, 1)
+        fields.append([key, separator, value])
+      headerLength = headerFile.tell()
+
+    values = dict([(key.lower(), value.strip()) for (key, separator, value) in fields if separator == ': '])
+    encoding = values.get('encoding', 'raw').lower()
+    if encoding not in ['raw', 'gzip', 'gz']:
+      raise ValueError('Only raw and gzip encodings are supported, the encoding is ' + values['encoding'])
+    if values.get('type') not in nrrdTypes:
+      raise ValueError('Unsupported type ' + repr(values.get('type')))
+    if int(values.get('line skip', values.get('lineskip', 0))) != 0:
+      raise ValueError('Line skip is not supported')
+    if int(values.get('dimension', 0)) != 3:
+      raise ValueError('Only 3D scalar volumes are supported')
+
+    if 'sizes' not in values:
+      raise ValueError('Sizes field is missing')
+
+    header = { 'fields': fields }
+    header['encoding'] = ('raw' if encoding == 'raw' else 'gzip')
+    header['sizes'] = [int(size) for size in values['sizes'].split()]
+    header['dtype'] = numpy.dtype(('>' if values.get('endian') == 'big' else '<') + nrrdTypes[values['type']])
+
+    dataFileName = values.get('data file', values.get('datafile'))
+    if dataFileName is None:
+      header['dataFilePath'] = filePath
+      header['dataOffset'] = headerLength
+    else:
+      header['dataFilePath'] = os.path.join(os.path.dirname(filePath), dataFileName)
+      header['dataOffset'] = 0
+    byteSkip = int(values.get('byte skip', values.get('byteskip', 0)))
+    header['decompressedByteSkip'] = 0
+    if header['encoding'] != 'raw':
+      # Byte skip is applied on the decompressed data
+      if byteSkip < 0:
+        raise ValueError('Byte skip -1 is only supported with raw encoding')
+      header['decompressedByteSkip'] = byteSkip
+    elif byteSkip == -1:
+      # Data is at the end of the file
+      header['dataOffset'] = os.path.getsize(header['dataFilePath']) - int(numpy.prod(header['sizes'])) * header['dtype'].itemsize
+    else:
+      header['dataOffset'] += byteSkip
+    return header
+
+  # ---------------------------------------------------------------------------
+  def createNrrdDataReader(self, header, dataFile):
+    # Returns function reading the given number of voxels from the data file of the NRRD header (see readNrrdHeader)
+    # The returned array is shorter than requested at the end of the data.
+    # Gzip encoded data is decompressed incrementally, so only the requested voxels are kept in memory
+    import zlib
+    dataFile.seek(header['dataOffset'])
+    dtype = header['dtype']
+    if header['encoding'] == 'raw':
+      return lambda numberOfVoxels: numpy.fromfile(dataFile, dtype=dtype, count=numberOfVoxels)
+
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 32) # Accepts gzip and zlib streams
+    decompressedData = bytearray()
+    def readDecompressed(numberOfBytes):
+      # The output of each decompression step is limited, so that highly compressed data does not fill the memory
+      while len(decompressedData) < numberOfBytes and not decompressor.eof:
+        compressedData = decompressor.unconsumed_tail or dataFile.read(1024 * 1024)
+        decompressedChunk = decompressor.decompress(compressedData, numberOfBytes - len(decompressedData))
+        if not compressedData and not decompressedChunk:
+          break # End of file
+        decompressedData.extend(decompressedChunk)
+      data = decompressedData[:numberOfBytes]
+      del decompressedData[:numberOfBytes]
+      return data
+    readDecompressed(header['decompressedByteSkip'])
+    def readVoxels(numberOfVoxels):
+      data = readDecompressed(numberOfVoxels * dtype.itemsize)
+      return numpy.frombuffer(data, dtype=dtype, count=len(data) // dtype.itemsize)
+    return readVoxels
+
+  # ---------------------------------------------------------------------------
+  def createNrrdHeader(self, fields, dtype):
+    # Create attached NRRD header with the geometry and metadata of the given header fields and the given data type
+    import sys
+    nrrdTypes = { 'i1': 'int8', 'u1': 'uint8', 'i2': 'int16', 'u2': 'uint16', 'i4': 'int32', 'u4': 'uint32',
+                  'i8': 'int64', 'u8': 'uint64', 'f4': 'float', 'f8': 'double' }
+    replacedKeys = ['type', 'encoding', 'endian', 'data file', 'datafile', 'byte skip', 'byteskip', 'line skip', 'lineskip']
+    headerText = 'NRRD0004\n'
+    headerText += '# Complete NRRD file format specification at:\n'
+    headerText += '# http://teem.sourceforge.net/nrrd/format.html\n'
+    headerText += 'type: ' + nrrdTypes[dtype.kind + str(dtype.itemsize)] + '\n'
+    for (key, separator, value) in fields:
+      if separator == ': ' and key.lower() in replacedKeys:
+        continue
+      headerText += key + separator + value + '\n'
+    headerText += 'encoding: raw\n'
+    headerText += 'endian: ' + ('big' if dtype.byteorder == '>' or (dtype.byteorder == '=' and sys.byteorder == 'big') else 'little') + '\n'
+    headerText += '\n'
+    return headerText
+
+  # ---------------------------------------------------------------------------
+  def runCalibrationPipeline(self, config):
+    # Perform the whole calibration workflow without user interaction or GUI calls, so that it can be run
+    # in batch mode (e.g. in Slicer started with --no-main-window in parallel worker processes)
+    # Parameters:
+    #   config: Dictionary (or path of a JSON file containing a dictionary) with the following keys
+    #     pddFilePath: PDD CSV file
+    #     calibrationVolumeFilePath or calibrationVolumeNodeID: CALIBRATION volume
+    #     measuredVolumeFilePath or measuredVolumeNodeID: MEASURED volume
+    #     centralRadiusMm: Averaging radius used when parsing the CALIBRATION volume
+    #     rdf, monitorUnits: Relative dose factor and electron monitor units for computing dose from the PDD
+    #     polynomialOrder: Order of the polynomial fitted to the optical attenuation vs dose curve
+    #   Optional keys:
+    #     trackCentralCylinderAxis, centralCylinderAxisThreshold: Parse the CALIBRATION volume around the vial axis,
+    #       see the member variables of the same name
+    #     calibrationVolumeParsingRoiNodeID, calibrationVolumeParsingDepthRangeCm: Region of the CALIBRATION volume
+    #       to parse, see the member variables of the same name
+    #     pddRangeMin, pddRangeMax: PDD depth range (cm) considered for calibration (default: whole range)
+    #     alignment: [xTrans, yScale, yTrans] to use instead of the automatic alignment
+    #     calibrateInPlace, outputScalarType: See calibrate
+    #     calibrationMaximumSlabSizeMb: If specified, then measuredVolumeFilePath is calibrated in slabs directly into
+    #       outputCalibratedVolumeFilePath without loading the whole volume, see calibrateVolumeFile. The MEASURED volume
+    #       needs to be a raw or gzip encoded NRRD file (e.g. saved by Slicer with or without compression)
+    #     outputCalibratedVolumeFilePath: File to save the calibrated volume to
+    #     outputCalibrationDirectory: Directory to save the OA vs dose points and polynomial coefficients to
+    #     planDoseVolumeFilePath or planDoseVolumeNodeID: PLANDOSE volume (already registered to the MEASURED volume)
+    #       to compare the calibrated volume against using gamma dose comparison
+    #     gammaParameters: Gamma parameters dictionary, see computeGammaDoseComparison
+    #     outputGammaVolumeFilePath: File to save the gamma volume to
+    #     gammaSweepCriteria: List of [DTA mm, dose difference %] criteria to compute the pass fractions for in one pass,
+    #       see computeGammaDoseComparisonSweep. The reference dose, threshold and maximum gamma come from gammaParameters
+    # Returns dictionary with the results, or None on failure
+    if isinstance(config, str):
+      import json
+      with open(config, 'r') as configFile:
+        config = json.load(configFile)
+
+    showBusyCursor = self.showBusyCursor
+    self.showBusyCursor = False
+    try:
+      results = {}
+
+      # Load PDD
+      if not self.loadPdd(config['pddFilePath']):
+        logging.error('Failed to load PDD from ' + repr(config['pddFilePath']))
+        return None
+
+      # Parse CALIBRATION volume
+      calibrationVolumeNode = self.getVolumeNodeForPipeline(config, 'calibrationVolume')
+      if calibrationVolumeNode is None:
+        return None
+      self.trackCentralCylinderAxis = bool(config.get('trackCentralCylinderAxis', False))
+      self.centralCylinderAxisThreshold = config.get('centralCylinderAxisThreshold')
+      self.calibrationVolumeParsingRoiNodeID = config.get('calibrationVolumeParsingRoiNodeID')
+      self.calibrationVolumeParsingDepthRangeCm = config.get('calibrationVolumeParsingDepthRangeCm')
+      if not self.getMeanOpticalAttenuationOfCentralCylinder(calibrationVolumeNode.GetID(), float(config['centralRadiusMm'])):
+        logging.error('Failed to parse CALIBRATION volume')
+        return None
+
+      # Align CALIBRATION data to PDD (automatic alignment also cleans the CALIBRATION data, which is needed for manual alignment too)
+      alignmentResult = self.alignPddToCalibration()
+      if not isinstance(alignmentResult, list):
+        logging.error('Failed to align CALIBRATION data to PDD')
+        return None
+      if 'alignment' in config:
+        [xTrans, yScale, yTrans] = [float(value) for value in config['alignment']]
+        self.createAlignedCalibrationArray(xTrans, yScale, yTrans)
+        results['alignment'] = [xTrans, yScale, yTrans]
+      else:
+        results['alignmentError'] = alignmentResult[0]
+        results['alignment'] = alignmentResult[1:]
+
+      # Compute dose from PDD and create optical attenuation vs dose function
+      if not self.computeDoseForMeasuredData(float(config['rdf']), float(config['monitorUnits'])):
+        logging.error('Failed to compute dose from PDD')
+        return None
+      self.createOpticalAttenuationVsDoseFunction(config.get('pddRangeMin', -1000), config.get('pddRangeMax', 1000))
+
+      # Fit polynomial
+      results['fittingResiduals'] = self.fitCurveToOpticalAttenuationVsDoseFunctionArray(int(config['polynomialOrder'])).tolist()
+      results['calibrationPolynomialCoefficients'] = self.calibrationPolynomialCoefficients.tolist()
+
+      # Calibrate MEASURED volume
+      calibratedVolumeNode = None
+      if config.get('calibrationMaximumSlabSizeMb'):
+        # Streaming calibration from file to file, without loading the MEASURED volume
+        if not self.calibrateVolumeFile(config['measuredVolumeFilePath'], config['outputCalibratedVolumeFilePath'],
+            config.get('outputScalarType', -1), float(config['calibrationMaximumSlabSizeMb'])):
+          return None
+        results['calibratedVolumeFilePath'] = config['outputCalibratedVolumeFilePath']
+      else:
+        measuredVolumeNode = self.getVolumeNodeForPipeline(config, 'measuredVolume')
+        if measuredVolumeNode is None:
+          return None
+        calibratedVolumeNode = self.calibrate(measuredVolumeNode.GetID(), config.get('calibrateInPlace', False), config.get('outputScalarType', -1))
+        if calibratedVolumeNode is None:
+          return None
+        results['calibratedVolumeNode'] = calibratedVolumeNode
+
+      # Save outputs
+      if calibratedVolumeNode is not None and config.get('outputCalibratedVolumeFilePath'):
+        if not slicer.util.saveNode(calibratedVolumeNode, config['outputCalibratedVolumeFilePath']):
+          logging.error('Failed to save calibrated volume to ' + repr(config['outputCalibratedVolumeFilePath']))
+          return None
+        results['calibratedVolumeFilePath'] = config['outputCalibratedVolumeFilePath']
+      if config.get('outputCalibrationDirectory'):
+        results['calibrationFilesMessage'] = self.exportCalibrationToCSV(config['outputCalibrationDirectory'])
+
+      # Compare calibrated volume to PLANDOSE
+      if config.get('planDoseVolumeNodeID') or config.get('planDoseVolumeFilePath'):
+        planDoseVolumeNode = self.getVolumeNodeForPipeline(config, 'planDoseVolume')
+        if planDoseVolumeNode is None:
+          return None
+        if calibratedVolumeNode is None:
+          calibratedVolumeNode = self.getVolumeNodeForPipeline(config, 'outputCalibratedVolume')
+          if calibratedVolumeNode is None:
+            return None
+          results['calibratedVolumeNode'] = calibratedVolumeNode
+        gammaParameterSetNode = self.computeGammaDoseComparison(planDoseVolumeNode, calibratedVolumeNode, parameters=config.get('gammaParameters', {}))
+        if not gammaParameterSetNode.GetResultsValid():
+          return None
+        results['gammaPassFractionPercent'] = gammaParameterSetNode.GetPassFractionPercent()
+        results['gammaVolumeNode'] = gammaParameterSetNode.GetGammaVolumeNode()
+        if config.get('outputGammaVolumeFilePath'):
+          if not slicer.util.saveNode(results['gammaVolumeNode'], config['outputGammaVolumeFilePath']):
+            logging.error('Failed to save gamma volume to ' + repr(config['outputGammaVolumeFilePath']))
+            return None
+          results['gammaVolumeFilePath'] = config['outputGammaVolumeFilePath']
+        if config.get('gammaSweepCriteria'):
+          sweepResults = self.computeGammaDoseComparisonSweep(planDoseVolumeNode, calibratedVolumeNode, config['gammaSweepCriteria'],
+            parameters=config.get('gammaParameters', {}))
+          if sweepResults is None:
+            return None
+          results['gammaSweepPassFractionsPercent'] = [[result['dtaDistanceToleranceMm'], result['doseDifferenceTolerancePercent'],
+            result['passFractionPercent']] for result in sweepResults]
+
+      logging.info('Calibration pipeline finished with polynomial coefficients ' + repr(results['calibrationPolynomialCoefficients']))
+      return results
+
+    except KeyError as e:
+      logging.error('Missing calibration pipeline configuration key: ' + str(e))
+      return None
+    finally:
+      self.showBusyCursor = showBusyCursor
+
+  # ---------------------------------------------------------------------------
+  def computeGammaDoseComparison(self, referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode=None, maskSegmentationNode=None, maskSegmentID=None, parameters={}):
+    # Compute gamma dose comparison using the SlicerRT Dose comparison module or the native gamma engine
+    # Parameters:
+    #   gammaVolumeNode: Output gamma volume. Created if None
+    #   parameters: Dictionary of gamma parameters (all optional)
+    #     dtaDistanceToleranceMm (default 3), doseDifferenceTolerancePercent (default 3),
+    #     referenceDoseGy (if not given then the maximum dose is used), analysisThresholdPercent (default 0),
+    #     useGeometricGammaCalculation (default True), maximumGamma (default 2),
+    #     engine ('slicerrt' or 'native', default is 'slicerrt' if the Dose comparison module is available),
+    #     cropToMask (default True): compute only in the bounding box of the mask segment extended by DTA * maximum gamma
+    # Returns the dose comparison parameter node (or GammaDoseComparisonResults for the native engine)
+    # containing the results. The error message of a failed comparison is stored in gammaErrorMessage
+    if gammaVolumeNode is None:
+      gammaVolumeNode = slicer.vtkMRMLScalarVolumeNode()
+      gammaVolumeNode.SetName(slicer.mrmlScene.GenerateUniqueName('GammaVolume'))
+      slicer.mrmlScene.AddNode(gammaVolumeNode)
+
+    self.gammaErrorMessage = None
+    engine = parameters.get('engine', self.getDefaultGammaEngine())
+    if engine == 'native':
+      return self.computeGammaDoseComparisonNative(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskSegmentationNode, maskSegmentID, parameters)
+    elif engine != 'slicerrt':
+      raise ValueError('Unknown gamma engine ' + repr(engine))
+
+    # The gel usually fills a small part of the plan dose grid, so the reference dose is cropped to the mask
+    # (the evaluated dose is resampled on the reference dose grid by the Dose comparison module)
+    cropSlices = None
+    computedReferenceDoseVolumeNode = referenceDoseVolumeNode
+    if maskSegmentationNode is not None and parameters.get('cropToMask', True):
+      marginMm = float(parameters.get('dtaDistanceToleranceMm', 3.0)) * float(parameters.get('maximumGamma', 2.0))
+      cropSlices = self.getMaskCropSlices(referenceDoseVolumeNode, maskSegmentationNode, maskSegmentID, marginMm)
+      if cropSlices is not None:
+        computedReferenceDoseVolumeNode = self.createCroppedVolume(referenceDoseVolumeNode, cropSlices)
+        if 'referenceDoseGy' not in parameters:
+          # The reference dose is the maximum of the whole reference dose volume, not only of the cropped region
+          parameters = dict(parameters)
+          parameters['referenceDoseGy'] = float(slicer.util.arrayFromVolume(referenceDoseVolumeNode).max())
+
+    gammaParameterSetNode = slicer.vtkMRMLDoseComparisonNode()
+    slicer.mrmlScene.AddNode(gammaParameterSetNode)
+    gammaParameterSetNode.SetAndObserveReferenceDoseVolumeNode(computedReferenceDoseVolumeNode)
+    gammaParameterSetNode.SetAndObserveCompareDoseVolumeNode(evaluatedDoseVolumeNode)
+    gammaParameterSetNode.SetAndObserveMaskSegmentationNode(maskSegmentationNode)
+    gammaParameterSetNode.SetMaskSegmentID(maskSegmentID if maskSegmentID else None)
+    gammaParameterSetNode.SetAndObserveGammaVolumeNode(gammaVolumeNode)
+    gammaParameterSetNode.SetDtaDistanceToleranceMm(float(parameters.get('dtaDistanceToleranceMm', 3.0)))
+    gammaParameterSetNode.SetDoseDifferenceTolerancePercent(float(parameters.get('doseDifferenceTolerancePercent', 3.0)))
+    gammaParameterSetNode.SetUseMaximumDose('referenceDoseGy' not in parameters)
+    if 'referenceDoseGy' in parameters:
+      gammaParameterSetNode.SetReferenceDoseGy(float(parameters['referenceDoseGy']))
+    gammaParameterSetNode.SetAnalysisThresholdPercent(float(parameters.get('analysisThresholdPercent', 0.0)))
+    gammaParameterSetNode.SetUseGeometricGammaCalculation(bool(parameters.get('useGeometricGammaCalculation', True)))
+    gammaParameterSetNode.SetDoseThresholdOnReferenceOnly(True)
+    gammaParameterSetNode.SetMaximumGamma(float(parameters.get('maximumGamma', 2.0)))
+
+    self.setBusyCursor(True)
+    try:
+      errorMessage = slicer.modules.dosecomparison.logic().ComputeGammaDoseDifference(gammaParameterSetNode)
+      if cropSlices is not None:
+        gammaParameterSetNode.SetAndObserveReferenceDoseVolumeNode(referenceDoseVolumeNode)
+        if gammaParameterSetNode.GetResultsValid():
+          self.pasteCroppedVolume(gammaVolumeNode, referenceDoseVolumeNode, cropSlices)
+    finally:
+      self.setBusyCursor(False)
+      if cropSlices is not None:
+        slicer.mrmlScene.RemoveNode(computedReferenceDoseVolumeNode)
+    if not gammaParameterSetNode.GetResultsValid():
+      self.gammaErrorMessage = str(errorMessage)
+      logging.error('Gamma dose comparison failed: ' + self.gammaErrorMessage)
+    else:
+      logging.info('Gamma dose comparison succeeded with pass fraction {0:.2f}%'.format(gammaParameterSetNode.GetPassFractionPercent()))
+    return gammaParameterSetNode
+
+  # ---------------------------------------------------------------------------
+  def getDefaultGammaEngine(self):
+    # The SlicerRT Dose comparison module is used if available, otherwise the native gamma engine
+    return 'slicerrt' if hasattr(slicer.modules, 'dosecomparison') else 'native'
+
+  # ---------------------------------------------------------------------------
+  def computeGammaDoseComparisonNative(self, referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskSegmentationNode=None, maskSegmentID=None, parameters={}):
+    # Compute gamma dose comparison using the multithreaded gamma filter of GelDosimetryAnalysisAlgo, which does
+    # not depend on SlicerRT. See computeGammaDoseComparison for the parameters.
+    # Returns GammaDoseComparisonResults
+    if parameters.get('useGeometricGammaCalculation', False):
+      logging.warning('Geometric gamma calculation is not supported by the native gamma engine, the voxel based gamma is computed')
+
+    # The mask segment is exported to a temporary labelmap, which is resampled on the reference dose grid by the logic
+    maskLabelmapNode = None
+    if maskSegmentationNode is not None:
+      maskLabelmapNode = self.exportSegmentToLabelmap(maskSegmentationNode, maskSegmentID, referenceDoseVolumeNode)
+      if maskLabelmapNode is None:
+        self.gammaErrorMessage = 'Failed to export mask segment ' + repr(maskSegmentID)
+        logging.error('Gamma dose comparison failed: ' + self.gammaErrorMessage)
+        return GammaDoseComparisonResults(False, gammaVolumeNode, parameters, self.gammaErrorMessage)
+
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    algoLogic.SetCropGammaToMask(bool(parameters.get('cropToMask', True)))
+    self.setBusyCursor(True)
+    try:
+      success = algoLogic.ComputeGammaDoseDifference(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskLabelmapNode,
+        float(parameters.get('dtaDistanceToleranceMm', 3.0)), float(parameters.get('doseDifferenceTolerancePercent', 3.0)),
+        float(parameters.get('referenceDoseGy', 0.0)), float(parameters.get('analysisThresholdPercent', 0.0)),
+        float(parameters.get('maximumGamma', 2.0)))
+    finally:
+      self.setBusyCursor(False)
+      if maskLabelmapNode is not None:
+        slicer.mrmlScene.RemoveNode(maskLabelmapNode)
+
+    if not success:
+      self.gammaErrorMessage = 'Native gamma computation failed, see the application log for details'
+      logging.error('Gamma dose comparison failed: ' + self.gammaErrorMessage)
+      return GammaDoseComparisonResults(False, gammaVolumeNode, parameters, self.gammaErrorMessage)
+    return self.getNativeGammaResults(gammaVolumeNode, parameters)
+
+  # ---------------------------------------------------------------------------
+  def computeGammaDoseComparisonNativeAsync(self, referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskSegmentationNode=None, maskSegmentID=None,
+      parameters={}, completedCallback=None, progressCallback=None):
+    # Start the native gamma dose comparison in a background thread and return immediately, so that the application stays
+    # responsive and the computation can be canceled. See computeGammaDoseComparison for the parameters.
+    #   completedCallback: Called with the future when the computation finishes (successfully, canceled, or failed)
+    #   progressCallback: Called with the fraction of the computation done (between 0 and 1) while it is running
+    # Returns GammaComputationFuture, whose result is the GammaDoseComparisonResults. The gamma volume is only modified
+    # if the computation completes, the partial results of a canceled computation are discarded
+    if parameters.get('useGeometricGammaCalculation', False):
+      logging.warning('Geometric gamma calculation is not supported by the native gamma engine, the voxel based gamma is computed')
+    self.gammaErrorMessage = None
+
+    maskLabelmapNode = None
+    if maskSegmentationNode is not None:
+      maskLabelmapNode = self.exportSegmentToLabelmap(maskSegmentationNode, maskSegmentID, referenceDoseVolumeNode)
+
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    algoLogic.SetCropGammaToMask(bool(parameters.get('cropToMask', True)))
+    future = GammaComputationFuture(algoLogic, lambda: self.getNativeGammaResults(gammaVolumeNode, parameters))
+    if progressCallback is not None:
+      future.addProgressCallback(progressCallback)
+    if completedCallback is not None:
+      future.addCompletedCallback(completedCallback)
+
+    if maskSegmentationNode is not None and maskLabelmapNode is None:
+      future.fail('Failed to export mask segment ' + repr(maskSegmentID))
+      return future
+    # The mask is resampled when the computation starts, so the temporary labelmap is not needed in the background
+    try:
+      started = algoLogic.StartGammaDoseDifference(referenceDoseVolumeNode, evaluatedDoseVolumeNode, gammaVolumeNode, maskLabelmapNode,
+        float(parameters.get('dtaDistanceToleranceMm', 3.0)), float(parameters.get('doseDifferenceTolerancePercent', 3.0)),
+        float(parameters.get('referenceDoseGy', 0.0)), float(parameters.get('analysisThresholdPercent', 0.0)),
+        float(parameters.get('maximumGamma', 2.0)))
+    finally:
+      if maskLabelmapNode is not None:
+        slicer.mrmlScene.RemoveNode(maskLabelmapNode)
+    if not started:
+      future.fail('Failed to start native gamma computation, see the application log for details')
+    else:
+      future.start()
+    return future
+
+  # ---------------------------------------------------------------------------
+  def getNativeGammaResults(self, gammaVolumeNode, parameters):
+    # Get the results of the last successful native gamma computation
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    if gammaVolumeNode.GetDisplayNode() is None:
+      gammaVolumeNode.CreateDefaultDisplayNodes()
+    results = GammaDoseComparisonResults(True, gammaVolumeNode, parameters, passFractionPercent=algoLogic.GetGammaPassFractionPercent(),
+      numberOfAnalyzedVoxels=algoLogic.GetNumberOfGammaVoxelsAnalyzed(), referenceDoseGy=algoLogic.GetGammaReferenceDoseGy())
+    logging.info('Gamma dose comparison succeeded with pass fraction {0:.2f}%'.format(results.GetPassFractionPercent()))
+    return results
+
+  # ---------------------------------------------------------------------------
+  def computeGammaDoseComparisonSweep(self, referenceDoseVolumeNode, evaluatedDoseVolumeNode, criteria=None, maskSegmentationNode=None, maskSegmentID=None, parameters={}, createGammaVolumes=False):
+    # Compute gamma pass fractions for multiple criteria using the native gamma engine. The neighborhood of each voxel
+    # is visited once up to the largest DTA, so the criteria cost much less than separate gamma computations.
+    # Parameters:
+    #   criteria: List of (dtaDistanceToleranceMm, doseDifferenceTolerancePercent) pairs. If None, then gammaSweepDefaultCriteria
+    #   parameters: referenceDoseGy, analysisThresholdPercent, maximumGamma and cropToMask as in computeGammaDoseComparison
+    #   createGammaVolumes: Create a gamma volume for each criterion
+    # Returns list of dictionaries (one per criterion) with the keys dtaDistanceToleranceMm, doseDifferenceTolerancePercent,
+    # passFractionPercent and gammaVolumeNode (None if not created), or None on failure
+    if criteria is None:
+      criteria = self.gammaSweepDefaultCriteria
+    self.gammaErrorMessage = None
+
+    criteriaArray = vtk.vtkDoubleArray()
+    criteriaArray.SetNumberOfComponents(2)
+    for dtaDistanceToleranceMm, doseDifferenceTolerancePercent in criteria:
+      criteriaArray.InsertNextTuple2(float(dtaDistanceToleranceMm), float(doseDifferenceTolerancePercent))
+
+    gammaVolumeNodes = None
+    if createGammaVolumes:
+      gammaVolumeNodes = vtk.vtkCollection()
+      for dtaDistanceToleranceMm, doseDifferenceTolerancePercent in criteria:
+        gammaVolumeNode = slicer.vtkMRMLScalarVolumeNode()
+        gammaVolumeNode.SetName(slicer.mrmlScene.GenerateUniqueName('GammaVolume_{0:g}pc_{1:g}mm'.format(doseDifferenceTolerancePercent, dtaDistanceToleranceMm)))
+        slicer.mrmlScene.AddNode(gammaVolumeNode)
+        gammaVolumeNodes.AddItem(gammaVolumeNode)
+
+    maskLabelmapNode = None
+    if maskSegmentationNode is not None:
+      maskLabelmapNode = self.exportSegmentToLabelmap(maskSegmentationNode, maskSegmentID, referenceDoseVolumeNode)
+      if maskLabelmapNode is None:
+        self.gammaErrorMessage = 'Failed to export mask segment ' + repr(maskSegmentID)
+        logging.error('Gamma criteria sweep failed: ' + self.gammaErrorMessage)
+        return None
+
+    passFractionsPercent = vtk.vtkDoubleArray()
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    algoLogic.SetCropGammaToMask(bool(parameters.get('cropToMask', True)))
+    self.setBusyCursor(True)
+    try:
+      success = algoLogic.ComputeGammaDoseDifferenceSweep(referenceDoseVolumeNode, evaluatedDoseVolumeNode, criteriaArray, passFractionsPercent,
+        gammaVolumeNodes, maskLabelmapNode, float(parameters.get('referenceDoseGy', 0.0)),
+        float(parameters.get('analysisThresholdPercent', 0.0)), float(parameters.get('maximumGamma', 2.0)))
+    finally:
+      self.setBusyCursor(False)
+      if maskLabelmapNode is not None:
+        slicer.mrmlScene.RemoveNode(maskLabelmapNode)
+
+    if not success:
+      self.gammaErrorMessage = 'Native gamma criteria sweep failed, see the application log for details'
+      logging.error('Gamma criteria sweep failed: ' + self.gammaErrorMessage)
+      if gammaVolumeNodes is not None:
+        for index in range(gammaVolumeNodes.GetNumberOfItems()):
+          slicer.mrmlScene.RemoveNode(gammaVolumeNodes.GetItemAsObject(index))
+      return None
+
+    sweepResults = []
+    for index, (dtaDistanceToleranceMm, doseDifferenceTolerancePercent) in enumerate(criteria):
+      gammaVolumeNode = gammaVolumeNodes.GetItemAsObject(index) if gammaVolumeNodes is not None else None
+      if gammaVolumeNode is not None:
+        gammaVolumeNode.CreateDefaultDisplayNodes()
+      sweepResults.append({ 'dtaDistanceToleranceMm': float(dtaDistanceToleranceMm), 'doseDifferenceTolerancePercent': float(doseDifferenceTolerancePercent),
+        'passFractionPercent': passFractionsPercent.GetValue(index), 'gammaVolumeNode': gammaVolumeNode })
+      logging.info('Gamma pass fraction at {0:g}%/{1:g}mm: {2:.2f}%'.format(doseDifferenceTolerancePercent, dtaDistanceToleranceMm, passFractionsPercent.GetValue(index)))
+    return sweepResults
+
+  # ---------------------------------------------------------------------------
+  def computeGammaPassFraction(self, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskSegmentationNode=None, maskSegmentID=None, parameters={}, histogramBinWidth=0.1):
+    # Compute only the gamma pass fraction and histogram using the native gamma engine, without creating a gamma volume.
+    # The search stops at the first gamma value of at most 1, so it is fast enough to run after each registration change.
+    # See computeGammaDoseComparison for the parameters (engine and useGeometricGammaCalculation are ignored)
+    # Returns dictionary with the keys passFractionPercent, numberOfAnalyzedVoxels, histogramBinEdges and histogramCounts,
+    # or None on failure. The first histogram bin contains the passed voxels (gamma in [0, 1]).
+    self.gammaErrorMessage = None
+    maskLabelmapNode = None
+    if maskSegmentationNode is not None:
+      maskLabelmapNode = self.exportSegmentToLabelmap(maskSegmentationNode, maskSegmentID, referenceDoseVolumeNode)
+      if maskLabelmapNode is None:
+        self.gammaErrorMessage = 'Failed to export mask segment ' + repr(maskSegmentID)
+        logging.error('Gamma pass fraction computation failed: ' + self.gammaErrorMessage)
+        return None
+
+    maximumGamma = float(parameters.get('maximumGamma', 2.0))
+    gammaHistogram = vtk.vtkDoubleArray()
+    algoLogic = slicer.modules.geldosimetryanalysisalgo.logic()
+    algoLogic.SetCropGammaToMask(bool(parameters.get('cropToMask', True)))
+    try:
+      success = algoLogic.ComputeGammaPassFraction(referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskLabelmapNode,
+        float(parameters.get('dtaDistanceToleranceMm', 3.0)), float(parameters.get('doseDifferenceTolerancePercent', 3.0)),
+        float(parameters.get('referenceDoseGy', 0.0)), float(parameters.get('analysisThresholdPercent', 0.0)),
+        maximumGamma, gammaHistogram, histogramBinWidth)
+    finally:
+      if maskLabelmapNode is not None:
+        slicer.mrmlScene.RemoveNode(maskLabelmapNode)
+
+    if not success:
+      self.gammaErrorMessage = 'Native gamma pass fraction computation failed, see the application log for details'
+      logging.error('Gamma pass fraction computation failed: ' + self.gammaErrorMessage)
+      return None
+
+    histogramCounts = [int(gammaHistogram.GetValue(index)) for index in range(gammaHistogram.GetNumberOfTuples())]
+    histogramBinEdges = [0.0] + [min(1.0 + index * histogramBinWidth, maximumGamma) for index in range(len(histogramCounts))]
+    return { 'passFractionPercent': algoLogic.GetGammaPassFractionPercent(), 'numberOfAnalyzedVoxels': algoLogic.GetNumberOfGammaVoxelsAnalyzed(),
+      'histogramBinEdges': histogramBinEdges, 'histogramCounts': histogramCounts }
+
+  # ---------------------------------------------------------------------------
+  def getMaskCropSlices(self, referenceVolumeNode, maskSegmentationNode, maskSegmentID, marginMm):
+    # Get the region of the voxel array of the reference volume (tuple of K, J, I slices) containing the mask segment
+    # extended by marginMm. Returns None if the mask is empty or the region is the whole volume
+    maskLabelmapNode = self.exportSegmentToLabelmap(maskSegmentationNode, maskSegmentID, referenceVolumeNode)
+    if maskLabelmapNode is None:
+      return None
+    maskArray = slicer.util.arrayFromVolume(maskLabelmapNode)
+    slicer.mrmlScene.RemoveNode(maskLabelmapNode)
+    referenceShape = slicer.util.arrayFromVolume(referenceVolumeNode).shape
+    if maskArray.shape != referenceShape or not maskArray.any():
+      return None
+
+    cropSlices = []
+    for axis, spacing in enumerate(reversed(referenceVolumeNode.GetSpacing())):
+      indices = numpy.nonzero(maskArray.any(axis=tuple([otherAxis for otherAxis in range(3) if otherAxis != axis])))[0]
+      marginVoxels = int(ceil(marginMm / abs(spacing)))
+      cropSlices.append(slice(max(0, indices[0] - marginVoxels), min(referenceShape[axis], indices[-1] + marginVoxels + 1)))
+    if all([cropSlice.start == 0 and cropSlice.stop == size for cropSlice, size in zip(cropSlices, referenceShape)]):
+      return None
+    return tuple(cropSlices)
+
+  # ---------------------------------------------------------------------------
+  def createCroppedVolume(self, volumeNode, cropSlices):
+    # Create volume containing the region of the voxel array given by cropSlices (see getMaskCropSlices),
+    # with the same orientation, parent transform and attributes (e.g. dose unit) as the volume
+    croppedVolumeNode = slicer.vtkMRMLScalarVolumeNode()
+    croppedVolumeNode.SetName(slicer.mrmlScene.GenerateUniqueName(volumeNode.GetName() + '_Cropped'))
+    slicer.mrmlScene.AddNode(croppedVolumeNode)
+    for attributeName in volumeNode.GetAttributeNames() or []:
+      croppedVolumeNode.SetAttribute(attributeName, volumeNode.GetAttribute(attributeName))
+
+    ijkToRas = vtk.vtkMatrix4x4()
+    volumeNode.GetIJKToRASMatrix(ijkToRas)
+    croppedOrigin = ijkToRas.MultiplyPoint([cropSlices[2].start, cropSlices[1].start, cropSlices[0].start, 1.0])
+    for row in range(3):
+      ijkToRas.SetElement(row, 3, croppedOrigin[row])
+    croppedVolumeNode.SetIJKToRASMatrix(ijkToRas)
+    croppedVolumeNode.SetAndObserveTransformNodeID(volumeNode.GetTransformNodeID())
+    slicer.util.updateVolumeFromArray(croppedVolumeNode, numpy.ascontiguousarray(slicer.util.arrayFromVolume(volumeNode)[cropSlices]))
+    return croppedVolumeNode
+
+  # ---------------------------------------------------------------------------
+  def pasteCroppedVolume(self, croppedVolumeNode, referenceVolumeNode, cropSlices):
+    # Set the voxels of the cropped volume in the region cropSlices of a zero voxel array on the reference volume
+    # geometry (inverse of createCroppedVolume). The cropped volume gets the reference volume geometry
+    croppedArray = slicer.util.arrayFromVolume(croppedVolumeNode)
+    pastedArray = numpy.zeros(slicer.util.arrayFromVolume(referenceVolumeNode).shape, dtype=croppedArray.dtype)
+    pastedArray[cropSlices] = croppedArray
+    croppedVolumeNode.CopyOrientation(referenceVolumeNode)
+    croppedVolumeNode.SetAndObserveTransformNodeID(referenceVolumeNode.GetTransformNodeID())
+    slicer.util.updateVolumeFromArray(croppedVolumeNode, pastedArray)
+
+  # ---------------------------------------------------------------------------
+  def exportSegmentToLabelmap(self, segmentationNode, segmentID, referenceVolumeNode):
+    # Export segment (or all segments if segmentID is empty) to a new labelmap node in the geometry of the reference volume
+    labelmapNode = slicer.vtkMRMLLabelMapVolumeNode()
+    labelmapNode.SetName(slicer.mrmlScene.GenerateUniqueName('GammaMask'))
+    slicer.mrmlScene.AddNode(labelmapNode)
+    segmentIDs = vtk.vtkStringArray()
+    if segmentID:
+      segmentIDs.InsertNextValue(segmentID)
+    else:
+      segmentationNode.GetSegmentation().GetSegmentIDs(segmentIDs)
+    if not slicer.vtkSlicerSegmentationsModuleLogic.ExportSegmentsToLabelmapNode(segmentationNode, segmentIDs, labelmapNode, referenceVolumeNode):
+      slicer.mrmlScene.RemoveNode(labelmapNode)
+      return None
+    return labelmapNode
+
+  # ---------------------------------------------------------------------------
+  def getVolumeNodeForPipeline(self, config, volumeKeyPrefix):
+    # Get volume node by ID or load it from file, based on the keys <prefix>NodeID or <prefix>FilePath in the config
+    if config.get(volumeKeyPrefix + 'NodeID'):
+      volumeNode = slicer.mrmlScene.GetNodeByID(config[volumeKeyPrefix + 'NodeID'])
+      if volumeNode is None:
+        logging.error('Failed to find volume node ' + repr(config[volumeKeyPrefix + 'NodeID']))
+      return volumeNode
+
+    filePath = config[volumeKeyPrefix + 'FilePath']
+    fileType = 'VffFile' if filePath.lower().endswith('.vff') else 'VolumeFile'
+    try:
+      volumeNode = slicer.util.loadNodeFromFile(filePath, fileType, {})
+    except Exception as e:
+      # Recent Slicer versions raise exception instead of returning None
+      logging.error('Failed to load volume from ' + repr(filePath) + ': ' + str(e))
+      return None
+    if volumeNode is None:
+      logging.error('Failed to load volume from ' + repr(filePath))
+    return volumeNode
+
+
 #
-# Function to minimize for the calibration curve alignment
+# CliRunFuture
 #
-def curveAlignmentCalibrationFunction():
-  # Get logic instance
-  global gelDosimetryLogicInstanceGlobal
-  logic = gelDosimetryLogicInstanceGlobal
-
-  # Transform experimental calibration curve with the current values provided by the minimizer and
-  # create piecewise function from the transformed calibration curve to be able to compare with the Pdd
-  xTrans = logic.minimizer.GetParameterValue("xTrans")
-  yScale = logic.minimizer.GetParameterValue("yScale")
-  yTrans = logic.minimizer.GetParameterValue("yTrans")
-  interpolator = vtk.vtkPiecewiseFunction()
-  logic.populateInterpolatorForParameters(interpolator, xTrans, yScale, yTrans)
-  interpolatorRange = interpolator.GetRange()
-  # Compute similarity between the Pdd and the transformed calibration curve
-  pddNumberOfRows = logic.pddDataArray.shape[0]
-  sumSquaredDifference = 0.0
-  for pddRowIndex in range(pddNumberOfRows):
-    pddCurrentDepth = logic.pddDataArray[pddRowIndex, 0]
-    pddCurrentDose = logic.pddDataArray[pddRowIndex, 1]
-    difference = pddCurrentDose - interpolator.GetValue(pddCurrentDepth)
-    if pddCurrentDepth < interpolatorRange[0] or pddCurrentDepth > interpolatorRange[1]:
-      pass # Don't count the parts outside the range of the actual transformed calibration curve
+# Handle of a CLI module run started without waiting for it to finish. The status is updated from the status
+# modified events of the CLI node, so the application stays responsive while the CLI is running.
+#
+class CliRunFuture(object):
+
+  def __init__(self, cliNode, finalizeFunction=None, timeoutSec=None):
+    self.cliNode = cliNode
+    # Function called with the CLI node when the CLI completes successfully. Its return value is the result
+    self.finalizeFunction = finalizeFunction
+    # Status of the run: running, completed, failed, cancelled, or timeout
+    self.status = 'running'
+    self.resultValue = None
+    self.errorText = None
+    self.completedCallbacks = []
+    self.timedOut = False
+
+    # Cancel the CLI if it does not finish in time
+    self.timeoutTimer = None
+    if timeoutSec is not None:
+      self.timeoutTimer = qt.QTimer()
+      self.timeoutTimer.setSingleShot(True)
+      self.timeoutTimer.setInterval(int(timeoutSec * 1000))
+      self.timeoutTimer.connect('timeout()', self.onTimeout)
+      self.timeoutTimer.start()
+
+    self.statusObserverTag = cliNode.AddObserver(slicer.vtkMRMLCommandLineModuleNode.StatusModifiedEvent, self.onStatusModified)
+    # The CLI may have finished already (e.g. if it failed to start)
+    self.onStatusModified()
+
+  # ---------------------------------------------------------------------------
+  def onStatusModified(self, caller=None, event=None):
+    if self.done() or self.cliNode.IsBusy():
+      return
+    statusString = self.cliNode.GetStatusString()
+    if statusString == 'Completed':
+      try:
+        self.resultValue = self.finalizeFunction(self.cliNode) if self.finalizeFunction is not None else self.cliNode
+        status = 'completed'
+      except Exception as e:
+        import traceback
+        traceback.print_exc()
+        self.errorText = str(e)
+        status = 'failed'
+    elif statusString == 'Cancelled':
+      status = 'timeout' if self.timedOut else 'cancelled'
     else:
-      sumSquaredDifference += difference ** 2
+      self.errorText = self.cliNode.GetErrorText()
+      status = 'failed'
+    if status != 'completed':
+      logging.error('{0} {1}{2}'.format(self.cliNode.GetName(), status, ': ' + self.errorText if self.errorText else ''))
+    self.finish(status)
+
+  # ---------------------------------------------------------------------------
+  def finish(self, status):
+    self.cliNode.RemoveObserver(self.statusObserverTag)
+    if self.timeoutTimer is not None:
+      self.timeoutTimer.stop()
+    self.status = status
+    for completedCallback in self.completedCallbacks:
+      completedCallback(self)
+
+  # ---------------------------------------------------------------------------
+  def onTimeout(self):
+    if not self.done():
+      self.timedOut = True
+      self.cancel()
+
+  # ---------------------------------------------------------------------------
+  def cancel(self):
+    # Request cancellation of the CLI. The status changes to cancelled when the CLI has stopped
+    if self.done():
+      return False
+    self.cliNode.Cancel()
+    return True
+
+  # ---------------------------------------------------------------------------
+  def done(self):
+    return self.status != 'running'
 
-  # logging.debug('Iteration: {0:2}  xTrans: {1:6.2f}  yScale: {2:6.2f}  yTrans: {3:6.2f}    error: {4:.2f}'.format(logic.minimizer.GetIterations(), xTrans, yScale, yTrans, sumSquaredDifference))
-  logic.minimizer.SetFunctionValue(sumSquaredDifference)
+  # ---------------------------------------------------------------------------
+  def result(self):
+    # Result of the finalize function, or None if the CLI has not completed successfully
+    return self.resultValue
+
+  # ---------------------------------------------------------------------------
+  def addCompletedCallback(self, completedCallback):
+    # Callback is called with the future when the run finishes (successfully or not)
+    if self.done():
+      completedCallback(self)
+    else:
+      self.completedCallbacks.append(completedCallback)
 
-# Global variable holding the logic instance for the calibration curve minimizer function
-gelDosimetryLogicInstanceGlobal = None
+  # ---------------------------------------------------------------------------
+  def wait(self, timeoutSec=None):
+    # Process events until the run finishes. Only for scripts and tests, the GUI should use the callback instead
+    # Returns True if the CLI has completed successfully
+    import time
+    start = time.time()
+    while not self.done():
+      if timeoutSec is not None and time.time() - start > timeoutSec:
+        return False
+      slicer.app.processEvents()
+      time.sleep(0.01)
+    return self.status == 'completed'
+
+
+#
+# GammaComputationFuture
+#
+# Handle of a native gamma computation running in a background thread (see
+# GelDosimetryAnalysisLogic.computeGammaDoseComparisonNativeAsync). The computation is polled from the main
+# thread by a timer, which reports the progress and applies the results when the computation finishes.
+#
+class GammaComputationFuture(object):
+
+  def __init__(self, algoLogic, finalizeFunction=None):
+    self.algoLogic = algoLogic
+    # Function called when the computation completes successfully. Its return value is the result
+    self.finalizeFunction = finalizeFunction
+    # Status of the computation: running, completed, failed, or cancelled
+    self.status = 'running'
+    self.resultValue = None
+    self.errorText = None
+    self.cancelRequested = False
+    self.completedCallbacks = []
+    self.progressCallbacks = []
+
+    self.pollTimer = qt.QTimer()
+    self.pollTimer.setInterval(100)
+    self.pollTimer.connect('timeout()', self.onPollTimeout)
+
+  # ---------------------------------------------------------------------------
+  def start(self):
+    self.pollTimer.start()
+
+  # ---------------------------------------------------------------------------
+  def onPollTimeout(self):
+    if self.done():
+      return
+    if self.algoLogic.IsGammaDoseDifferenceRunning():
+      progress = self.algoLogic.GetGammaDoseDifferenceProgress()
+      for progressCallback in self.progressCallbacks:
+        progressCallback(progress)
+      return
+
+    # The gamma volume is only set if the computation has completed and has not been canceled
+    success = self.algoLogic.FinishGammaDoseDifference()
+    if self.cancelRequested:
+      logging.info('Gamma dose comparison cancelled')
+      self.finish('cancelled')
+    elif not success:
+      self.fail('Native gamma computation failed, see the application log for details')
+    else:
+      try:
+        self.resultValue = self.finalizeFunction() if self.finalizeFunction is not None else None
+        self.finish('completed')
+      except Exception as e:
+        import traceback
+        traceback.print_exc()
+        self.fail(str(e))
+
+  # ---------------------------------------------------------------------------
+  def fail(self, errorText):
+    self.errorText = errorText
+    logging.error('Gamma dose comparison failed: ' + errorText)
+    self.finish('failed')
+
+  # ---------------------------------------------------------------------------
+  def finish(self, status):
+    self.pollTimer.stop()
+    self.status = status
+    for completedCallback in self.completedCallbacks:
+      completedCallback(self)
+
+  # ---------------------------------------------------------------------------
+  def cancel(self):
+    # Request cancellation of the computation. The status changes to cancelled when the computation has stopped
+    if self.done():
+      return False
+    self.cancelRequested = True
+    self.algoLogic.CancelGammaDoseDifference()
+    return True
+
+  # ---------------------------------------------------------------------------
+  def done(self):
+    return self.status != 'running'
+
+  # ---------------------------------------------------------------------------
+  def result(self):
+    # Result of the finalize function, or None if the computation has not completed successfully
+    return self.resultValue
+
+  # ---------------------------------------------------------------------------
+  def addCompletedCallback(self, completedCallback):
+    # Callback is called with the future when the computation finishes (successfully or not)
+    if self.done():
+      completedCallback(self)
+    else:
+      self.completedCallbacks.append(completedCallback)
+
+  # ---------------------------------------------------------------------------
+  def addProgressCallback(self, progressCallback):
+    # Callback is called with the fraction of the computation done (between 0 and 1) while it is running
+    self.progressCallbacks.append(progressCallback)
+
+  # ---------------------------------------------------------------------------
+  def wait(self, timeoutSec=None):
+    # Process events until the computation finishes. Only for scripts and tests, the GUI should use the callback instead
+    # Returns True if the computation has completed successfully
+    import time
+    start = time.time()
+    while not self.done():
+      if timeoutSec is not None and time.time() - start > timeoutSec:
+        return False
+      slicer.app.processEvents()
+      time.sleep(0.01)
+    return self.status == 'completed'
+
+
+#
+# GammaDoseComparisonResults
+#
+# Results of the native gamma dose comparison (see GelDosimetryAnalysisLogic.computeGammaDoseComparisonNative).
+# Provides the same accessors as the SlicerRT dose comparison node, so that the callers can use either engine.
+#
+class GammaDoseComparisonResults(object):
+
+  def __init__(self, resultsValid, gammaVolumeNode, parameters, errorMessage=None, passFractionPercent=0.0, numberOfAnalyzedVoxels=0, referenceDoseGy=0.0):
+    self.resultsValid = resultsValid
+    self.gammaVolumeNode = gammaVolumeNode
+    self.parameters = dict(parameters)
+    self.errorMessage = errorMessage
+    self.passFractionPercent = passFractionPercent
+    self.numberOfAnalyzedVoxels = numberOfAnalyzedVoxels
+    self.referenceDoseGy = referenceDoseGy
+
+  # ---------------------------------------------------------------------------
+  def GetResultsValid(self):
+    return self.resultsValid
+
+  # ---------------------------------------------------------------------------
+  def GetPassFractionPercent(self):
+    return self.passFractionPercent
+
+  # ---------------------------------------------------------------------------
+  def GetGammaVolumeNode(self):
+    return self.gammaVolumeNode
+
+  # ---------------------------------------------------------------------------
+  def GetReportString(self):
+    if not self.resultsValid:
+      return 'Gamma dose comparison failed: ' + str(self.errorMessage)
+    report = 'Gamma dose comparison (native engine)\n'
+    report += '  Distance-to-agreement criteria: {0} mm\n'.format(self.parameters.get('dtaDistanceToleranceMm', 3.0))
+    report += '  Dose difference criteria: {0}% of {1:.4g} Gy\n'.format(self.parameters.get('doseDifferenceTolerancePercent', 3.0), self.referenceDoseGy)
+    report += '  Analysis threshold: {0}%\n'.format(self.parameters.get('analysisThresholdPercent', 0.0))
+    report += '  Maximum gamma: {0}\n'.format(self.parameters.get('maximumGamma', 2.0))
+    report += '  Number of analyzed voxels: {0}\n'.format(self.numberOfAnalyzedVoxels)
+    report += '  Pass fraction: {0:.2f}%'.format(self.passFractionPercent)
+    return report
 
 # Notes:
 # Code snippet to reload logic
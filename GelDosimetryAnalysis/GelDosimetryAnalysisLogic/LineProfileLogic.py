@@ -1,5 +1,7 @@
 from __main__ import vtk, qt, ctk, slicer
 import math
+import numpy
+from vtk.util import numpy_support
 
 #
 # LineProfileLogic
@@ -116,18 +118,17 @@ class LineProfileLogic():
       probedPoints = probedPointsList[probeIndex]
       intensityArray = intensityArrayList[probeIndex]
 
-      # Create arrays of data
+      # Create arrays of data (filled through numpy views of the table columns)
       outputTable.GetTable().SetNumberOfRows(probedPoints.GetNumberOfPoints())
-      x = range(0, probedPoints.GetNumberOfPoints())
       xStep = rulerLengthMm/(probedPoints.GetNumberOfPoints()-1)
 
       if probeIndex == 0:
-        for i in range(len(x)):
-          distanceArray.SetValue(i, x[i]*xStep)
+        numpy_support.vtk_to_numpy(distanceArray)[:] = numpy.arange(probedPoints.GetNumberOfPoints()) * xStep
+        distanceArray.Modified()
 
-      probedPointScalars = probedPoints.GetPointData().GetScalars()
-      for i in range(len(x)):
-        intensityArray.SetValue(i, probedPointScalars.GetTuple(i)[0])
+      probedPointScalars = numpy_support.vtk_to_numpy(probedPoints.GetPointData().GetScalars())
+      numpy_support.vtk_to_numpy(intensityArray)[:] = probedPointScalars if probedPointScalars.ndim == 1 else probedPointScalars[:,0]
+      intensityArray.Modified()
 
   def updatePlot(self, inputVolumeNodes, outputTable, name=None):
 
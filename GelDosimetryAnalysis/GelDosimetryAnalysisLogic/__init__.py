@@ -1,2 +1,3 @@
 from .GelDosimetryAnalysisLogic import *
 from .LineProfileLogic import *
+from .BatchProcessingLogic import *
@@ -25,14 +25,37 @@
 #include <vtkObjectFactory.h>
 #include <vtkSmartPointer.h>
 #include <vtkImageData.h>
+#include <vtkInformation.h>
+#include <vtkInformationVector.h>
+#include <vtkPointData.h>
+
+// STD includes
+#include <vector>
 
 //----------------------------------------------------------------------------
 vtkStandardNewMacro(vtkApplyPolynomialFunctionOnVolume);
 
+//----------------------------------------------------------------------------
+// Evaluate polynomial using Horner's scheme (highest order coefficient first)
+static inline double vtkApplyPolynomialFunctionOnVolumeEvaluate(const std::vector<double>& coefficients, double x)
+{
+  double value = coefficients[0];
+  for (size_t coeffIndex = 1; coeffIndex < coefficients.size(); ++coeffIndex)
+  {
+    value = value * x + coefficients[coeffIndex];
+  }
+  return value;
+}
+
 //----------------------------------------------------------------------------
 vtkApplyPolynomialFunctionOnVolume::vtkApplyPolynomialFunctionOnVolume()
 {
   this->PolynomialCoefficients = NULL;
+  this->InPlace = false;
+  this->OutputScalarType = -1;
+  this->CalibrationMethod = CalibrationMethodAutomatic;
+  this->LookupTableUsed = false;
+  this->LookupTableMinimum = 0;
 }
 
 //----------------------------------------------------------------------------
@@ -47,90 +70,278 @@ void vtkApplyPolynomialFunctionOnVolume::PrintSelf(ostream& os, vtkIndent indent
   this->Superclass::PrintSelf(os,indent);
 
   os << indent << "PolynomialCoefficients: " << this->GetPolynomialCoefficients() << "\n";
+  os << indent << "InPlace: " << (this->InPlace ? "true" : "false") << "\n";
+  os << indent << "OutputScalarType: " << this->OutputScalarType << "\n";
+  os << indent << "CalibrationMethod: " << this->CalibrationMethod << "\n";
+  os << indent << "LookupTableUsed: " << (this->LookupTableUsed ? "true" : "false") << "\n";
 }
 
 //----------------------------------------------------------------------------
-// The switch statement in Execute will call this method with
-// the appropriate input type (IT). Note that this example assumes
-// that the output data type is the same as the input data type.
-// This is not always the case.
-template <class IT>
-void vtkApplyPolynomialFunctionOnVolumeExecute(vtkApplyPolynomialFunctionOnVolume *self,
-                                               vtkImageData* input,
+int vtkApplyPolynomialFunctionOnVolume::GetOutputScalarTypeForInputScalarType(int inputScalarType)
+{
+  if (this->OutputScalarType != -1)
+  {
+    return this->OutputScalarType;
+  }
+  // Integer input types would truncate the calibrated values
+  if (inputScalarType == VTK_FLOAT || inputScalarType == VTK_DOUBLE)
+  {
+    return inputScalarType;
+  }
+  return VTK_FLOAT;
+}
+
+//----------------------------------------------------------------------------
+int vtkApplyPolynomialFunctionOnVolume::RequestInformation(vtkInformation* vtkNotUsed(request),
+                                                           vtkInformationVector** inputVector,
+                                                           vtkInformationVector* outputVector)
+{
+  vtkInformation* inInfo = inputVector[0]->GetInformationObject(0);
+  vtkInformation* outInfo = outputVector->GetInformationObject(0);
+
+  int outputScalarType = this->GetOutputScalarTypeForInputScalarType(vtkImageData::GetScalarType(inInfo));
+  vtkDataObject::SetPointDataActiveScalarInfo(outInfo, outputScalarType, 1);
+  return 1;
+}
+
+//----------------------------------------------------------------------------
+// The switch statement in vtkApplyPolynomialFunctionOnVolumeExecuteOutput will call
+// this method with the appropriate input type (IT) and output type (OT) for the
+// extent processed by one thread.
+template <class IT, class OT>
+void vtkApplyPolynomialFunctionOnVolumeExecute(vtkImageData* input,
                                                vtkImageData* output,
-                                               IT* inPtr, IT* outPtr)
+                                               IT* inPtr, OT* outPtr,
+                                               int outExt[6],
+                                               const std::vector<double>& coefficients,
+                                               const double* lookupTable, vtkIdType lookupTableMinimum)
+{
+  vtkIdType inIncX = 0, inIncY = 0, inIncZ = 0;
+  vtkIdType outIncX = 0, outIncY = 0, outIncZ = 0;
+  input->GetContinuousIncrements(outExt, inIncX, inIncY, inIncZ);
+  output->GetContinuousIncrements(outExt, outIncX, outIncY, outIncZ);
+
+  int rowLength = outExt[1] - outExt[0] + 1;
+
+  // Apply polynomial on volume voxels, either by looking up the value precomputed for
+  // every possible input value, or evaluating the polynomial for each voxel
+  for (int z = outExt[4]; z <= outExt[5]; ++z)
+  {
+    for (int y = outExt[2]; y <= outExt[3]; ++y)
+    {
+      if (lookupTable)
+      {
+        for (int x = 0; x < rowLength; ++x)
+        {
+          *outPtr = static_cast<OT>(lookupTable[static_cast<vtkIdType>(*inPtr) - lookupTableMinimum]);
+          ++inPtr;
+          ++outPtr;
+        }
+      }
+      else
+      {
+        for (int x = 0; x < rowLength; ++x)
+        {
+          *outPtr = static_cast<OT>(vtkApplyPolynomialFunctionOnVolumeEvaluate(coefficients, static_cast<double>(*inPtr)));
+          ++inPtr;
+          ++outPtr;
+        }
+      }
+      inPtr += inIncY;
+      outPtr += outIncY;
+    }
+    inPtr += inIncZ;
+    outPtr += outIncZ;
+  }
+}
+
+//----------------------------------------------------------------------------
+// The switch statement in ThreadedRequestData will call this method with
+// the appropriate input type (IT), and this method selects the output type.
+template <class IT>
+void vtkApplyPolynomialFunctionOnVolumeExecuteOutput(vtkImageData* input,
+                                                     vtkImageData* output,
+                                                     IT* inPtr, void* outPtr,
+                                                     int outExt[6],
+                                                     const std::vector<double>& coefficients,
+                                                     const double* lookupTable, vtkIdType lookupTableMinimum)
 {
-  int dims[3];
-  input->GetDimensions(dims);
-  if (input->GetScalarType() != output->GetScalarType())
+  switch(output->GetScalarType())
   {
-    vtkGenericWarningMacro(<< "Execute: input ScalarType, " << input->GetScalarType()
-      << ", must match out ScalarType " << output->GetScalarType());
+    vtkTemplateMacro(
+      vtkApplyPolynomialFunctionOnVolumeExecute(
+      input, output, inPtr,
+      static_cast<VTK_TT *>(outPtr),
+      outExt, coefficients, lookupTable, lookupTableMinimum));
+  default:
+    vtkGenericWarningMacro("Execute: Unknown output ScalarType");
     return;
   }
+}
 
-  int size = dims[0]*dims[1]*dims[2];
+//----------------------------------------------------------------------------
+int vtkApplyPolynomialFunctionOnVolume::RequestData(vtkInformation* request,
+                                                    vtkInformationVector** inputVector,
+                                                    vtkInformationVector* outputVector)
+{
+  vtkImageData* inData = vtkImageData::GetData(inputVector[0]);
+  if (!inData)
+  {
+    vtkErrorMacro("RequestData: Invalid input image");
+    return 0;
+  }
 
-  double inValue = 0;
+  // Check Single component
+  int numberOfScalarComponents = inData->GetNumberOfScalarComponents();
+  if (numberOfScalarComponents != 1)
+  {
+    vtkErrorMacro("RequestData: Input has " << numberOfScalarComponents << " instead of 1 scalar component.");
+    return 0;
+  }
 
-  // Convert input coefficients into vector for faster access
-  std::vector<double> coefficients;
-  coefficients.resize(self->GetPolynomialCoefficients()->GetNumberOfTuples());
-  for (int coeffIndex = 0; coeffIndex < self->GetPolynomialCoefficients()->GetNumberOfTuples(); ++coeffIndex)
+  // Validate input coefficients
+  if (this->PolynomialCoefficients == NULL || this->PolynomialCoefficients->GetNumberOfTuples() < 1)
   {
-    coefficients[coeffIndex] = self->GetPolynomialCoefficients()->GetValue(coeffIndex);
+    vtkErrorMacro("RequestData: Invalid input polynomial coefficiets");
+    return 0;
   }
 
-  // Apply polynomial on volume voxels
-  for(int i=0; i<size; i++)
+  // Evaluate the polynomial once for each possible input value if the input range is small enough
+  this->LookupTable.clear();
+  this->LookupTableUsed = false;
+  vtkIdType lookupTableRange[2] = {0, 0};
+  if (this->GetLookupTableRange(inData, lookupTableRange))
   {
-    inValue = inPtr[i];
+    std::vector<double> coefficients(this->PolynomialCoefficients->GetNumberOfTuples());
+    for (vtkIdType coeffIndex = 0; coeffIndex < this->PolynomialCoefficients->GetNumberOfTuples(); ++coeffIndex)
+    {
+      coefficients[coeffIndex] = this->PolynomialCoefficients->GetValue(coeffIndex);
+    }
+    this->LookupTable.resize(lookupTableRange[1] - lookupTableRange[0] + 1);
+    for (vtkIdType value = lookupTableRange[0]; value <= lookupTableRange[1]; ++value)
+    {
+      this->LookupTable[value - lookupTableRange[0]] = vtkApplyPolynomialFunctionOnVolumeEvaluate(coefficients, static_cast<double>(value));
+    }
+    this->LookupTableMinimum = lookupTableRange[0];
+    this->LookupTableUsed = true;
+  }
+
+  int result = this->Superclass::RequestData(request, inputVector, outputVector);
 
-    int maxOrder = coefficients.size() - 1;
-    IT calibratedValue = 0;
-    for (int order=0; order < maxOrder+1; ++order)
+  // Release lookup table memory
+  this->LookupTable.clear();
+  this->LookupTable.shrink_to_fit();
+
+  return result;
+}
+
+//----------------------------------------------------------------------------
+bool vtkApplyPolynomialFunctionOnVolume::GetLookupTableRange(vtkImageData* input, vtkIdType range[2])
+{
+  int scalarType = input->GetScalarType();
+  if ( this->CalibrationMethod == CalibrationMethodPolynomial
+    || scalarType == VTK_FLOAT || scalarType == VTK_DOUBLE )
+  {
+    return false;
+  }
+
+  // Use the full range of 8 and 16 bit types, the actual range of wider integer types
+  if (input->GetScalarSize() <= 2)
+  {
+    range[0] = static_cast<vtkIdType>(input->GetScalarTypeMin());
+    range[1] = static_cast<vtkIdType>(input->GetScalarTypeMax());
+  }
+  else
+  {
+    double scalarRange[2] = {0.0, 0.0};
+    input->GetScalarRange(scalarRange);
+    range[0] = static_cast<vtkIdType>(scalarRange[0]);
+    range[1] = static_cast<vtkIdType>(scalarRange[1]);
+  }
+
+  vtkIdType lookupTableSize = range[1] - range[0] + 1;
+  if (lookupTableSize > MaximumLookupTableSize)
+  {
+    if (this->CalibrationMethod == CalibrationMethodLookupTable)
     {
-      calibratedValue += coefficients[order] * pow(inValue, maxOrder-order);
+      vtkWarningMacro("GetLookupTableRange: Input range is too large for lookup table calibration ("
+        << lookupTableSize << " values), the polynomial is evaluated for each voxel instead");
     }
-    outPtr[i] = calibratedValue;
+    return false;
+  }
+
+  // Only worth it if there are more voxels than lookup table entries
+  if (this->CalibrationMethod == CalibrationMethodAutomatic && input->GetNumberOfPoints() <= lookupTableSize)
+  {
+    return false;
   }
+
+  return true;
 }
 
 //----------------------------------------------------------------------------
-// This method is passed a input and output data, and executes the filter
-// algorithm to fill the output from the input.
-// It just executes a switch statement to call the correct function for
-// the datas data types.
-void vtkApplyPolynomialFunctionOnVolume::SimpleExecute(vtkImageData *inData, vtkImageData *outData)
+void vtkApplyPolynomialFunctionOnVolume::AllocateOutputData(vtkImageData* output, vtkInformation* outInfo, int* uExtent)
 {
-  // Check Single component
-  int numberOfScalarComponents;
-  numberOfScalarComponents = inData->GetNumberOfScalarComponents();
-  if (numberOfScalarComponents != 1)
+  vtkImageData* input = vtkImageData::SafeDownCast(this->GetInput());
+  if (this->InPlace && input && input->GetPointData()->GetScalars())
   {
-    vtkErrorMacro("ThreadedExecute: Input has " << numberOfScalarComponents << " instead of 1 scalar component.");
-    return;
+    if (vtkImageData::GetScalarType(outInfo) != input->GetScalarType())
+    {
+      vtkWarningMacro("AllocateOutputData: Output scalar type differs from the input scalar type, in-place calibration is not possible");
+      this->Superclass::AllocateOutputData(output, outInfo, uExtent);
+      return;
+    }
+
+    int inExtent[6] = {0,0,0,0,0,0};
+    input->GetExtent(inExtent);
+    if ( inExtent[0] == uExtent[0] && inExtent[1] == uExtent[1]
+      && inExtent[2] == uExtent[2] && inExtent[3] == uExtent[3]
+      && inExtent[4] == uExtent[4] && inExtent[5] == uExtent[5] )
+    {
+      // Share the input buffer, each voxel is read before it is overwritten by the same thread
+      output->SetExtent(uExtent);
+      output->GetPointData()->SetScalars(input->GetPointData()->GetScalars());
+      return;
+    }
+    vtkWarningMacro("AllocateOutputData: Requested extent differs from the input extent, in-place calibration is not possible");
   }
 
-  // Validate input coefficients
-  if (this->PolynomialCoefficients == NULL || this->PolynomialCoefficients->GetNumberOfTuples() < 1)
+  this->Superclass::AllocateOutputData(output, outInfo, uExtent);
+}
+
+//----------------------------------------------------------------------------
+// This method is passed a input and output data and the extent to process, and
+// executes the filter algorithm to fill the output extent from the input.
+// It just executes a switch statement to call the correct function for
+// the datas data types.
+void vtkApplyPolynomialFunctionOnVolume::ThreadedRequestData(vtkInformation* vtkNotUsed(request),
+                                                             vtkInformationVector** vtkNotUsed(inputVector),
+                                                             vtkInformationVector* vtkNotUsed(outputVector),
+                                                             vtkImageData*** inData, vtkImageData** outData,
+                                                             int outExt[6], int vtkNotUsed(threadId))
+{
+  // Convert input coefficients into vector for faster access
+  std::vector<double> coefficients(this->PolynomialCoefficients->GetNumberOfTuples());
+  for (vtkIdType coeffIndex = 0; coeffIndex < this->PolynomialCoefficients->GetNumberOfTuples(); ++coeffIndex)
   {
-    vtkErrorMacro("ThreadedExecute Invalid input polynomial coefficiets");
-    return;
+    coefficients[coeffIndex] = this->PolynomialCoefficients->GetValue(coeffIndex);
   }
 
-  void* inPtr = inData->GetScalarPointer();
-  void* outPtr = outData->GetScalarPointer();
+  void* inPtr = inData[0][0]->GetScalarPointerForExtent(outExt);
+  void* outPtr = outData[0]->GetScalarPointerForExtent(outExt);
+
+  const double* lookupTable = (this->LookupTableUsed ? this->LookupTable.data() : nullptr);
 
-  switch(outData->GetScalarType())
+  switch(inData[0][0]->GetScalarType())
   {
     // This is simply a #define for a big case list. It handles all
     // data types VTK supports.
     vtkTemplateMacro(
-      vtkApplyPolynomialFunctionOnVolumeExecute(this,
-      inData, outData,
+      vtkApplyPolynomialFunctionOnVolumeExecuteOutput(
+      inData[0][0], outData[0],
       static_cast<VTK_TT *>(inPtr),
-      static_cast<VTK_TT *>(outPtr)));
+      outPtr, outExt, coefficients,
+      lookupTable, this->LookupTableMinimum));
   default:
     vtkGenericWarningMacro("Execute: Unknown input ScalarType");
     return;
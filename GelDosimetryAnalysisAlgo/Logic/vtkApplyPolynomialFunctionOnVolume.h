@@ -21,6 +21,14 @@
 
 // .NAME vtkApplyPolynomialFunctionOnVolume - Applies polynomial function on image data
 // .SECTION Description
+// The polynomial is evaluated using Horner's scheme. The output extent is split
+// between threads (see NumberOfThreads and EnableSMP in vtkThreadedImageAlgorithm).
+// The output scalar type is float for integer inputs unless OutputScalarType is set.
+// For integer inputs with a bounded range (8 and 16 bit types, or wider types with a
+// small scalar range) the polynomial is evaluated once for each possible input value
+// and applied as a lookup table (see CalibrationMethod).
+// If InPlace is on, then the output shares the scalar buffer of the input, so the
+// calibrated values overwrite the input voxels and no new buffer is allocated.
 
 #ifndef __vtkApplyPolynomialFunctionOnVolume_h
 #define __vtkApplyPolynomialFunctionOnVolume_h
@@ -28,17 +36,37 @@
 #include "vtkSlicerGelDosimetryAnalysisAlgoModuleLogicExport.h"
 
 // VTK includes
-#include <vtkSimpleImageToImageFilter.h>
+#include <vtkThreadedImageAlgorithm.h>
 #include <vtkDoubleArray.h>
 
+// STD includes
+#include <vector>
+
 class vtkImageData;
 
 /// \ingroup GelDosimetryAnalysis
-class VTK_SLICER_GELDOSIMETRYANALYSISALGO_MODULE_LOGIC_EXPORT vtkApplyPolynomialFunctionOnVolume : public vtkSimpleImageToImageFilter
+class VTK_SLICER_GELDOSIMETRYANALYSISALGO_MODULE_LOGIC_EXPORT vtkApplyPolynomialFunctionOnVolume : public vtkThreadedImageAlgorithm
 {
+public:
+  enum
+  {
+    /// Use lookup table if the input is integer with a bounded range, evaluate polynomial otherwise
+    CalibrationMethodAutomatic = 0,
+    /// Always evaluate the polynomial for each voxel
+    CalibrationMethodPolynomial,
+    /// Use lookup table whenever the input is integer and its range fits in MaximumLookupTableSize
+    CalibrationMethodLookupTable
+  };
+
+  enum
+  {
+    /// Maximum number of entries in the lookup table
+    MaximumLookupTableSize = 65536
+  };
+
 public:
   static vtkApplyPolynomialFunctionOnVolume *New();
-  vtkTypeMacro(vtkApplyPolynomialFunctionOnVolume, vtkSimpleImageToImageFilter);
+  vtkTypeMacro(vtkApplyPolynomialFunctionOnVolume, vtkThreadedImageAlgorithm);
   void PrintSelf(ostream& os, vtkIndent indent);
 
   /// Set polynomial coefficients
@@ -46,15 +74,72 @@ public:
   /// Get polynomial coefficients
   vtkGetObjectMacro(PolynomialCoefficients, vtkDoubleArray);
 
+  /// Set flag determining whether the calibrated values are written into the input buffer
+  vtkSetMacro(InPlace, bool);
+  /// Get flag determining whether the calibrated values are written into the input buffer
+  vtkGetMacro(InPlace, bool);
+  vtkBooleanMacro(InPlace, bool);
+
+  /// Set output scalar type. If -1 (default), then the output is float for integer
+  /// input types, and the input scalar type for float and double inputs.
+  vtkSetMacro(OutputScalarType, int);
+  /// Get output scalar type
+  vtkGetMacro(OutputScalarType, int);
+  void SetOutputScalarTypeToFloat() { this->SetOutputScalarType(VTK_FLOAT); };
+  void SetOutputScalarTypeToDouble() { this->SetOutputScalarType(VTK_DOUBLE); };
+  void SetOutputScalarTypeToAutomatic() { this->SetOutputScalarType(-1); };
+
+  /// Get the output scalar type used for the given input scalar type
+  int GetOutputScalarTypeForInputScalarType(int inputScalarType);
+
+  /// Set calibration method. Automatic by default
+  vtkSetClampMacro(CalibrationMethod, int, CalibrationMethodAutomatic, CalibrationMethodLookupTable);
+  /// Get calibration method
+  vtkGetMacro(CalibrationMethod, int);
+
+  /// Get flag indicating whether a lookup table was used in the last execution
+  vtkGetMacro(LookupTableUsed, bool);
+
 protected:
-  /// Execute function applying the polynomial to the input image
-  virtual void SimpleExecute(vtkImageData *inData, vtkImageData *outData);
+  /// Set the output scalar type in the pipeline information
+  int RequestInformation(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector) override;
+
+  /// Validate the input image and the coefficients before splitting the work between threads
+  int RequestData(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector) override;
+
+  /// Execute function applying the polynomial to the given extent of the input image
+  void ThreadedRequestData(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector,
+    vtkImageData*** inData, vtkImageData** outData, int outExt[6], int threadId) override;
+
+  /// Determine whether a lookup table is used for the given input, and the range of input values it covers
+  /// \return True if lookup table is to be used
+  bool GetLookupTableRange(vtkImageData* input, vtkIdType range[2]);
+
+  /// Use the input scalars as output scalars if in-place mode is on and the extents match
+  void AllocateOutputData(vtkImageData* output, vtkInformation* outInfo, int* uExtent) override;
+  using Superclass::AllocateOutputData;
 
 protected:
   /// Coefficients of the polynomial to apply. They are expected to be in
   /// decreasing order, as in p(x) = p[0] * x**deg + ... + p[deg]
   vtkDoubleArray* PolynomialCoefficients;
 
+  /// Flag determining whether the calibrated values are written into the input buffer. Off by default
+  bool InPlace;
+
+  /// Output scalar type. -1 means float for integer inputs, input scalar type otherwise
+  int OutputScalarType;
+
+  /// Calibration method (polynomial evaluation or lookup table)
+  int CalibrationMethod;
+
+  /// Flag indicating whether a lookup table was used in the last execution
+  bool LookupTableUsed;
+
+  /// Calibrated values for each input value from LookupTableMinimum. Only valid during execution
+  std::vector<double> LookupTable;
+  vtkIdType LookupTableMinimum;
+
 protected:
   vtkApplyPolynomialFunctionOnVolume();
   virtual ~vtkApplyPolynomialFunctionOnVolume();
@@ -0,0 +1,676 @@
+/*==============================================================================
+
+  Program: 3D Slicer
+
+  Copyright (c) Kitware Inc.
+
+  See COPYRIGHT.txt
+  or http://www.slicer.org/copyright/copyright.txt for details.
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+
+  This file was originally developed by Csaba Pinter, PerkLab, Queen's University
+  and was supported through the Applied Cancer Research Unit program of Cancer Care
+  Ontario with funds provided by the Ontario Ministry of Health and Long-Term Care
+
+==============================================================================*/
+
+#include "vtkComputeGammaDoseDifference.h"
+
+// VTK includes
+#include <vtkObjectFactory.h>
+#include <vtkDoubleArray.h>
+#include <vtkImageData.h>
+#include <vtkInformation.h>
+#include <vtkInformationVector.h>
+#include <vtkPointData.h>
+#include <vtkStreamingDemandDrivenPipeline.h>
+
+// STD includes
+#include <algorithm>
+#include <cmath>
+
+//----------------------------------------------------------------------------
+vtkStandardNewMacro(vtkComputeGammaDoseDifference);
+
+//----------------------------------------------------------------------------
+vtkComputeGammaDoseDifference::vtkComputeGammaDoseDifference()
+{
+  this->SetNumberOfInputPorts(3);
+
+  this->DtaDistanceToleranceMm = 3.0;
+  this->DoseDifferenceTolerancePercent = 3.0;
+  this->ReferenceDoseGy = 0.0;
+  this->AnalysisThresholdPercent = 0.0;
+  this->MaximumGamma = 2.0;
+  this->PassFractionOnly = false;
+  this->HistogramBinWidth = 0.1;
+
+  this->UsedReferenceDoseGy = 0.0;
+  this->NumberOfAnalyzedVoxels = 0;
+
+  this->NumberOfRows = 0;
+  this->NumberOfComputedRows = 0;
+  this->CancelRequested = false;
+
+  this->SearchRadiusVoxels[0] = this->SearchRadiusVoxels[1] = this->SearchRadiusVoxels[2] = 0;
+}
+
+//----------------------------------------------------------------------------
+vtkComputeGammaDoseDifference::~vtkComputeGammaDoseDifference()
+{
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::PrintSelf(ostream& os, vtkIndent indent)
+{
+  this->Superclass::PrintSelf(os,indent);
+
+  os << indent << "DtaDistanceToleranceMm: " << this->DtaDistanceToleranceMm << "\n";
+  os << indent << "DoseDifferenceTolerancePercent: " << this->DoseDifferenceTolerancePercent << "\n";
+  os << indent << "Criteria:";
+  for (std::vector<std::pair<double, double> >::iterator criterionIt = this->Criteria.begin(); criterionIt != this->Criteria.end(); ++criterionIt)
+  {
+    os << " " << criterionIt->second << "%/" << criterionIt->first << "mm";
+  }
+  os << "\n";
+  os << indent << "ReferenceDoseGy: " << this->ReferenceDoseGy << "\n";
+  os << indent << "AnalysisThresholdPercent: " << this->AnalysisThresholdPercent << "\n";
+  os << indent << "MaximumGamma: " << this->MaximumGamma << "\n";
+  os << indent << "PassFractionOnly: " << (this->PassFractionOnly ? "true" : "false") << "\n";
+  os << indent << "HistogramBinWidth: " << this->HistogramBinWidth << "\n";
+  os << indent << "UsedReferenceDoseGy: " << this->UsedReferenceDoseGy << "\n";
+  os << indent << "NumberOfAnalyzedVoxels: " << this->NumberOfAnalyzedVoxels << "\n";
+  for (size_t criterionIndex = 0; criterionIndex < this->NumberOfPassedVoxels.size(); ++criterionIndex)
+  {
+    os << indent << "PassFractionPercent[" << criterionIndex << "]: " << this->GetPassFractionPercent(static_cast<int>(criterionIndex)) << "\n";
+  }
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::SetReferenceDoseData(vtkImageData* referenceDose)
+{
+  this->SetInputData(0, referenceDose);
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::SetEvaluatedDoseData(vtkImageData* evaluatedDose)
+{
+  this->SetInputData(1, evaluatedDose);
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::SetMaskData(vtkImageData* mask)
+{
+  this->SetInputData(2, mask);
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::AddCriterion(double dtaDistanceToleranceMm, double doseDifferenceTolerancePercent)
+{
+  this->Criteria.push_back(std::make_pair(dtaDistanceToleranceMm, doseDifferenceTolerancePercent));
+  this->Modified();
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::RemoveAllCriteria()
+{
+  if (this->Criteria.empty())
+  {
+    return;
+  }
+  this->Criteria.clear();
+  this->Modified();
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::GetNumberOfCriteria()
+{
+  return (this->Criteria.empty() ? 1 : static_cast<int>(this->Criteria.size()));
+}
+
+//----------------------------------------------------------------------------
+double vtkComputeGammaDoseDifference::GetSearchRadiusMm()
+{
+  double maximumDtaMm = (this->Criteria.empty() ? this->DtaDistanceToleranceMm : 0.0);
+  for (std::vector<std::pair<double, double> >::iterator criterionIt = this->Criteria.begin(); criterionIt != this->Criteria.end(); ++criterionIt)
+  {
+    maximumDtaMm = std::max(maximumDtaMm, criterionIt->first);
+  }
+  return maximumDtaMm * this->MaximumGamma;
+}
+
+//----------------------------------------------------------------------------
+vtkIdType vtkComputeGammaDoseDifference::GetNumberOfPassedVoxels(int criterionIndex/*=0*/)
+{
+  if (criterionIndex < 0 || criterionIndex >= static_cast<int>(this->NumberOfPassedVoxels.size()))
+  {
+    return 0;
+  }
+  return this->NumberOfPassedVoxels[criterionIndex];
+}
+
+//----------------------------------------------------------------------------
+double vtkComputeGammaDoseDifference::GetPassFractionPercent(int criterionIndex/*=0*/)
+{
+  if (this->NumberOfAnalyzedVoxels == 0)
+  {
+    return 0.0;
+  }
+  return 100.0 * static_cast<double>(this->GetNumberOfPassedVoxels(criterionIndex)) / static_cast<double>(this->NumberOfAnalyzedVoxels);
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::GetPassFractionsPercent(vtkDoubleArray* passFractionsPercent)
+{
+  if (!passFractionsPercent)
+  {
+    return;
+  }
+  passFractionsPercent->SetNumberOfComponents(1);
+  passFractionsPercent->SetNumberOfTuples(this->NumberOfPassedVoxels.size());
+  for (size_t criterionIndex = 0; criterionIndex < this->NumberOfPassedVoxels.size(); ++criterionIndex)
+  {
+    passFractionsPercent->SetValue(criterionIndex, this->GetPassFractionPercent(static_cast<int>(criterionIndex)));
+  }
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::GetNumberOfHistogramBins()
+{
+  if (this->HistogramBinWidth <= 0.0 || this->MaximumGamma <= 1.0)
+  {
+    return 1;
+  }
+  // The small tolerance avoids an empty last bin due to rounding if the range is a multiple of the bin width
+  return 1 + static_cast<int>(std::ceil((this->MaximumGamma - 1.0) / this->HistogramBinWidth - 1e-9));
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::GetGammaHistogram(vtkDoubleArray* histogram, int criterionIndex/*=0*/)
+{
+  if (!histogram)
+  {
+    return;
+  }
+  histogram->SetNumberOfComponents(1);
+  histogram->SetNumberOfTuples(0);
+  int numberOfBins = this->GetNumberOfHistogramBins();
+  if (criterionIndex < 0 || static_cast<size_t>((criterionIndex + 1) * numberOfBins) > this->GammaHistograms.size())
+  {
+    return;
+  }
+  histogram->SetNumberOfTuples(numberOfBins);
+  for (int binIndex = 0; binIndex < numberOfBins; ++binIndex)
+  {
+    histogram->SetValue(binIndex, static_cast<double>(this->GammaHistograms[criterionIndex * numberOfBins + binIndex]));
+  }
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::FillInputPortInformation(int port, vtkInformation* info)
+{
+  int result = this->Superclass::FillInputPortInformation(port, info);
+  if (port == 2)
+  {
+    info->Set(vtkAlgorithm::INPUT_IS_OPTIONAL(), 1);
+  }
+  return result;
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::RequestInformation(vtkInformation* vtkNotUsed(request),
+                                                      vtkInformationVector** vtkNotUsed(inputVector),
+                                                      vtkInformationVector* outputVector)
+{
+  // One gamma component per criterion
+  vtkInformation* outInfo = outputVector->GetInformationObject(0);
+  vtkDataObject::SetPointDataActiveScalarInfo(outInfo, VTK_FLOAT, this->GetNumberOfCriteria());
+  return 1;
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::RequestUpdateExtent(vtkInformation* vtkNotUsed(request),
+                                                       vtkInformationVector** inputVector,
+                                                       vtkInformationVector* outputVector)
+{
+  vtkInformation* outInfo = outputVector->GetInformationObject(0);
+  int updateExtent[6] = {0,0,0,0,0,0};
+  outInfo->Get(vtkStreamingDemandDrivenPipeline::UPDATE_EXTENT(), updateExtent);
+
+  for (int port = 0; port < this->GetNumberOfInputPorts(); ++port)
+  {
+    vtkInformation* inInfo = inputVector[port]->GetInformationObject(0);
+    if (!inInfo)
+    {
+      continue;
+    }
+    if (port == 0)
+    {
+      inInfo->Set(vtkStreamingDemandDrivenPipeline::UPDATE_EXTENT(), updateExtent, 6);
+    }
+    else
+    {
+      inInfo->Set(vtkStreamingDemandDrivenPipeline::UPDATE_EXTENT(),
+        inInfo->Get(vtkStreamingDemandDrivenPipeline::WHOLE_EXTENT()), 6);
+    }
+  }
+  return 1;
+}
+
+//----------------------------------------------------------------------------
+double vtkComputeGammaDoseDifference::GetComputedFraction()
+{
+  vtkIdType numberOfRows = this->NumberOfRows;
+  return (numberOfRows > 0 ? static_cast<double>(this->NumberOfComputedRows) / numberOfRows : 0.0);
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::Cancel()
+{
+  this->CancelRequested = true;
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::ResetCancel()
+{
+  this->CancelRequested = false;
+}
+
+//----------------------------------------------------------------------------
+bool vtkComputeGammaDoseDifference::GetCanceled()
+{
+  return this->CancelRequested;
+}
+
+//----------------------------------------------------------------------------
+int vtkComputeGammaDoseDifference::RequestData(vtkInformation* request,
+                                               vtkInformationVector** inputVector,
+                                               vtkInformationVector* outputVector)
+{
+  this->NumberOfRows = 0;
+  this->NumberOfComputedRows = 0;
+  this->UsedReferenceDoseGy = 0.0;
+  this->NumberOfAnalyzedVoxels = 0;
+  this->NumberOfPassedVoxels.assign(this->GetNumberOfCriteria(), 0);
+  this->GammaHistograms.assign(this->GetNumberOfCriteria() * this->GetNumberOfHistogramBins(), 0);
+
+  vtkImageData* referenceData = vtkImageData::GetData(inputVector[0]);
+  vtkImageData* evaluatedData = vtkImageData::GetData(inputVector[1]);
+  vtkImageData* maskData = vtkImageData::GetData(inputVector[2]);
+  if (!referenceData || !evaluatedData)
+  {
+    vtkErrorMacro("RequestData: Invalid reference or evaluated dose image");
+    return 0;
+  }
+  if (referenceData->GetNumberOfScalarComponents() != 1 || evaluatedData->GetNumberOfScalarComponents() != 1)
+  {
+    vtkErrorMacro("RequestData: Reference and evaluated dose images need to have 1 scalar component");
+    return 0;
+  }
+  if (maskData && maskData->GetScalarType() != VTK_UNSIGNED_CHAR)
+  {
+    vtkErrorMacro("RequestData: Mask image needs to be of unsigned char type");
+    return 0;
+  }
+
+  // The search and the mask lookup use the same voxel indices in all images
+  int referenceExtent[6] = {0,0,0,0,0,0};
+  int evaluatedExtent[6] = {0,0,0,0,0,0};
+  int maskExtent[6] = {0,0,0,0,0,0};
+  referenceData->GetExtent(referenceExtent);
+  evaluatedData->GetExtent(evaluatedExtent);
+  if (maskData)
+  {
+    maskData->GetExtent(maskExtent);
+  }
+  for (int i = 0; i < 6; ++i)
+  {
+    if (evaluatedExtent[i] != referenceExtent[i] || (maskData && maskExtent[i] != referenceExtent[i]))
+    {
+      vtkErrorMacro("RequestData: Reference dose, evaluated dose and mask images need to have the same extent");
+      return 0;
+    }
+  }
+
+  if (this->MaximumGamma <= 0.0 || this->HistogramBinWidth <= 0.0)
+  {
+    vtkErrorMacro("RequestData: Maximum gamma and histogram bin width need to be positive");
+    return 0;
+  }
+
+  this->UsedReferenceDoseGy = this->ReferenceDoseGy;
+  if (this->UsedReferenceDoseGy <= 0.0)
+  {
+    double referenceRange[2] = {0.0, 0.0};
+    referenceData->GetScalarRange(referenceRange);
+    this->UsedReferenceDoseGy = referenceRange[1];
+  }
+  if (this->UsedReferenceDoseGy <= 0.0)
+  {
+    vtkErrorMacro("RequestData: Reference dose needs to be positive");
+    return 0;
+  }
+
+  // Prepare the tolerances of the criteria
+  std::vector<std::pair<double, double> > criteria = this->Criteria;
+  if (criteria.empty())
+  {
+    criteria.push_back(std::make_pair(this->DtaDistanceToleranceMm, this->DoseDifferenceTolerancePercent));
+  }
+  this->ExecutionCriteria.clear();
+  double maximumDtaMm = 0.0;
+  for (std::vector<std::pair<double, double> >::iterator criterionIt = criteria.begin(); criterionIt != criteria.end(); ++criterionIt)
+  {
+    if (criterionIt->first <= 0.0 || criterionIt->second <= 0.0)
+    {
+      vtkErrorMacro("RequestData: Distance to agreement and dose difference tolerances need to be positive");
+      return 0;
+    }
+    Criterion criterion;
+    criterion.DtaDistanceToleranceMm = criterionIt->first;
+    criterion.DoseDifferenceTolerancePercent = criterionIt->second;
+    criterion.InverseDtaSquared = 1.0 / (criterionIt->first * criterionIt->first);
+    double doseDifferenceToleranceGy = criterionIt->second / 100.0 * this->UsedReferenceDoseGy;
+    criterion.InverseDoseDifferenceSquared = 1.0 / (doseDifferenceToleranceGy * doseDifferenceToleranceGy);
+    this->ExecutionCriteria.push_back(criterion);
+    maximumDtaMm = std::max(maximumDtaMm, criterionIt->first);
+  }
+
+  // Collect the evaluated voxels within the maximum gamma distance of the largest DTA once, closest first.
+  // Voxels farther than DTA * MaximumGamma cannot yield a gamma value below the cap, so they are never visited
+  double spacing[3] = {1.0, 1.0, 1.0};
+  referenceData->GetSpacing(spacing);
+  vtkIdType increments[3] = {0,0,0};
+  evaluatedData->GetIncrements(increments);
+  double searchRadiusMm = maximumDtaMm * this->MaximumGamma;
+  double searchRadiusSquaredMm = searchRadiusMm * searchRadiusMm;
+  int searchRadiusVoxels[3] = {0,0,0};
+  for (int i = 0; i < 3; ++i)
+  {
+    searchRadiusVoxels[i] = static_cast<int>(std::floor(searchRadiusMm / std::fabs(spacing[i])));
+    // No need to search beyond the image
+    searchRadiusVoxels[i] = std::min(searchRadiusVoxels[i], referenceExtent[2*i+1] - referenceExtent[2*i]);
+  }
+
+  this->SearchOffsets.clear();
+  for (int k = -searchRadiusVoxels[2]; k <= searchRadiusVoxels[2]; ++k)
+  {
+    for (int j = -searchRadiusVoxels[1]; j <= searchRadiusVoxels[1]; ++j)
+    {
+      for (int i = -searchRadiusVoxels[0]; i <= searchRadiusVoxels[0]; ++i)
+      {
+        double dx = i * spacing[0];
+        double dy = j * spacing[1];
+        double dz = k * spacing[2];
+        double distanceSquaredMm = dx*dx + dy*dy + dz*dz;
+        if (distanceSquaredMm >= searchRadiusSquaredMm)
+        {
+          continue;
+        }
+        SearchOffset offset;
+        offset.Offset[0] = i;
+        offset.Offset[1] = j;
+        offset.Offset[2] = k;
+        offset.ScalarOffset = i * increments[0] + j * increments[1] + k * increments[2];
+        offset.DistanceSquaredMm = distanceSquaredMm;
+        this->SearchOffsets.push_back(offset);
+      }
+    }
+  }
+  std::stable_sort(this->SearchOffsets.begin(), this->SearchOffsets.end(),
+    [](const SearchOffset& a, const SearchOffset& b) { return a.DistanceSquaredMm < b.DistanceSquaredMm; });
+  for (int i = 0; i < 3; ++i)
+  {
+    this->SearchRadiusVoxels[i] = searchRadiusVoxels[i];
+  }
+
+  int updateExtent[6] = {0,0,0,0,0,0};
+  outputVector->GetInformationObject(0)->Get(vtkStreamingDemandDrivenPipeline::UPDATE_EXTENT(), updateExtent);
+  this->NumberOfRows = static_cast<vtkIdType>(updateExtent[3] - updateExtent[2] + 1) * (updateExtent[5] - updateExtent[4] + 1);
+
+  int result = this->Superclass::RequestData(request, inputVector, outputVector);
+
+  // Release search offsets memory
+  this->SearchOffsets.clear();
+  this->SearchOffsets.shrink_to_fit();
+  this->ExecutionCriteria.clear();
+
+  return result;
+}
+
+//----------------------------------------------------------------------------
+void vtkComputeGammaDoseDifference::AllocateOutputData(vtkImageData* output, vtkInformation* outInfo, int* uExtent)
+{
+  if (this->PassFractionOnly)
+  {
+    // Only the geometry is set, the gamma values are not stored
+    output->SetExtent(uExtent);
+    output->GetPointData()->SetScalars(nullptr);
+    return;
+  }
+  this->Superclass::AllocateOutputData(output, outInfo, uExtent);
+}
+
+//----------------------------------------------------------------------------
+// The switch statement in vtkComputeGammaDoseDifferenceExecuteEvaluated will call
+// this method with the appropriate reference type (RT) and evaluated type (ET) for
+// the extent processed by one thread.
+template <class RT, class ET>
+void vtkComputeGammaDoseDifferenceExecute(vtkComputeGammaDoseDifference* self,
+                                          vtkImageData* reference, vtkImageData* evaluated,
+                                          vtkImageData* mask, vtkImageData* output,
+                                          RT* vtkNotUsed(referencePtr), ET* vtkNotUsed(evaluatedPtr),
+                                          int outExt[6], int wholeExt[6], const int searchRadiusVoxels[3],
+                                          const std::vector<vtkComputeGammaDoseDifference::SearchOffset>& searchOffsets,
+                                          const std::vector<vtkComputeGammaDoseDifference::Criterion>& criteria,
+                                          vtkIdType& numberOfAnalyzedVoxels, std::vector<vtkIdType>& numberOfPassedVoxels,
+                                          std::vector<vtkIdType>& gammaHistograms,
+                                          std::atomic<vtkIdType>& numberOfComputedRows, const std::atomic<bool>& cancelRequested)
+{
+  double analysisThresholdGy = self->GetAnalysisThresholdPercent() / 100.0 * self->GetUsedReferenceDoseGy();
+  double maximumGamma = self->GetMaximumGamma();
+  double maximumGammaSquared = maximumGamma * maximumGamma;
+  int numberOfCriteria = static_cast<int>(criteria.size());
+  int numberOfHistogramBins = self->GetNumberOfHistogramBins();
+  double histogramBinWidth = self->GetHistogramBinWidth();
+  // Without output only the pass/fail decision matters for passing voxels, so the search stops at gamma <= 1
+  bool passFractionOnly = (output == nullptr);
+
+  // Best squared gamma of each criterion for the current voxel. A criterion is finished when its distance
+  // term alone reaches its best gamma, as the offsets are sorted by distance
+  std::vector<double> bestGammaSquared(numberOfCriteria);
+  std::vector<char> criterionFinished(numberOfCriteria);
+
+  for (int z = outExt[4]; z <= outExt[5]; ++z)
+  {
+    bool interiorZ = (z - searchRadiusVoxels[2] >= wholeExt[4] && z + searchRadiusVoxels[2] <= wholeExt[5]);
+    for (int y = outExt[2]; y <= outExt[3]; ++y)
+    {
+      if (cancelRequested)
+      {
+        return;
+      }
+      bool interiorYZ = interiorZ && (y - searchRadiusVoxels[1] >= wholeExt[2] && y + searchRadiusVoxels[1] <= wholeExt[3]);
+      RT* referenceRowPtr = static_cast<RT*>(reference->GetScalarPointer(outExt[0], y, z));
+      ET* evaluatedRowPtr = static_cast<ET*>(evaluated->GetScalarPointer(outExt[0], y, z));
+      unsigned char* maskRowPtr = (mask ? static_cast<unsigned char*>(mask->GetScalarPointer(outExt[0], y, z)) : nullptr);
+      float* outputRowPtr = (output ? static_cast<float*>(output->GetScalarPointer(outExt[0], y, z)) : nullptr);
+
+      for (int x = outExt[0]; x <= outExt[1]; ++x)
+      {
+        int index = x - outExt[0];
+        float* outputVoxelPtr = (outputRowPtr ? outputRowPtr + index * numberOfCriteria : nullptr);
+        double referenceValue = static_cast<double>(referenceRowPtr[index]);
+        if ((maskRowPtr && maskRowPtr[index] == 0) || referenceValue < analysisThresholdGy)
+        {
+          if (outputVoxelPtr)
+          {
+            std::fill(outputVoxelPtr, outputVoxelPtr + numberOfCriteria, 0.0f);
+          }
+          continue;
+        }
+
+        bool interior = interiorYZ && (x - searchRadiusVoxels[0] >= wholeExt[0] && x + searchRadiusVoxels[0] <= wholeExt[1]);
+        const ET* evaluatedVoxelPtr = evaluatedRowPtr + index;
+        std::fill(bestGammaSquared.begin(), bestGammaSquared.end(), maximumGammaSquared);
+        std::fill(criterionFinished.begin(), criterionFinished.end(), false);
+        int numberOfUnfinishedCriteria = numberOfCriteria;
+        for (std::vector<vtkComputeGammaDoseDifference::SearchOffset>::const_iterator offsetIt = searchOffsets.begin();
+          offsetIt != searchOffsets.end() && numberOfUnfinishedCriteria > 0; ++offsetIt)
+        {
+          if (!interior)
+          {
+            int ox = x + offsetIt->Offset[0];
+            int oy = y + offsetIt->Offset[1];
+            int oz = z + offsetIt->Offset[2];
+            if ( ox < wholeExt[0] || ox > wholeExt[1]
+              || oy < wholeExt[2] || oy > wholeExt[3]
+              || oz < wholeExt[4] || oz > wholeExt[5] )
+            {
+              continue;
+            }
+          }
+          // The dose difference is shared by all criteria, only the tolerances differ
+          double doseDifference = static_cast<double>(evaluatedVoxelPtr[offsetIt->ScalarOffset]) - referenceValue;
+          double doseDifferenceSquared = doseDifference * doseDifference;
+          for (int criterionIndex = 0; criterionIndex < numberOfCriteria; ++criterionIndex)
+          {
+            if (criterionFinished[criterionIndex])
+            {
+              continue;
+            }
+            const vtkComputeGammaDoseDifference::Criterion& criterion = criteria[criterionIndex];
+            double distanceTerm = offsetIt->DistanceSquaredMm * criterion.InverseDtaSquared;
+            if (distanceTerm >= bestGammaSquared[criterionIndex])
+            {
+              criterionFinished[criterionIndex] = true;
+              --numberOfUnfinishedCriteria;
+              continue;
+            }
+            double gammaSquared = distanceTerm + doseDifferenceSquared * criterion.InverseDoseDifferenceSquared;
+            if (gammaSquared < bestGammaSquared[criterionIndex])
+            {
+              bestGammaSquared[criterionIndex] = gammaSquared;
+              if (passFractionOnly && gammaSquared <= 1.0)
+              {
+                criterionFinished[criterionIndex] = true;
+                --numberOfUnfinishedCriteria;
+              }
+            }
+          }
+        }
+
+        ++numberOfAnalyzedVoxels;
+        for (int criterionIndex = 0; criterionIndex < numberOfCriteria; ++criterionIndex)
+        {
+          double gamma = std::sqrt(bestGammaSquared[criterionIndex]);
+          if (outputVoxelPtr)
+          {
+            outputVoxelPtr[criterionIndex] = static_cast<float>(gamma);
+          }
+          int binIndex = 0;
+          if (gamma <= 1.0)
+          {
+            ++numberOfPassedVoxels[criterionIndex];
+          }
+          else
+          {
+            binIndex = std::max(1, std::min(numberOfHistogramBins - 1, static_cast<int>(std::ceil((gamma - 1.0) / histogramBinWidth))));
+          }
+          ++gammaHistograms[criterionIndex * numberOfHistogramBins + binIndex];
+        }
+      }
+      ++numberOfComputedRows;
+    }
+  }
+}
+
+//----------------------------------------------------------------------------
+// The switch statement in ThreadedRequestData will call this method with
+// the appropriate reference type (RT), and this method selects the evaluated type.
+template <class RT>
+void vtkComputeGammaDoseDifferenceExecuteEvaluated(vtkComputeGammaDoseDifference* self,
+                                                   vtkImageData* reference, vtkImageData* evaluated,
+                                                   vtkImageData* mask, vtkImageData* output,
+                                                   RT* referencePtr, void* evaluatedPtr,
+                                                   int outExt[6], int wholeExt[6], const int searchRadiusVoxels[3],
+                                                   const std::vector<vtkComputeGammaDoseDifference::SearchOffset>& searchOffsets,
+                                                   const std::vector<vtkComputeGammaDoseDifference::Criterion>& criteria,
+                                                   vtkIdType& numberOfAnalyzedVoxels, std::vector<vtkIdType>& numberOfPassedVoxels,
+                                                   std::vector<vtkIdType>& gammaHistograms,
+                                                   std::atomic<vtkIdType>& numberOfComputedRows, const std::atomic<bool>& cancelRequested)
+{
+  switch(evaluated->GetScalarType())
+  {
+    vtkTemplateMacro(
+      vtkComputeGammaDoseDifferenceExecute(
+      self, reference, evaluated, mask, output,
+      referencePtr, static_cast<VTK_TT *>(evaluatedPtr),
+      outExt, wholeExt, searchRadiusVoxels, searchOffsets, criteria,
+      numberOfAnalyzedVoxels, numberOfPassedVoxels, gammaHistograms,
+      numberOfComputedRows, cancelRequested));
+  default:
+    vtkGenericWarningMacro("Execute: Unknown evaluated dose ScalarType");
+    return;
+  }
+}
+
+//----------------------------------------------------------------------------
+// This method is passed a input and output data and the extent to process, and
+// executes the filter algorithm to fill the output extent from the input.
+// It just executes a switch statement to call the correct function for
+// the datas data types.
+void vtkComputeGammaDoseDifference::ThreadedRequestData(vtkInformation* vtkNotUsed(request),
+                                                        vtkInformationVector** inputVector,
+                                                        vtkInformationVector* vtkNotUsed(outputVector),
+                                                        vtkImageData*** inData, vtkImageData** outData,
+                                                        int outExt[6], int vtkNotUsed(threadId))
+{
+  vtkImageData* reference = inData[0][0];
+  vtkImageData* evaluated = inData[1][0];
+  vtkImageData* mask = (inputVector[2]->GetNumberOfInformationObjects() > 0 ? inData[2][0] : nullptr);
+
+  int wholeExt[6] = {0,0,0,0,0,0};
+  reference->GetExtent(wholeExt);
+
+  void* referencePtr = reference->GetScalarPointerForExtent(outExt);
+  void* evaluatedPtr = evaluated->GetScalarPointerForExtent(outExt);
+
+  // Count locally, so that the threads only synchronize once
+  vtkIdType numberOfAnalyzedVoxels = 0;
+  std::vector<vtkIdType> numberOfPassedVoxels(this->ExecutionCriteria.size(), 0);
+  std::vector<vtkIdType> gammaHistograms(this->GammaHistograms.size(), 0);
+  vtkImageData* output = (this->PassFractionOnly ? nullptr : outData[0]);
+
+  switch(reference->GetScalarType())
+  {
+    // This is simply a #define for a big case list. It handles all
+    // data types VTK supports.
+    vtkTemplateMacro(
+      vtkComputeGammaDoseDifferenceExecuteEvaluated(
+      this, reference, evaluated, mask, output,
+      static_cast<VTK_TT *>(referencePtr), evaluatedPtr,
+      outExt, wholeExt, this->SearchRadiusVoxels, this->SearchOffsets, this->ExecutionCriteria,
+      numberOfAnalyzedVoxels, numberOfPassedVoxels, gammaHistograms,
+      this->NumberOfComputedRows, this->CancelRequested));
+  default:
+    vtkGenericWarningMacro("Execute: Unknown reference dose ScalarType");
+    return;
+  }
+
+  std::lock_guard<std::mutex> lock(this->ResultsMutex);
+  this->NumberOfAnalyzedVoxels += numberOfAnalyzedVoxels;
+  for (size_t criterionIndex = 0; criterionIndex < numberOfPassedVoxels.size(); ++criterionIndex)
+  {
+    this->NumberOfPassedVoxels[criterionIndex] += numberOfPassedVoxels[criterionIndex];
+  }
+  for (size_t binIndex = 0; binIndex < gammaHistograms.size(); ++binIndex)
+  {
+    this->GammaHistograms[binIndex] += gammaHistograms[binIndex];
+  }
+}
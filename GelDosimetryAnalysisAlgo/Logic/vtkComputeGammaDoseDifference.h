@@ -0,0 +1,248 @@
+/*==============================================================================
+
+  Program: 3D Slicer
+
+  Copyright (c) Kitware Inc.
+
+  See COPYRIGHT.txt
+  or http://www.slicer.org/copyright/copyright.txt for details.
+
+  Unless required by applicable law or agreed to in writing, software
+  distributed under the License is distributed on an "AS IS" BASIS,
+  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+  See the License for the specific language governing permissions and
+  limitations under the License.
+
+  This file was originally developed by Csaba Pinter, PerkLab, Queen's University
+  and was supported through the Applied Cancer Research Unit program of Cancer Care
+  Ontario with funds provided by the Ontario Ministry of Health and Long-Term Care
+
+==============================================================================*/
+
+// .NAME vtkComputeGammaDoseDifference - Computes gamma dose difference of two dose images
+// .SECTION Description
+// The gamma value of each reference voxel is the minimum over the evaluated voxels of
+// sqrt( distance^2 / DTA^2 + (evaluated dose - reference dose)^2 / DD^2 ), where DD is
+// the dose difference tolerance in percent of the reference dose (global gamma).
+// The reference and evaluated images (and the optional mask) need to have the same
+// extent, the distances are computed using the spacing of the reference image.
+// Gamma values are capped at MaximumGamma, so only the evaluated voxels closer than
+// DTA * MaximumGamma are searched. These neighbor offsets are computed once and sorted
+// by distance, so the search of a voxel stops as soon as the distance term alone
+// exceeds the best gamma found so far. The output extent is split between threads
+// (see NumberOfThreads and EnableSMP in vtkThreadedImageAlgorithm).
+// Voxels below the analysis threshold or outside the mask get gamma value 0 and are
+// not counted in the pass fraction.
+// Multiple criteria (DTA, DD pairs) can be evaluated in one pass using AddCriterion. Then
+// the search radius is given by the largest DTA, the neighborhood of each voxel is visited
+// once, and the output has one gamma component per criterion.
+// If only the pass fractions are needed (PassFractionOnly), then no output scalars are
+// allocated, and the search of a voxel stops as soon as a gamma value of at most 1 is found.
+// A histogram of the gamma values is computed in both modes. Its first bin contains the
+// passed voxels (gamma <= 1), the other bins divide the range (1, MaximumGamma] into bins of
+// HistogramBinWidth, so the histogram is the same with and without early exit.
+// The filter can be updated in a background thread: the progress (GetComputedFraction) can be
+// queried and the execution stopped (Cancel) from another thread.
+
+#ifndef __vtkComputeGammaDoseDifference_h
+#define __vtkComputeGammaDoseDifference_h
+
+#include "vtkSlicerGelDosimetryAnalysisAlgoModuleLogicExport.h"
+
+// VTK includes
+#include <vtkThreadedImageAlgorithm.h>
+
+// STD includes
+#include <atomic>
+#include <mutex>
+#include <vector>
+
+class vtkImageData;
+class vtkDoubleArray;
+
+/// \ingroup GelDosimetryAnalysis
+class VTK_SLICER_GELDOSIMETRYANALYSISALGO_MODULE_LOGIC_EXPORT vtkComputeGammaDoseDifference : public vtkThreadedImageAlgorithm
+{
+public:
+  /// Evaluated voxel searched around the reference voxel
+  struct SearchOffset
+  {
+    int Offset[3];
+    vtkIdType ScalarOffset;
+    double DistanceSquaredMm;
+  };
+
+  /// Gamma criterion with the tolerances prepared for the execution
+  struct Criterion
+  {
+    double DtaDistanceToleranceMm;
+    double DoseDifferenceTolerancePercent;
+    double InverseDtaSquared;
+    double InverseDoseDifferenceSquared;
+  };
+
+public:
+  static vtkComputeGammaDoseDifference *New();
+  vtkTypeMacro(vtkComputeGammaDoseDifference, vtkThreadedImageAlgorithm);
+  void PrintSelf(ostream& os, vtkIndent indent);
+
+  /// Set reference dose image (input port 0)
+  void SetReferenceDoseData(vtkImageData* referenceDose);
+  /// Set evaluated dose image (input port 1)
+  void SetEvaluatedDoseData(vtkImageData* evaluatedDose);
+  /// Set mask image of unsigned char type (input port 2, optional). Only the voxels where it is non-zero are analyzed
+  void SetMaskData(vtkImageData* mask);
+
+  /// Add criterion to evaluate in the same pass. If no criteria are added, then the single criterion
+  /// given by DtaDistanceToleranceMm and DoseDifferenceTolerancePercent is used
+  void AddCriterion(double dtaDistanceToleranceMm, double doseDifferenceTolerancePercent);
+  /// Remove all added criteria
+  void RemoveAllCriteria();
+  /// Get number of criteria evaluated, which is the number of output components
+  int GetNumberOfCriteria();
+  /// Get largest distance (mm) searched around a reference voxel: the largest DTA times MaximumGamma.
+  /// Evaluated voxels farther than this from the analyzed voxels do not affect the results
+  double GetSearchRadiusMm();
+
+  /// Set distance to agreement tolerance (mm) used if no criteria are added. 3 by default
+  vtkSetMacro(DtaDistanceToleranceMm, double);
+  /// Get distance to agreement tolerance (mm)
+  vtkGetMacro(DtaDistanceToleranceMm, double);
+
+  /// Set dose difference tolerance in percent of the reference dose used if no criteria are added. 3 by default
+  vtkSetMacro(DoseDifferenceTolerancePercent, double);
+  /// Get dose difference tolerance in percent of the reference dose
+  vtkGetMacro(DoseDifferenceTolerancePercent, double);
+
+  /// Set reference dose (Gy). If not positive (default), then the maximum of the reference dose image is used
+  vtkSetMacro(ReferenceDoseGy, double);
+  /// Get reference dose (Gy)
+  vtkGetMacro(ReferenceDoseGy, double);
+
+  /// Set analysis threshold in percent of the reference dose. Reference voxels below it are not analyzed. 0 by default
+  vtkSetMacro(AnalysisThresholdPercent, double);
+  /// Get analysis threshold in percent of the reference dose
+  vtkGetMacro(AnalysisThresholdPercent, double);
+
+  /// Set maximum gamma value. The gamma values are capped at this value, which limits the search radius. 2 by default
+  vtkSetMacro(MaximumGamma, double);
+  /// Get maximum gamma value
+  vtkGetMacro(MaximumGamma, double);
+
+  /// Set flag determining whether only the pass fractions and histograms are computed, without output gamma values.
+  /// The search stops at the first gamma value of at most 1, so it is faster. Off by default
+  vtkSetMacro(PassFractionOnly, bool);
+  /// Get flag determining whether only the pass fractions and histograms are computed
+  vtkGetMacro(PassFractionOnly, bool);
+  /// Set flag determining whether only the pass fractions and histograms are computed
+  vtkBooleanMacro(PassFractionOnly, bool);
+
+  /// Set width of the histogram bins above gamma 1. 0.1 by default
+  vtkSetMacro(HistogramBinWidth, double);
+  /// Get width of the histogram bins above gamma 1
+  vtkGetMacro(HistogramBinWidth, double);
+
+  /// Get reference dose used in the last execution (Gy)
+  vtkGetMacro(UsedReferenceDoseGy, double);
+  /// Get number of voxels analyzed in the last execution
+  vtkGetMacro(NumberOfAnalyzedVoxels, vtkIdType);
+  /// Get number of analyzed voxels with gamma value at most 1 for the given criterion in the last execution
+  vtkIdType GetNumberOfPassedVoxels(int criterionIndex=0);
+  /// Get percentage of the analyzed voxels with gamma value at most 1 for the given criterion in the last execution
+  double GetPassFractionPercent(int criterionIndex=0);
+  /// Get percentage of passed voxels for each criterion in the last execution
+  void GetPassFractionsPercent(vtkDoubleArray* passFractionsPercent);
+  /// Get number of histogram bins: the passed bin and the bins above gamma 1
+  int GetNumberOfHistogramBins();
+  /// Get histogram of the gamma values of the analyzed voxels for the given criterion in the last execution.
+  /// Bin 0 contains the voxels with gamma <= 1, bin i > 0 the voxels with gamma in (1 + (i-1)*width, 1 + i*width]
+  void GetGammaHistogram(vtkDoubleArray* histogram, int criterionIndex=0);
+
+  /// Get fraction of the output rows computed in the current or last execution (between 0 and 1).
+  /// Can be called from any thread
+  double GetComputedFraction();
+  /// Request the execution to stop as soon as possible. Can be called from any thread. The results of a
+  /// canceled execution are incomplete. The request is kept for the next executions until ResetCancel is called
+  void Cancel();
+  /// Clear the cancel request
+  void ResetCancel();
+  /// Get whether the execution has been requested to stop
+  bool GetCanceled();
+
+protected:
+  /// The mask input is optional
+  int FillInputPortInformation(int port, vtkInformation* info) override;
+
+  /// Set float output scalar type in the pipeline information
+  int RequestInformation(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector) override;
+
+  /// The evaluated dose and the mask are needed in the whole extent, as the search extends beyond the output extent
+  int RequestUpdateExtent(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector) override;
+
+  /// Validate the inputs and compute the search offsets before splitting the work between threads
+  int RequestData(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector) override;
+
+  /// No scalars are allocated for the output if only the pass fractions are computed
+  void AllocateOutputData(vtkImageData* output, vtkInformation* outInfo, int* uExtent) override;
+
+  /// Execute function computing the gamma values in the given extent of the output image
+  void ThreadedRequestData(vtkInformation* request, vtkInformationVector** inputVector, vtkInformationVector* outputVector,
+    vtkImageData*** inData, vtkImageData** outData, int outExt[6], int threadId) override;
+
+protected:
+  /// Distance to agreement tolerance (mm)
+  double DtaDistanceToleranceMm;
+
+  /// Dose difference tolerance in percent of the reference dose
+  double DoseDifferenceTolerancePercent;
+
+  /// Reference dose (Gy). If not positive, then the maximum of the reference dose image is used
+  double ReferenceDoseGy;
+
+  /// Analysis threshold in percent of the reference dose
+  double AnalysisThresholdPercent;
+
+  /// Maximum gamma value
+  double MaximumGamma;
+
+  /// Flag determining whether only the pass fractions and histograms are computed
+  bool PassFractionOnly;
+
+  /// Width of the histogram bins above gamma 1
+  double HistogramBinWidth;
+
+  /// Criteria added by AddCriterion
+  std::vector<std::pair<double, double> > Criteria;
+
+  /// Results of the last execution
+  double UsedReferenceDoseGy;
+  vtkIdType NumberOfAnalyzedVoxels;
+  std::vector<vtkIdType> NumberOfPassedVoxels;
+  /// Histogram bin counts of each criterion (criterion index * number of bins + bin index)
+  std::vector<vtkIdType> GammaHistograms;
+  /// Protects the results when the threads add their counts
+  std::mutex ResultsMutex;
+
+  /// Number of output rows in the current execution and number of rows computed so far
+  std::atomic<vtkIdType> NumberOfRows;
+  std::atomic<vtkIdType> NumberOfComputedRows;
+  /// Flag set by Cancel, checked by the threads before each row
+  std::atomic<bool> CancelRequested;
+
+  /// Criteria with prepared tolerances. Only valid during execution
+  std::vector<Criterion> ExecutionCriteria;
+  /// Evaluated voxels to search, sorted by distance. Only valid during execution
+  std::vector<SearchOffset> SearchOffsets;
+  /// Largest search offset along each axis (voxels). Only valid during execution
+  int SearchRadiusVoxels[3];
+
+protected:
+  vtkComputeGammaDoseDifference();
+  virtual ~vtkComputeGammaDoseDifference();
+
+private:
+  vtkComputeGammaDoseDifference(const vtkComputeGammaDoseDifference&); // Not implemented
+  void operator=(const vtkComputeGammaDoseDifference&);               // Not implemented
+};
+
+#endif
@@ -18,15 +18,29 @@
 // GelDosimetryAnalysisAlgo Logic includes
 #include "vtkSlicerGelDosimetryAnalysisAlgoModuleLogic.h"
 #include "vtkApplyPolynomialFunctionOnVolume.h"
+#include "vtkComputeGammaDoseDifference.h"
 
 // VTK includes
 #include <vtkSmartPointer.h>
 #include <vtkImageData.h>
 #include <vtkDoubleArray.h>
 #include <vtkObjectFactory.h>
+#include <vtkPointData.h>
+#include <vtkMatrix4x4.h>
+#include <vtkImageReslice.h>
+#include <vtkImageThreshold.h>
+#include <vtkImageExtractComponents.h>
+#include <vtkImageClip.h>
+#include <vtkImageConstantPad.h>
+#include <vtkCollection.h>
 
 // MRML includes
 #include <vtkMRMLScalarVolumeNode.h>
+#include <vtkMRMLTransformNode.h>
+
+// STD includes
+#include <algorithm>
+#include <cmath>
 
 //----------------------------------------------------------------------------
 vtkStandardNewMacro(vtkSlicerGelDosimetryAnalysisAlgoModuleLogic);
@@ -34,11 +48,24 @@ vtkStandardNewMacro(vtkSlicerGelDosimetryAnalysisAlgoModuleLogic);
 //----------------------------------------------------------------------------
 vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::vtkSlicerGelDosimetryAnalysisAlgoModuleLogic()
 {
+  this->NumberOfThreads = 0;
+  this->CalibrationMethod = vtkApplyPolynomialFunctionOnVolume::CalibrationMethodAutomatic;
+  this->GammaPassFractionPercent = 0.0;
+  this->NumberOfGammaVoxelsAnalyzed = 0;
+  this->GammaReferenceDoseGy = 0.0;
+  this->CropGammaToMask = true;
+  this->BackgroundGammaRunning = false;
+  this->BackgroundGammaSucceeded = false;
 }
 
 //----------------------------------------------------------------------------
 vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::~vtkSlicerGelDosimetryAnalysisAlgoModuleLogic()
 {
+  if (this->BackgroundGammaThread.joinable())
+  {
+    this->BackgroundGammaFilter->Cancel();
+    this->BackgroundGammaThread.join();
+  }
 }
 
 //---------------------------------------------------------------------------
@@ -51,7 +78,8 @@ void vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::UpdateFromMRMLScene()
 }
 
 //---------------------------------------------------------------------------
-bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ApplyPolynomialFunctionOnVolume(vtkMRMLScalarVolumeNode* volumeNode, vtkDoubleArray* polynomialCoefficients)
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ApplyPolynomialFunctionOnVolume(vtkMRMLScalarVolumeNode* volumeNode, vtkDoubleArray* polynomialCoefficients,
+  vtkMRMLScalarVolumeNode* outputVolumeNode/*=nullptr*/, int outputScalarType/*=-1*/)
 {
   if (!volumeNode || !volumeNode->GetImageData())
   {
@@ -64,16 +92,589 @@ bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ApplyPolynomialFunctionOnVolu
     return false;
   }
 
+  bool inPlace = (outputVolumeNode == nullptr || outputVolumeNode == volumeNode);
+
   vtkSmartPointer<vtkApplyPolynomialFunctionOnVolume> calibrator = vtkSmartPointer<vtkApplyPolynomialFunctionOnVolume>::New();
   calibrator->SetInputData(volumeNode->GetImageData());
+  calibrator->SetInPlace(inPlace);
+  calibrator->SetOutputScalarType(outputScalarType);
+  calibrator->SetCalibrationMethod(this->CalibrationMethod);
   calibrator->SetPolynomialCoefficients(polynomialCoefficients);
+  if (this->NumberOfThreads > 0)
+  {
+    // The SMP backend does not honor the number of threads, use the multithreader instead
+    calibrator->EnableSMPOff();
+    calibrator->SetNumberOfThreads(this->NumberOfThreads);
+  }
   calibrator->Update();
 
+  if (inPlace && calibrator->GetOutput()->GetPointData()->GetScalars() == volumeNode->GetImageData()->GetPointData()->GetScalars())
+  {
+    // The filter has overwritten the voxels of the input image data
+    volumeNode->GetImageData()->Modified();
+    volumeNode->Modified();
+    return true;
+  }
+
+  // Take over the buffer allocated by the filter without copying it
   vtkSmartPointer<vtkImageData> newImageData = vtkSmartPointer<vtkImageData>::New();
-  newImageData->DeepCopy(calibrator->GetOutput());
+  newImageData->ShallowCopy(calibrator->GetOutput());
+
+  vtkMRMLScalarVolumeNode* calibratedVolumeNode = (inPlace ? volumeNode : outputVolumeNode);
+  calibratedVolumeNode->SetAndObserveImageData(newImageData);
+  calibratedVolumeNode->Modified();
+
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ComputeGammaDoseDifference(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+  vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode/*=nullptr*/,
+  double dtaDistanceToleranceMm/*=3.0*/, double doseDifferenceTolerancePercent/*=3.0*/, double referenceDoseGy/*=0.0*/,
+  double analysisThresholdPercent/*=0.0*/, double maximumGamma/*=2.0*/)
+{
+  this->GammaPassFractionPercent = 0.0;
+  this->NumberOfGammaVoxelsAnalyzed = 0;
+  this->GammaReferenceDoseGy = 0.0;
+
+  if (!gammaVolumeNode)
+  {
+    vtkErrorMacro("ComputeGammaDoseDifference: Invalid gamma volume!");
+    return false;
+  }
+
+  // Runs in the calling thread, independently of any background computation
+  vtkSmartPointer<vtkComputeGammaDoseDifference> gammaFilter = vtkSmartPointer<vtkComputeGammaDoseDifference>::New();
+  gammaFilter->SetDtaDistanceToleranceMm(dtaDistanceToleranceMm);
+  gammaFilter->SetDoseDifferenceTolerancePercent(doseDifferenceTolerancePercent);
+  gammaFilter->SetReferenceDoseGy(referenceDoseGy);
+  gammaFilter->SetAnalysisThresholdPercent(analysisThresholdPercent);
+  gammaFilter->SetMaximumGamma(maximumGamma);
+  vtkSmartPointer<vtkImageData> gammaImageData = vtkSmartPointer<vtkImageData>::New();
+  if (!this->RunGammaFilter(gammaFilter, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode, gammaImageData))
+  {
+    return false;
+  }
+
+  this->GammaPassFractionPercent = gammaFilter->GetPassFractionPercent();
+  this->NumberOfGammaVoxelsAnalyzed = gammaFilter->GetNumberOfAnalyzedVoxels();
+  this->GammaReferenceDoseGy = gammaFilter->GetUsedReferenceDoseGy();
+  this->SetGammaVolumeImageData(gammaVolumeNode, gammaImageData, referenceDoseVolumeNode);
+
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::StartGammaDoseDifference(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+  vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode/*=nullptr*/,
+  double dtaDistanceToleranceMm/*=3.0*/, double doseDifferenceTolerancePercent/*=3.0*/, double referenceDoseGy/*=0.0*/,
+  double analysisThresholdPercent/*=0.0*/, double maximumGamma/*=2.0*/)
+{
+  this->GammaPassFractionPercent = 0.0;
+  this->NumberOfGammaVoxelsAnalyzed = 0;
+  this->GammaReferenceDoseGy = 0.0;
+
+  if (this->BackgroundGammaThread.joinable())
+  {
+    vtkErrorMacro("StartGammaDoseDifference: A gamma computation has already been started, it needs to be finished first!");
+    return false;
+  }
+  if (!gammaVolumeNode)
+  {
+    vtkErrorMacro("StartGammaDoseDifference: Invalid gamma volume!");
+    return false;
+  }
+
+  vtkSmartPointer<vtkComputeGammaDoseDifference> gammaFilter = vtkSmartPointer<vtkComputeGammaDoseDifference>::New();
+  gammaFilter->SetDtaDistanceToleranceMm(dtaDistanceToleranceMm);
+  gammaFilter->SetDoseDifferenceTolerancePercent(doseDifferenceTolerancePercent);
+  gammaFilter->SetReferenceDoseGy(referenceDoseGy);
+  gammaFilter->SetAnalysisThresholdPercent(analysisThresholdPercent);
+  gammaFilter->SetMaximumGamma(maximumGamma);
+  if (!this->SetGammaFilterInputs(gammaFilter, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode, true))
+  {
+    return false;
+  }
+
+  // The filter inputs share no data objects or voxels with the volume nodes, so it can be updated while the main thread runs
+  this->BackgroundGammaFilter = gammaFilter;
+  this->BackgroundGammaReferenceDoseVolumeNode = referenceDoseVolumeNode;
+  this->BackgroundGammaVolumeNode = gammaVolumeNode;
+  this->BackgroundGammaSucceeded = false;
+  this->BackgroundGammaRunning = true;
+  this->BackgroundGammaThread = std::thread([this, gammaFilter]()
+  {
+    this->BackgroundGammaSucceeded = this->UpdateGammaFilter(gammaFilter);
+    this->BackgroundGammaRunning = false;
+  });
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::IsGammaDoseDifferenceRunning()
+{
+  return this->BackgroundGammaRunning;
+}
+
+//---------------------------------------------------------------------------
+double vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::GetGammaDoseDifferenceProgress()
+{
+  return (this->BackgroundGammaFilter ? this->BackgroundGammaFilter->GetComputedFraction() : 0.0);
+}
 
-  volumeNode->SetAndObserveImageData(newImageData);
-  volumeNode->Modified();
+//---------------------------------------------------------------------------
+void vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::CancelGammaDoseDifference()
+{
+  if (this->BackgroundGammaFilter)
+  {
+    this->BackgroundGammaFilter->Cancel();
+  }
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::FinishGammaDoseDifference()
+{
+  if (!this->BackgroundGammaThread.joinable())
+  {
+    vtkErrorMacro("FinishGammaDoseDifference: No gamma computation has been started!");
+    return false;
+  }
+  this->BackgroundGammaThread.join();
+  vtkSmartPointer<vtkComputeGammaDoseDifference> gammaFilter = this->BackgroundGammaFilter;
+  this->BackgroundGammaFilter = nullptr;
+
+  // The results are also discarded if the computation was canceled after the filter had finished,
+  // so that the gamma volume is never modified after a cancel request
+  if (!this->BackgroundGammaSucceeded || gammaFilter->GetCanceled())
+  {
+    return false;
+  }
+  vtkMRMLScalarVolumeNode* referenceDoseVolumeNode = this->BackgroundGammaReferenceDoseVolumeNode;
+  vtkMRMLScalarVolumeNode* gammaVolumeNode = this->BackgroundGammaVolumeNode;
+  if (!referenceDoseVolumeNode || !referenceDoseVolumeNode->GetImageData() || !gammaVolumeNode)
+  {
+    vtkErrorMacro("FinishGammaDoseDifference: Reference dose or gamma volume has been removed during the computation!");
+    return false;
+  }
+
+  this->GammaPassFractionPercent = gammaFilter->GetPassFractionPercent();
+  this->NumberOfGammaVoxelsAnalyzed = gammaFilter->GetNumberOfAnalyzedVoxels();
+  this->GammaReferenceDoseGy = gammaFilter->GetUsedReferenceDoseGy();
+
+  vtkSmartPointer<vtkImageData> gammaImageData = vtkSmartPointer<vtkImageData>::New();
+  this->GetGammaFilterOutput(gammaFilter, referenceDoseVolumeNode, gammaImageData);
+  this->SetGammaVolumeImageData(gammaVolumeNode, gammaImageData, referenceDoseVolumeNode);
+
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ComputeGammaDoseDifferenceSweep(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+  vtkDoubleArray* criteria, vtkDoubleArray* passFractionsPercent, vtkCollection* gammaVolumeNodes/*=nullptr*/,
+  vtkMRMLScalarVolumeNode* maskVolumeNode/*=nullptr*/, double referenceDoseGy/*=0.0*/,
+  double analysisThresholdPercent/*=0.0*/, double maximumGamma/*=2.0*/)
+{
+  this->GammaPassFractionPercent = 0.0;
+  this->NumberOfGammaVoxelsAnalyzed = 0;
+  this->GammaReferenceDoseGy = 0.0;
+
+  if (!criteria || criteria->GetNumberOfComponents() != 2 || criteria->GetNumberOfTuples() == 0)
+  {
+    vtkErrorMacro("ComputeGammaDoseDifferenceSweep: Criteria need to be given as (DTA mm, dose difference %) tuples!");
+    return false;
+  }
+  if (!passFractionsPercent)
+  {
+    vtkErrorMacro("ComputeGammaDoseDifferenceSweep: Invalid pass fractions array!");
+    return false;
+  }
+  // Pass fractions of a previous sweep are not returned if this one fails
+  passFractionsPercent->SetNumberOfTuples(0);
+  if (gammaVolumeNodes && gammaVolumeNodes->GetNumberOfItems() != criteria->GetNumberOfTuples())
+  {
+    vtkErrorMacro("ComputeGammaDoseDifferenceSweep: Number of gamma volumes (" << gammaVolumeNodes->GetNumberOfItems()
+      << ") differs from the number of criteria (" << criteria->GetNumberOfTuples() << ")!");
+    return false;
+  }
+
+  vtkSmartPointer<vtkComputeGammaDoseDifference> gammaFilter = vtkSmartPointer<vtkComputeGammaDoseDifference>::New();
+  for (vtkIdType criterionIndex = 0; criterionIndex < criteria->GetNumberOfTuples(); ++criterionIndex)
+  {
+    gammaFilter->AddCriterion(criteria->GetComponent(criterionIndex, 0), criteria->GetComponent(criterionIndex, 1));
+  }
+  gammaFilter->SetReferenceDoseGy(referenceDoseGy);
+  gammaFilter->SetAnalysisThresholdPercent(analysisThresholdPercent);
+  gammaFilter->SetMaximumGamma(maximumGamma);
+  vtkSmartPointer<vtkImageData> gammaImageData = (gammaVolumeNodes ? vtkSmartPointer<vtkImageData>::New() : nullptr);
+  if (!this->RunGammaFilter(gammaFilter, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode, gammaImageData))
+  {
+    return false;
+  }
+
+  gammaFilter->GetPassFractionsPercent(passFractionsPercent);
+  this->NumberOfGammaVoxelsAnalyzed = gammaFilter->GetNumberOfAnalyzedVoxels();
+  this->GammaReferenceDoseGy = gammaFilter->GetUsedReferenceDoseGy();
+  this->GammaPassFractionPercent = gammaFilter->GetPassFractionPercent(0);
+
+  // Each criterion is a component of the filter output
+  if (gammaVolumeNodes)
+  {
+    for (int criterionIndex = 0; criterionIndex < gammaVolumeNodes->GetNumberOfItems(); ++criterionIndex)
+    {
+      vtkMRMLScalarVolumeNode* gammaVolumeNode = vtkMRMLScalarVolumeNode::SafeDownCast(gammaVolumeNodes->GetItemAsObject(criterionIndex));
+      if (!gammaVolumeNode)
+      {
+        vtkErrorMacro("ComputeGammaDoseDifferenceSweep: Invalid gamma volume for criterion " << criterionIndex << "!");
+        return false;
+      }
+      vtkSmartPointer<vtkImageExtractComponents> extractComponent = vtkSmartPointer<vtkImageExtractComponents>::New();
+      extractComponent->SetInputData(gammaImageData);
+      extractComponent->SetComponents(criterionIndex);
+      extractComponent->Update();
+      vtkSmartPointer<vtkImageData> criterionGammaImageData = vtkSmartPointer<vtkImageData>::New();
+      criterionGammaImageData->ShallowCopy(extractComponent->GetOutput());
+      this->SetGammaVolumeImageData(gammaVolumeNode, criterionGammaImageData, referenceDoseVolumeNode);
+    }
+  }
 
   return true;
 }
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::ComputeGammaPassFraction(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+  vtkMRMLScalarVolumeNode* maskVolumeNode/*=nullptr*/, double dtaDistanceToleranceMm/*=3.0*/, double doseDifferenceTolerancePercent/*=3.0*/,
+  double referenceDoseGy/*=0.0*/, double analysisThresholdPercent/*=0.0*/, double maximumGamma/*=2.0*/,
+  vtkDoubleArray* gammaHistogram/*=nullptr*/, double histogramBinWidth/*=0.1*/)
+{
+  this->GammaPassFractionPercent = 0.0;
+  this->NumberOfGammaVoxelsAnalyzed = 0;
+  this->GammaReferenceDoseGy = 0.0;
+
+  vtkSmartPointer<vtkComputeGammaDoseDifference> gammaFilter = vtkSmartPointer<vtkComputeGammaDoseDifference>::New();
+  gammaFilter->PassFractionOnlyOn();
+  gammaFilter->SetHistogramBinWidth(histogramBinWidth);
+  gammaFilter->SetDtaDistanceToleranceMm(dtaDistanceToleranceMm);
+  gammaFilter->SetDoseDifferenceTolerancePercent(doseDifferenceTolerancePercent);
+  gammaFilter->SetReferenceDoseGy(referenceDoseGy);
+  gammaFilter->SetAnalysisThresholdPercent(analysisThresholdPercent);
+  gammaFilter->SetMaximumGamma(maximumGamma);
+  if (!this->RunGammaFilter(gammaFilter, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode))
+  {
+    return false;
+  }
+
+  this->GammaPassFractionPercent = gammaFilter->GetPassFractionPercent();
+  this->NumberOfGammaVoxelsAnalyzed = gammaFilter->GetNumberOfAnalyzedVoxels();
+  this->GammaReferenceDoseGy = gammaFilter->GetUsedReferenceDoseGy();
+  if (gammaHistogram)
+  {
+    gammaFilter->GetGammaHistogram(gammaHistogram);
+  }
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::RunGammaFilter(vtkComputeGammaDoseDifference* gammaFilter,
+  vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode,
+  vtkImageData* gammaImageData/*=nullptr*/)
+{
+  if ( !this->SetGammaFilterInputs(gammaFilter, referenceDoseVolumeNode, evaluatedDoseVolumeNode, maskVolumeNode)
+    || !this->UpdateGammaFilter(gammaFilter) )
+  {
+    return false;
+  }
+  if (gammaImageData && !gammaFilter->GetPassFractionOnly())
+  {
+    this->GetGammaFilterOutput(gammaFilter, referenceDoseVolumeNode, gammaImageData);
+  }
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::SetGammaFilterInputs(vtkComputeGammaDoseDifference* gammaFilter,
+  vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode,
+  bool copyInputs/*=false*/)
+{
+  if ( !referenceDoseVolumeNode || !referenceDoseVolumeNode->GetImageData()
+    || !evaluatedDoseVolumeNode || !evaluatedDoseVolumeNode->GetImageData() )
+  {
+    vtkErrorMacro("SetGammaFilterInputs: Invalid reference or evaluated dose volume!");
+    return false;
+  }
+  if (maskVolumeNode && !maskVolumeNode->GetImageData())
+  {
+    vtkErrorMacro("SetGammaFilterInputs: Invalid mask volume!");
+    return false;
+  }
+
+  // The mask is resampled first, as its bounding box determines the extent to compute
+  vtkSmartPointer<vtkImageData> maskImageData;
+  if (maskVolumeNode)
+  {
+    vtkSmartPointer<vtkImageData> labelImageData = this->GetImageDataResampledToReference(maskVolumeNode, referenceDoseVolumeNode, true);
+    if (!labelImageData)
+    {
+      return false;
+    }
+    // The filter needs an unsigned char mask, any non-zero label is inside
+    vtkSmartPointer<vtkImageThreshold> maskThreshold = vtkSmartPointer<vtkImageThreshold>::New();
+    maskThreshold->SetInputData(labelImageData);
+    maskThreshold->ThresholdBetween(0, 0);
+    maskThreshold->SetInValue(0);
+    maskThreshold->SetOutValue(1);
+    maskThreshold->SetOutputScalarTypeToUnsignedChar();
+    maskThreshold->Update();
+    maskImageData = maskThreshold->GetOutput();
+  }
+
+  // The image data of volume nodes has unit spacing, the filter needs the physical spacing for the distances
+  vtkSmartPointer<vtkImageData> referenceImageData = vtkSmartPointer<vtkImageData>::New();
+  referenceImageData->ShallowCopy(referenceDoseVolumeNode->GetImageData());
+  referenceImageData->SetSpacing(referenceDoseVolumeNode->GetSpacing());
+
+  // Voxels outside the mask are not analyzed, and evaluated voxels farther than the search radius from the mask
+  // do not affect the analyzed voxels, so only the mask bounding box extended by the search radius is computed
+  int referenceExtent[6] = {0,0,0,0,0,0};
+  referenceImageData->GetExtent(referenceExtent);
+  int computedExtent[6] = {0,0,0,0,0,0};
+  std::copy(referenceExtent, referenceExtent + 6, computedExtent);
+  if ( maskImageData && this->CropGammaToMask
+    && this->GetMaskCropExtent(maskImageData, referenceDoseVolumeNode->GetSpacing(), gammaFilter->GetSearchRadiusMm(), computedExtent)
+    && !std::equal(computedExtent, computedExtent + 6, referenceExtent) )
+  {
+    // The reference dose is the maximum of the whole reference dose volume, not only of the cropped region
+    if (gammaFilter->GetReferenceDoseGy() <= 0.0)
+    {
+      double referenceRange[2] = {0.0, 0.0};
+      referenceImageData->GetScalarRange(referenceRange);
+      gammaFilter->SetReferenceDoseGy(referenceRange[1]);
+    }
+
+    vtkSmartPointer<vtkImageClip> referenceClip = vtkSmartPointer<vtkImageClip>::New();
+    referenceClip->SetInputData(referenceImageData);
+    referenceClip->SetOutputWholeExtent(computedExtent);
+    referenceClip->ClipDataOn();
+    referenceClip->Update();
+    referenceImageData = referenceClip->GetOutput();
+
+    vtkSmartPointer<vtkImageClip> maskClip = vtkSmartPointer<vtkImageClip>::New();
+    maskClip->SetInputData(maskImageData);
+    maskClip->SetOutputWholeExtent(computedExtent);
+    maskClip->ClipDataOn();
+    maskClip->Update();
+    maskImageData = maskClip->GetOutput();
+  }
+
+  vtkSmartPointer<vtkImageData> resampledEvaluatedImageData = this->GetImageDataResampledToReference(
+    evaluatedDoseVolumeNode, referenceDoseVolumeNode, false, computedExtent);
+  if (!resampledEvaluatedImageData)
+  {
+    return false;
+  }
+  // The filter does not share data objects with the volume nodes
+  vtkSmartPointer<vtkImageData> evaluatedImageData = vtkSmartPointer<vtkImageData>::New();
+  evaluatedImageData->ShallowCopy(resampledEvaluatedImageData);
+
+  // The uncropped reference and the not resampled evaluated image still share the voxels with the volume nodes.
+  // The resampled and cropped images (including the mask) have their own voxels
+  if (copyInputs)
+  {
+    if (referenceImageData->GetPointData()->GetScalars() == referenceDoseVolumeNode->GetImageData()->GetPointData()->GetScalars())
+    {
+      vtkSmartPointer<vtkImageData> referenceImageDataCopy = vtkSmartPointer<vtkImageData>::New();
+      referenceImageDataCopy->DeepCopy(referenceImageData);
+      referenceImageData = referenceImageDataCopy;
+    }
+    if (evaluatedImageData->GetPointData()->GetScalars() == evaluatedDoseVolumeNode->GetImageData()->GetPointData()->GetScalars())
+    {
+      vtkSmartPointer<vtkImageData> evaluatedImageDataCopy = vtkSmartPointer<vtkImageData>::New();
+      evaluatedImageDataCopy->DeepCopy(evaluatedImageData);
+      evaluatedImageData = evaluatedImageDataCopy;
+    }
+  }
+
+  gammaFilter->SetReferenceDoseData(referenceImageData);
+  gammaFilter->SetEvaluatedDoseData(evaluatedImageData);
+  gammaFilter->SetMaskData(maskImageData);
+  if (this->NumberOfThreads > 0)
+  {
+    // The SMP backend does not honor the number of threads, use the multithreader instead
+    gammaFilter->EnableSMPOff();
+    gammaFilter->SetNumberOfThreads(this->NumberOfThreads);
+  }
+  return true;
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::UpdateGammaFilter(vtkComputeGammaDoseDifference* gammaFilter)
+{
+  gammaFilter->Update();
+  if (gammaFilter->GetCanceled())
+  {
+    vtkDebugMacro("UpdateGammaFilter: Gamma dose difference computation canceled");
+    return false;
+  }
+  if (gammaFilter->GetErrorCode() != 0 || (!gammaFilter->GetPassFractionOnly() && !gammaFilter->GetOutput()->GetPointData()->GetScalars()))
+  {
+    vtkErrorMacro("UpdateGammaFilter: Failed to compute gamma dose difference!");
+    return false;
+  }
+  return true;
+}
+
+//---------------------------------------------------------------------------
+void vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::GetGammaFilterOutput(vtkComputeGammaDoseDifference* gammaFilter,
+  vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkImageData* gammaImageData)
+{
+  int referenceExtent[6] = {0,0,0,0,0,0};
+  referenceDoseVolumeNode->GetImageData()->GetExtent(referenceExtent);
+  if (std::equal(referenceExtent, referenceExtent + 6, gammaFilter->GetOutput()->GetExtent()))
+  {
+    gammaImageData->ShallowCopy(gammaFilter->GetOutput());
+    return;
+  }
+
+  // The inputs were cropped to the mask. Voxels outside the computed extent are outside the mask,
+  // so their gamma value is 0 as without cropping
+  vtkSmartPointer<vtkImageConstantPad> gammaPad = vtkSmartPointer<vtkImageConstantPad>::New();
+  gammaPad->SetInputData(gammaFilter->GetOutput());
+  gammaPad->SetOutputWholeExtent(referenceExtent);
+  gammaPad->SetConstant(0.0);
+  gammaPad->Update();
+  gammaImageData->ShallowCopy(gammaPad->GetOutput());
+}
+
+//---------------------------------------------------------------------------
+bool vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::GetMaskCropExtent(vtkImageData* maskImageData, double spacing[3], double marginMm, int cropExtent[6])
+{
+  if (!maskImageData || maskImageData->GetScalarType() != VTK_UNSIGNED_CHAR || maskImageData->GetNumberOfScalarComponents() != 1)
+  {
+    vtkErrorMacro("GetMaskCropExtent: Mask needs to be a single component unsigned char image!");
+    return false;
+  }
+
+  int maskExtent[6] = {0,0,0,0,0,0};
+  maskImageData->GetExtent(maskExtent);
+  int boundingBox[6] = {VTK_INT_MAX, VTK_INT_MIN, VTK_INT_MAX, VTK_INT_MIN, VTK_INT_MAX, VTK_INT_MIN};
+  unsigned char* maskPtr = static_cast<unsigned char*>(maskImageData->GetScalarPointer());
+  for (int k = maskExtent[4]; k <= maskExtent[5]; ++k)
+  {
+    for (int j = maskExtent[2]; j <= maskExtent[3]; ++j)
+    {
+      for (int i = maskExtent[0]; i <= maskExtent[1]; ++i, ++maskPtr)
+      {
+        if (*maskPtr)
+        {
+          boundingBox[0] = std::min(boundingBox[0], i);
+          boundingBox[1] = std::max(boundingBox[1], i);
+          boundingBox[2] = std::min(boundingBox[2], j);
+          boundingBox[3] = std::max(boundingBox[3], j);
+          boundingBox[4] = std::min(boundingBox[4], k);
+          boundingBox[5] = std::max(boundingBox[5], k);
+        }
+      }
+    }
+  }
+  if (boundingBox[0] > boundingBox[1])
+  {
+    return false;
+  }
+
+  for (int axis = 0; axis < 3; ++axis)
+  {
+    int marginVoxels = static_cast<int>(std::ceil(marginMm / std::fabs(spacing[axis])));
+    cropExtent[2*axis] = std::max(maskExtent[2*axis], boundingBox[2*axis] - marginVoxels);
+    cropExtent[2*axis+1] = std::min(maskExtent[2*axis+1], boundingBox[2*axis+1] + marginVoxels);
+  }
+  return true;
+}
+
+//---------------------------------------------------------------------------
+void vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::SetGammaVolumeImageData(vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkImageData* gammaImageData,
+  vtkMRMLScalarVolumeNode* referenceDoseVolumeNode)
+{
+  // The geometry is stored in the volume node
+  gammaImageData->SetSpacing(1.0, 1.0, 1.0);
+  gammaVolumeNode->SetAndObserveImageData(gammaImageData);
+  gammaVolumeNode->CopyOrientation(referenceDoseVolumeNode);
+  gammaVolumeNode->SetAndObserveTransformNodeID(referenceDoseVolumeNode->GetTransformNodeID());
+  gammaVolumeNode->Modified();
+}
+
+//---------------------------------------------------------------------------
+vtkSmartPointer<vtkImageData> vtkSlicerGelDosimetryAnalysisAlgoModuleLogic::GetImageDataResampledToReference(vtkMRMLScalarVolumeNode* volumeNode,
+  vtkMRMLScalarVolumeNode* referenceVolumeNode, bool nearestNeighbor, int* outputExtent/*=nullptr*/)
+{
+  // Reference IJK to volume IJK: reference IJK to RAS, between the parent transforms, then RAS to volume IJK
+  vtkSmartPointer<vtkMatrix4x4> referenceIjkToRas = vtkSmartPointer<vtkMatrix4x4>::New();
+  referenceVolumeNode->GetIJKToRASMatrix(referenceIjkToRas);
+  vtkSmartPointer<vtkMatrix4x4> referenceToVolumeTransform = vtkSmartPointer<vtkMatrix4x4>::New();
+  if (!vtkMRMLTransformNode::GetMatrixTransformBetweenNodes(
+    referenceVolumeNode->GetParentTransformNode(), volumeNode->GetParentTransformNode(), referenceToVolumeTransform))
+  {
+    vtkErrorMacro("GetImageDataResampledToReference: Non-linear transform between " << volumeNode->GetName()
+      << " and " << referenceVolumeNode->GetName() << " is not supported!");
+    return nullptr;
+  }
+  vtkSmartPointer<vtkMatrix4x4> volumeRasToIjk = vtkSmartPointer<vtkMatrix4x4>::New();
+  volumeNode->GetRASToIJKMatrix(volumeRasToIjk);
+
+  vtkSmartPointer<vtkMatrix4x4> referenceIjkToVolumeRas = vtkSmartPointer<vtkMatrix4x4>::New();
+  vtkMatrix4x4::Multiply4x4(referenceToVolumeTransform, referenceIjkToRas, referenceIjkToVolumeRas);
+  vtkSmartPointer<vtkMatrix4x4> referenceIjkToVolumeIjk = vtkSmartPointer<vtkMatrix4x4>::New();
+  vtkMatrix4x4::Multiply4x4(volumeRasToIjk, referenceIjkToVolumeRas, referenceIjkToVolumeIjk);
+
+  int referenceExtent[6] = {0,0,0,0,0,0};
+  int volumeExtent[6] = {0,0,0,0,0,0};
+  referenceVolumeNode->GetImageData()->GetExtent(referenceExtent);
+  volumeNode->GetImageData()->GetExtent(volumeExtent);
+  bool sameGeometry = true;
+  for (int i = 0; i < 6; ++i)
+  {
+    sameGeometry = sameGeometry && (referenceExtent[i] == volumeExtent[i]);
+  }
+  for (int row = 0; row < 4; ++row)
+  {
+    for (int column = 0; column < 4; ++column)
+    {
+      double identityElement = (row == column ? 1.0 : 0.0);
+      sameGeometry = sameGeometry && (std::fabs(referenceIjkToVolumeIjk->GetElement(row, column) - identityElement) < 1e-6);
+    }
+  }
+  if (sameGeometry && (!outputExtent || std::equal(outputExtent, outputExtent + 6, referenceExtent)))
+  {
+    return volumeNode->GetImageData();
+  }
+  if (sameGeometry)
+  {
+    vtkSmartPointer<vtkImageClip> clip = vtkSmartPointer<vtkImageClip>::New();
+    clip->SetInputData(volumeNode->GetImageData());
+    clip->SetOutputWholeExtent(outputExtent);
+    clip->ClipDataOn();
+    clip->Update();
+    return clip->GetOutput();
+  }
+
+  vtkSmartPointer<vtkImageReslice> reslice = vtkSmartPointer<vtkImageReslice>::New();
+  reslice->SetInputData(volumeNode->GetImageData());
+  reslice->SetResliceAxes(referenceIjkToVolumeIjk);
+  reslice->SetOutputExtent(outputExtent ? outputExtent : referenceExtent);
+  reslice->SetOutputOrigin(0.0, 0.0, 0.0);
+  reslice->SetOutputSpacing(1.0, 1.0, 1.0);
+  if (nearestNeighbor)
+  {
+    reslice->SetInterpolationModeToNearestNeighbor();
+  }
+  else
+  {
+    reslice->SetInterpolationModeToLinear();
+  }
+  reslice->SetBackgroundLevel(0.0);
+  if (this->NumberOfThreads > 0)
+  {
+    reslice->EnableSMPOff();
+    reslice->SetNumberOfThreads(this->NumberOfThreads);
+  }
+  reslice->Update();
+  return reslice->GetOutput();
+}
@@ -29,8 +29,19 @@
 // GelDosimetryAnalysisAlgo Module Logic
 #include "vtkSlicerGelDosimetryAnalysisAlgoModuleLogicExport.h"
 
+// VTK includes
+#include <vtkSmartPointer.h>
+#include <vtkWeakPointer.h>
+
+// STD includes
+#include <atomic>
+#include <thread>
+
 class vtkMRMLScalarVolumeNode;
 class vtkDoubleArray;
+class vtkImageData;
+class vtkCollection;
+class vtkComputeGammaDoseDifference;
 
 class VTK_SLICER_GELDOSIMETRYANALYSISALGO_MODULE_LOGIC_EXPORT vtkSlicerGelDosimetryAnalysisAlgoModuleLogic : public vtkSlicerModuleLogic
 {
@@ -39,16 +50,161 @@ public:
   static vtkSlicerGelDosimetryAnalysisAlgoModuleLogic* New();
   vtkTypeMacro(vtkSlicerGelDosimetryAnalysisAlgoModuleLogic, vtkSlicerModuleLogic);
 
-  /// Apply polynomial function on volume. The input volume's image data will be overwritten
+  /// Apply polynomial function on volume.
+  /// If output volume is not specified (or it is the input volume), then the input volume's voxels are
+  /// calibrated in place without allocating a new buffer. Otherwise the calibrated values are written
+  /// into a newly allocated buffer that is set as the output volume's image data.
+  /// \param outputScalarType Scalar type of the calibrated image. If -1 (default), then it is float for
+  ///   integer inputs and the input scalar type otherwise. In-place calibration is only possible if the
+  ///   output scalar type matches the input scalar type, otherwise a new buffer is allocated.
+  /// \return Success flag
+  bool ApplyPolynomialFunctionOnVolume(vtkMRMLScalarVolumeNode* volumeNode, vtkDoubleArray* polynomialCoefficients,
+    vtkMRMLScalarVolumeNode* outputVolumeNode=nullptr, int outputScalarType=-1);
+
+  /// Compute gamma dose difference of the evaluated dose volume compared to the reference dose volume,
+  /// see vtkComputeGammaDoseDifference. The evaluated dose and mask volumes are resampled on the reference
+  /// dose volume geometry (taking their parent transforms into account) if their geometries differ.
+  /// The gamma volume gets the reference dose volume geometry and parent transform.
+  /// The results are available using GetGammaPassFractionPercent and related functions.
+  /// \param maskVolumeNode Labelmap volume, only the voxels where it is non-zero are analyzed. Optional
+  /// \param referenceDoseGy Reference dose for the dose difference tolerance and the analysis threshold.
+  ///   If not positive, then the maximum of the reference dose volume is used
   /// \return Success flag
-  bool ApplyPolynomialFunctionOnVolume(vtkMRMLScalarVolumeNode* volumeNode, vtkDoubleArray* polynomialCoefficients);
+  bool ComputeGammaDoseDifference(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+    vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode=nullptr,
+    double dtaDistanceToleranceMm=3.0, double doseDifferenceTolerancePercent=3.0, double referenceDoseGy=0.0,
+    double analysisThresholdPercent=0.0, double maximumGamma=2.0);
+
+  /// Compute gamma dose difference for multiple criteria in a single pass over the voxel neighborhoods,
+  /// see ComputeGammaDoseDifference. The search radius is given by the largest DTA of the criteria.
+  /// \param criteria Array of 2-component tuples: DTA (mm), dose difference tolerance (%)
+  /// \param passFractionsPercent Output array, filled with the pass fraction of each criterion
+  /// \param gammaVolumeNodes Collection of scalar volume nodes receiving the gamma volume of each criterion. Optional
+  /// \return Success flag
+  bool ComputeGammaDoseDifferenceSweep(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+    vtkDoubleArray* criteria, vtkDoubleArray* passFractionsPercent, vtkCollection* gammaVolumeNodes=nullptr,
+    vtkMRMLScalarVolumeNode* maskVolumeNode=nullptr, double referenceDoseGy=0.0,
+    double analysisThresholdPercent=0.0, double maximumGamma=2.0);
+
+  /// Compute only the gamma pass fraction and histogram, without creating a gamma volume.
+  /// The search of a voxel stops as soon as a gamma value of at most 1 is found, which makes it fast enough for
+  /// interactive updates. The pass fraction is available using GetGammaPassFractionPercent.
+  /// \param gammaHistogram Output histogram, see vtkComputeGammaDoseDifference::GetGammaHistogram. Optional
+  /// \param histogramBinWidth Width of the histogram bins above gamma 1
+  /// \return Success flag
+  bool ComputeGammaPassFraction(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+    vtkMRMLScalarVolumeNode* maskVolumeNode=nullptr, double dtaDistanceToleranceMm=3.0, double doseDifferenceTolerancePercent=3.0,
+    double referenceDoseGy=0.0, double analysisThresholdPercent=0.0, double maximumGamma=2.0,
+    vtkDoubleArray* gammaHistogram=nullptr, double histogramBinWidth=0.1);
+
+  /// Start computing the gamma dose difference in a background thread and return immediately, see ComputeGammaDoseDifference.
+  /// The inputs are resampled and copied in the calling thread, only the gamma filter runs in the background, so the
+  /// input volumes may be modified meanwhile. ComputeGammaDoseDifference can also be used meanwhile. The gamma volume is
+  /// not modified until FinishGammaDoseDifference is called, so the computation can be canceled without side effects.
+  /// \return Success flag of starting the computation. Fails if a background computation is already running
+  bool StartGammaDoseDifference(vtkMRMLScalarVolumeNode* referenceDoseVolumeNode, vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode,
+    vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode=nullptr,
+    double dtaDistanceToleranceMm=3.0, double doseDifferenceTolerancePercent=3.0, double referenceDoseGy=0.0,
+    double analysisThresholdPercent=0.0, double maximumGamma=2.0);
+  /// Get whether the background gamma computation is still running. FinishGammaDoseDifference does not block if not
+  bool IsGammaDoseDifferenceRunning();
+  /// Get fraction of the background gamma computation done (between 0 and 1)
+  double GetGammaDoseDifferenceProgress();
+  /// Request the background gamma computation to stop. FinishGammaDoseDifference then discards the partial results
+  void CancelGammaDoseDifference();
+  /// Wait for the background gamma computation to finish, and set the gamma volume and the results.
+  /// Needs to be called in the main thread, as it modifies the gamma volume node.
+  /// \return Success flag. False if the computation failed or has been canceled, then the gamma volume is not modified
+  bool FinishGammaDoseDifference();
+
+  /// Get percentage of the analyzed voxels passing the last gamma computation (first criterion of a sweep)
+  vtkGetMacro(GammaPassFractionPercent, double);
+  /// Get number of voxels analyzed in the last gamma computation
+  vtkGetMacro(NumberOfGammaVoxelsAnalyzed, vtkIdType);
+  /// Get reference dose used in the last gamma computation (Gy)
+  vtkGetMacro(GammaReferenceDoseGy, double);
+
+  /// Set number of threads used when applying the polynomial function and computing gamma.
+  /// If 0 (default), then the thread count and SMP backend of the filter are used.
+  vtkSetClampMacro(NumberOfThreads, int, 0, VTK_INT_MAX);
+  /// Get number of threads used when applying the polynomial function and computing gamma
+  vtkGetMacro(NumberOfThreads, int);
+
+  /// Set calibration method used when applying the polynomial function.
+  /// Automatic by default, see vtkApplyPolynomialFunctionOnVolume::CalibrationMethodAutomatic
+  vtkSetMacro(CalibrationMethod, int);
+  /// Get calibration method used when applying the polynomial function
+  vtkGetMacro(CalibrationMethod, int);
+
+  /// Set flag determining whether the gamma computation is restricted to the bounding box of the mask (extended by
+  /// the DTA search radius). The results are the same, but the runtime scales with the mask size. On by default
+  vtkSetMacro(CropGammaToMask, bool);
+  /// Get flag determining whether the gamma computation is restricted to the bounding box of the mask
+  vtkGetMacro(CropGammaToMask, bool);
+  /// Set flag determining whether the gamma computation is restricted to the bounding box of the mask
+  vtkBooleanMacro(CropGammaToMask, bool);
 
 protected:
   vtkSlicerGelDosimetryAnalysisAlgoModuleLogic();
   virtual ~vtkSlicerGelDosimetryAnalysisAlgoModuleLogic();
 
   void UpdateFromMRMLScene() override;
-  
+
+  /// Get image data of the volume resampled on the voxel grid of the reference volume, taking the parent
+  /// transforms into account. Returns the original image data if the geometries match, nullptr on failure
+  /// \param outputExtent Extent of the reference voxel grid to resample. If nullptr, then the whole reference extent
+  vtkSmartPointer<vtkImageData> GetImageDataResampledToReference(vtkMRMLScalarVolumeNode* volumeNode,
+    vtkMRMLScalarVolumeNode* referenceVolumeNode, bool nearestNeighbor, int* outputExtent=nullptr);
+
+  /// Set up the inputs of the gamma filter from the volumes (resampled on the reference dose geometry) and run it.
+  /// If CropGammaToMask is on, then the inputs are cropped to the mask bounding box extended by the search radius
+  /// of the filter, and the output is padded back to the reference extent with zeros.
+  /// \param gammaImageData Output gamma image on the whole reference extent. Optional
+  bool RunGammaFilter(vtkComputeGammaDoseDifference* gammaFilter, vtkMRMLScalarVolumeNode* referenceDoseVolumeNode,
+    vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode, vtkImageData* gammaImageData=nullptr);
+
+  /// Set the inputs of the gamma filter, resampled on the reference dose geometry and cropped to the mask, see RunGammaFilter
+  /// \param copyInputs Copy the voxels that the inputs would otherwise share with the volume nodes. Needed if the filter
+  ///   is updated in a background thread, as the volumes may be modified in the main thread meanwhile
+  bool SetGammaFilterInputs(vtkComputeGammaDoseDifference* gammaFilter, vtkMRMLScalarVolumeNode* referenceDoseVolumeNode,
+    vtkMRMLScalarVolumeNode* evaluatedDoseVolumeNode, vtkMRMLScalarVolumeNode* maskVolumeNode, bool copyInputs=false);
+  /// Update the gamma filter. Does not access MRML nodes, so it can run in a background thread
+  bool UpdateGammaFilter(vtkComputeGammaDoseDifference* gammaFilter);
+  /// Get gamma image of the filter, padded to the extent of the reference dose volume if the inputs were cropped
+  void GetGammaFilterOutput(vtkComputeGammaDoseDifference* gammaFilter, vtkMRMLScalarVolumeNode* referenceDoseVolumeNode,
+    vtkImageData* gammaImageData);
+
+  /// Get extent of the non-zero voxels of the mask, extended by the margin and clipped to the extent of the mask
+  /// \return False if the mask has no non-zero voxels
+  bool GetMaskCropExtent(vtkImageData* maskImageData, double spacing[3], double marginMm, int cropExtent[6]);
+
+  /// Set gamma image as image data of the gamma volume, with the geometry and parent transform of the reference dose volume
+  void SetGammaVolumeImageData(vtkMRMLScalarVolumeNode* gammaVolumeNode, vtkImageData* gammaImageData,
+    vtkMRMLScalarVolumeNode* referenceDoseVolumeNode);
+
+protected:
+  /// Number of threads used when applying the polynomial function and computing gamma (0 means default)
+  int NumberOfThreads;
+
+  /// Calibration method (polynomial evaluation or lookup table) used when applying the polynomial function
+  int CalibrationMethod;
+
+  /// Flag determining whether the gamma computation is restricted to the bounding box of the mask
+  bool CropGammaToMask;
+
+  /// Background gamma computation (see StartGammaDoseDifference)
+  vtkSmartPointer<vtkComputeGammaDoseDifference> BackgroundGammaFilter;
+  vtkWeakPointer<vtkMRMLScalarVolumeNode> BackgroundGammaReferenceDoseVolumeNode;
+  vtkWeakPointer<vtkMRMLScalarVolumeNode> BackgroundGammaVolumeNode;
+  std::thread BackgroundGammaThread;
+  std::atomic<bool> BackgroundGammaRunning;
+  bool BackgroundGammaSucceeded;
+
+  /// Results of the last gamma computation
+  double GammaPassFractionPercent;
+  vtkIdType NumberOfGammaVoxelsAnalyzed;
+  double GammaReferenceDoseGy;
+
 private:
   vtkSlicerGelDosimetryAnalysisAlgoModuleLogic(const vtkSlicerGelDosimetryAnalysisAlgoModuleLogic&); // Not implemented
   void operator=(const vtkSlicerGelDosimetryAnalysisAlgoModuleLogic&);            // Not implemented